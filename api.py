@@ -1,111 +1,382 @@
+import base64
+import binascii
+import csv
+import io
+import json
 import logging
-from flask import jsonify, request, Blueprint
+from flask import jsonify, request, Blueprint, Response, stream_with_context
 from flask_login import login_required
-from models import Attendance, Student, Course
+from models import Attendance, Student, Course, Fingerprint, student_course
 from extensions import db
 from datetime import datetime
-from utils import json_response
+from sqlalchemy import func, tuple_, and_
+from sqlalchemy.exc import IntegrityError
+from attendance_manager import AttendanceManager
+from fingerprint_index import fingerprint_index
+from template_matcher import template_matcher
+from course_catalog import course_catalog
+from device_registry import device_registry
+from roster_changes import get_changes, MAX_CHANGES
+from attendance_dedupe import attendance_dedupe, add_attendance, epoch_seconds
+from wire_format import (
+    BINARY_MIMETYPE, SCHEMA, WireFormatError, decode_verify_request, encode_verify_response,
+    decode_attendance_request, encode_attendance_response, decode_scan_request, encode_scan_response,
+    decode_attendance_batch_request, encode_attendance_batch_response, encode_error
+)
+from utils import json_response, get_cursor_params, encode_cursor, decode_cursor
 
 logger = logging.getLogger(__name__)
 
 # Blueprint for API routes
 api = Blueprint('api', __name__)
 
+attendance_manager = AttendanceManager()
+
+# Valid attendance statuses accepted from devices
+ATTENDANCE_STATUSES = ('present', 'late', 'absent')
+
+# Upper bound on records accepted by a single batch upload
+MAX_BATCH_SIZE = 500
+
+# Number of rows fetched per round trip when streaming exports
+EXPORT_CHUNK_SIZE = 1000
+
+def wants_binary():
+    """Check whether the client prefers the binary wire format over JSON (JSON wins ties)"""
+    return request.accept_mimetypes.best_match(['application/json', BINARY_MIMETYPE]) == BINARY_MIMETYPE
+
+def get_device_payload(decoder):
+    """
+    Get the request payload, decoding the binary wire format if it was sent
+    
+    Args:
+        decoder: wire_format function decoding this endpoint's request message
+        
+    Returns:
+        dict: Payload in the shape of the JSON request
+        
+    Raises:
+        WireFormatError: If a binary body does not match its layout
+    """
+    if request.mimetype == BINARY_MIMETYPE:
+        return decoder(request.get_data())
+    return request.get_json()
+
+def get_sensor_device_id(data):
+    """
+    Get the sensor whose template slots a request's fingerprint IDs refer to
+    
+    Every sensor numbers its own slots. A request names its sensor with
+    'device_id'; otherwise the registered device calling from the request's
+    address is assumed, and failing that the default sensor.
+    
+    Args:
+        data (dict): Request payload
+        
+    Returns:
+        int: Database ID of the device, or None for the default sensor
+        
+    Raises:
+        ValueError: If 'device_id' is not a number
+    """
+    device_id = data.get('device_id')
+    if device_id not in (None, ''):
+        # 0 is how binary clients without a registered device say "default sensor"
+        return int(device_id) or None
+    device = device_registry.resolve_address(request.remote_addr)
+    return device.id if device else None
+
+def device_response(data, status_code=200, encoder=None):
+    """
+    Create a response in the format the device negotiated
+    
+    Args:
+        data (dict): JSON response body
+        status_code (int): HTTP status code
+        encoder: wire_format function encoding a successful body in binary
+        
+    Returns:
+        Response: Binary when the client prefers it (errors as error messages), else JSON
+    """
+    if encoder is not None and wants_binary():
+        if status_code >= 400:
+            body = encode_error(status_code, data.get('error'))
+        else:
+            body = encoder(data)
+        response = Response(body, status=status_code, mimetype=BINARY_MIMETYPE)
+    else:
+        response = json_response(data, status_code)
+    response.vary.add('Accept')
+    return response
+
+def parse_attendance_timestamp(value):
+    """
+    Parse an attendance timestamp sent by a device
+    
+    Accepts ISO 8601 strings, '%Y-%m-%d %H:%M:%S' strings and Unix epoch
+    seconds (the firmware stores time_t values in its offline buffer).
+    
+    Args:
+        value: Raw timestamp value from the request payload
+        
+    Returns:
+        datetime: Parsed timestamp, or the current UTC time if missing/invalid
+    """
+    if not value:
+        return datetime.utcnow()
+    
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return datetime.utcfromtimestamp(value)
+        except (ValueError, OverflowError, OSError):
+            return datetime.utcnow()
+    
+    try:
+        # Try ISO format first
+        return datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        try:
+            # Try other common formats
+            return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+        except (ValueError, TypeError):
+            # Default to current time
+            return datetime.utcnow()
+
+def normalize_attendance_status(value):
+    """Return a valid attendance status, defaulting to 'present'"""
+    return value if value in ATTENDANCE_STATUSES else 'present'
+
+def attendance_detail_query():
+    """
+    Build a query for attendance rows together with their student and course
+    
+    Student and course columns are fetched through joins so listing records
+    costs a single round trip regardless of how many rows are returned.
+    
+    Returns:
+        Query: Query yielding rows suitable for serialize_attendance_row()
+    """
+    return (db.session.query(
+                Attendance.id,
+                Attendance.timestamp,
+                Attendance.status,
+                Attendance.synced,
+                Student.id.label('student_db_id'),
+                Student.student_id,
+                Student.first_name,
+                Student.last_name,
+                Course.id.label('course_db_id'),
+                Course.course_code,
+                Course.title)
+            .join(Student, Attendance.student_id == Student.id)
+            .join(Course, Attendance.course_id == Course.id))
+
+def serialize_attendance_row(row):
+    """Format a row from attendance_detail_query() for API output"""
+    return {
+        'id': row.id,
+        'student': {
+            'id': row.student_db_id,
+            'student_id': row.student_id,
+            'name': f"{row.first_name} {row.last_name}"
+        },
+        'course': {
+            'id': row.course_db_id,
+            'code': row.course_code,
+            'title': row.title
+        },
+        'timestamp': row.timestamp.isoformat(),
+        'status': row.status,
+        'synced': row.synced
+    }
+
+def filter_attendance_query(query, args):
+    """
+    Apply the standard attendance filters from request arguments
+    
+    Supported arguments are start_date and end_date (YYYY-MM-DD), course_id
+    and student_id (database ID or student ID string).
+    
+    Args:
+        query (Query): Query over Attendance to filter
+        args: Request arguments (e.g. request.args)
+        
+    Returns:
+        tuple: (query, None) on success, or (None, Response) with an error response
+    """
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    course_id = args.get('course_id')
+    student_id = args.get('student_id')
+    
+    if start_date:
+        try:
+            start = datetime.strptime(start_date, '%Y-%m-%d')
+            query = query.filter(Attendance.timestamp >= start)
+        except ValueError:
+            return None, json_response({"error": "Invalid start_date format"}, 400)
+    
+    if end_date:
+        try:
+            end = datetime.strptime(end_date, '%Y-%m-%d')
+            end = datetime.combine(end.date(), datetime.max.time())
+            query = query.filter(Attendance.timestamp <= end)
+        except ValueError:
+            return None, json_response({"error": "Invalid end_date format"}, 400)
+    
+    if course_id:
+        query = query.filter(Attendance.course_id == course_id)
+    
+    if student_id:
+        # This could be a student database ID or student ID string
+        try:
+            # Try to parse as integer (database ID)
+            query = query.filter(Attendance.student_id == int(student_id))
+        except ValueError:
+            # If not an integer, try to find by student ID string
+            student = Student.query.filter_by(student_id=student_id).first()
+            if student:
+                query = query.filter(Attendance.student_id == student.id)
+            else:
+                return None, json_response({"error": "Student not found"}, 404)
+    
+    return query, None
+
 @api.route('/attendance', methods=['GET'])
 def get_attendance():
-    """API endpoint to get attendance records"""
+    """
+    API endpoint to get attendance records
+    
+    Records are returned newest first in pages of at most `limit` rows.
+    Pagination is keyset-based on (timestamp, id): pass the `next_cursor`
+    from a response as `cursor` to fetch the following page.
+    """
     try:
-        # Get query parameters
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        course_id = request.args.get('course_id')
-        student_id = request.args.get('student_id')
-        
-        # Build query
-        query = Attendance.query
-        
-        if start_date:
-            try:
-                start = datetime.strptime(start_date, '%Y-%m-%d')
-                query = query.filter(Attendance.timestamp >= start)
-            except ValueError:
-                return json_response({"error": "Invalid start_date format"}, 400)
-        
-        if end_date:
-            try:
-                end = datetime.strptime(end_date, '%Y-%m-%d')
-                end = datetime.combine(end.date(), datetime.max.time())
-                query = query.filter(Attendance.timestamp <= end)
-            except ValueError:
-                return json_response({"error": "Invalid end_date format"}, 400)
-        
-        if course_id:
-            query = query.filter(Attendance.course_id == course_id)
-        
-        if student_id:
-            # This could be a student database ID or student ID string
-            try:
-                # Try to parse as integer (database ID)
-                query = query.filter(Attendance.student_id == int(student_id))
-            except ValueError:
-                # If not an integer, try to find by student ID string
-                student = Student.query.filter_by(student_id=student_id).first()
-                if student:
-                    query = query.filter(Attendance.student_id == student.id)
-                else:
-                    return json_response({"error": "Student not found"}, 404)
-        
-        # Execute query and format results
-        attendance_records = query.order_by(Attendance.timestamp.desc()).all()
-        
-        # Format attendance records
-        results = []
-        for record in attendance_records:
-            student = Student.query.get(record.student_id)
-            course = Course.query.get(record.course_id)
-            
-            results.append({
-                'id': record.id,
-                'student': {
-                    'id': student.id,
-                    'student_id': student.student_id,
-                    'name': f"{student.first_name} {student.last_name}"
-                },
-                'course': {
-                    'id': course.id,
-                    'code': course.course_code,
-                    'title': course.title
-                },
-                'timestamp': record.timestamp.isoformat(),
-                'status': record.status,
-                'synced': record.synced
-            })
+        cursor, limit = get_cursor_params(request)
+        
+        # Build query (student and course columns come from the same joined query)
+        query, error = filter_attendance_query(attendance_detail_query(), request.args)
+        if error:
+            return error
+        
+        # Continue after the last row of the previous page
+        if cursor:
+            position = decode_cursor(cursor)
+            if not position:
+                return json_response({"error": "Invalid cursor"}, 400)
+            query = query.filter(tuple_(Attendance.timestamp, Attendance.id) < position)
+        
+        # Fetch one extra row to find out whether another page exists
+        rows = (query.order_by(Attendance.timestamp.desc(), Attendance.id.desc())
+                .limit(limit + 1)
+                .all())
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        results = [serialize_attendance_row(row) for row in rows]
+        
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id) if has_more else None
         
         return jsonify({
             'success': True,
             'count': len(results),
-            'records': results
+            'records': results,
+            'pagination': {
+                'limit': limit,
+                'has_more': has_more,
+                'next_cursor': next_cursor
+            }
         })
         
     except Exception as e:
         logger.error(f"Error fetching attendance records: {str(e)}")
         return json_response({"error": "Internal server error"}, 500)
 
+@api.route('/attendance/export', methods=['GET'])
+def export_attendance():
+    """
+    API endpoint to stream attendance records as NDJSON or CSV
+    
+    Accepts the same filters as GET /attendance plus format=ndjson|csv.
+    Rows are read in chunks from a server-side cursor and written out as
+    they arrive, so memory use does not depend on the number of records.
+    """
+    try:
+        export_format = request.args.get('format', 'ndjson').lower()
+        if export_format not in ('ndjson', 'csv'):
+            return json_response({"error": "Invalid format (expected ndjson or csv)"}, 400)
+        
+        query, error = filter_attendance_query(attendance_detail_query(), request.args)
+        if error:
+            return error
+        
+        query = (query.order_by(Attendance.timestamp.desc(), Attendance.id.desc())
+                 .yield_per(EXPORT_CHUNK_SIZE))
+        
+        if export_format == 'csv':
+            body = generate_attendance_csv(query)
+            mimetype = 'text/csv'
+        else:
+            body = (json.dumps(serialize_attendance_row(row)) + '\n' for row in query)
+            mimetype = 'application/x-ndjson'
+        
+        filename = f"attendance_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{export_format}"
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+        
+    except Exception as e:
+        logger.error(f"Error exporting attendance records: {str(e)}")
+        return json_response({"error": "Internal server error"}, 500)
+
+def generate_attendance_csv(rows):
+    """
+    Yield CSV lines for attendance rows, starting with a header
+    
+    Args:
+        rows: Iterable of rows from attendance_detail_query()
+        
+    Yields:
+        str: One CSV-formatted line at a time
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return line
+    
+    writer.writerow(['id', 'timestamp', 'status', 'synced', 'student_db_id', 'student_id',
+                     'student_name', 'course_id', 'course_code', 'course_title'])
+    yield flush()
+    
+    for row in rows:
+        writer.writerow([row.id, row.timestamp.isoformat(), row.status, row.synced,
+                         row.student_db_id, row.student_id, f"{row.first_name} {row.last_name}",
+                         row.course_db_id, row.course_code, row.title])
+        yield flush()
+
 @api.route('/attendance', methods=['POST'])
 def record_attendance():
-    """API endpoint to record attendance from IoT device"""
+    """API endpoint to record attendance from IoT device (JSON or binary wire format)"""
     try:
-        data = request.get_json()
+        try:
+            data = get_device_payload(decode_attendance_request)
+        except WireFormatError as e:
+            return device_response({"error": f"Invalid binary message: {str(e)}"}, 400, encode_attendance_response)
         
         if not data:
-            return json_response({"error": "No data provided"}, 400)
+            return device_response({"error": "No data provided"}, 400, encode_attendance_response)
         
         # For Arduino, we only require student_id and course_id
         # timestamp and status are optional with defaults
         required_fields = ['student_id', 'course_id']
         for field in required_fields:
             if field not in data:
-                return json_response({"error": f"Missing required field: {field}"}, 400)
+                return device_response({"error": f"Missing required field: {field}"}, 400, encode_attendance_response)
         
         # Find student by database ID or student_id string
         student = None
@@ -124,44 +395,30 @@ def record_attendance():
             student = Student.query.filter_by(student_id=str(student_id_value)).first()
         
         if not student:
-            return json_response({"error": "Student not found", "student_id": str(student_id_value)}, 404)
+            return device_response({"error": "Student not found", "student_id": str(student_id_value)}, 404, encode_attendance_response)
         
         # Find course
         course = Course.query.get(data['course_id'])
         if not course:
-            return json_response({"error": "Course not found", "course_id": str(data['course_id'])}, 404)
+            return device_response({"error": "Course not found", "course_id": str(data['course_id'])}, 404, encode_attendance_response)
             
         # Check if student is enrolled in the course
         if course not in student.courses:
-            return json_response({
+            return device_response({
                 "error": "Student is not enrolled in this course",
                 "student_id": str(student_id_value),
                 "course_id": str(data['course_id']),
                 "student_name": f"{student.first_name} {student.last_name}",
                 "course_name": course.title
-            }, 403)
+            }, 403, encode_attendance_response)
             
-        # Get timestamp (default to current time if not provided)
-        if 'timestamp' in data and data['timestamp']:
-            try:
-                # Try ISO format first
-                timestamp = datetime.fromisoformat(data['timestamp'])
-            except (ValueError, TypeError):
-                try:
-                    # Try other common formats
-                    timestamp = datetime.strptime(data['timestamp'], '%Y-%m-%d %H:%M:%S')
-                except (ValueError, TypeError):
-                    # Default to current time
-                    timestamp = datetime.utcnow()
-        else:
-            timestamp = datetime.utcnow()
+        # Get timestamp and status (defaults: current time, 'present')
+        timestamp = parse_attendance_timestamp(data.get('timestamp'))
+        status = normalize_attendance_status(data.get('status'))
         
-        # Get status (default to 'present' if not provided)
-        status = data.get('status', 'present')
-        if status not in ['present', 'late', 'absent']:
-            status = 'present'  # Default to present for invalid status
+        name = f"{student.first_name} {student.last_name}"
         
-        # Create attendance record
+        # Create attendance record (a repeat scan within the dedupe window is not written)
         attendance = Attendance(
             student_id=student.id,
             course_id=course.id,
@@ -169,20 +426,257 @@ def record_attendance():
             status=status,
             synced=True  # This is coming from an API, so it's already synced
         )
+        attendance_id, duplicate = add_attendance(attendance)
         
-        db.session.add(attendance)
-        db.session.commit()
-        
-        return jsonify({
+        return device_response({
             'success': True,
-            'attendance_id': attendance.id,
-            'message': f'Attendance recorded for {student.first_name} {student.last_name}'
-        })
+            'attendance_id': attendance_id,
+            'duplicate': duplicate,
+            'message': f'Attendance already recorded for {name}' if duplicate else f'Attendance recorded for {name}'
+        }, 200, encode_attendance_response)
         
     except Exception as e:
         logger.error(f"Error recording attendance: {str(e)}")
         db.session.rollback()
-        return json_response({"error": "Internal server error"}, 500)
+        return device_response({"error": "Internal server error"}, 500, encode_attendance_response)
+
+@api.route('/attendance/batch', methods=['POST'])
+def record_attendance_batch():
+    """
+    API endpoint to record many attendance entries in one request
+    
+    Used by IoT devices to replay their offline buffer after reconnecting.
+    Accepts either a JSON list of records or {"records": [...]}, optionally
+    with the 'device_id' of the sensor that buffered them. Each record
+    takes the same fields as POST /attendance, and may identify the student
+    by 'fingerprint_id' (a slot of that sensor, see get_sensor_device_id())
+    instead of 'student_id'. Students, courses and
+    enrollments are resolved with set-based queries and all valid records
+    are inserted in a single transaction. Records repeating a scan already
+    recorded in the same dedupe window succeed with 'duplicate': true and
+    the first record's ID, without a write. Speaks JSON or the binary wire
+    format.
+    """
+    try:
+        try:
+            data = get_device_payload(decode_attendance_batch_request)
+        except WireFormatError as e:
+            return device_response({"error": f"Invalid binary message: {str(e)}"}, 400, encode_attendance_batch_response)
+        
+        try:
+            device_id = get_sensor_device_id(data if isinstance(data, dict) else {})
+        except (ValueError, TypeError):
+            return device_response({"error": "Invalid device_id"}, 400, encode_attendance_batch_response)
+        
+        if isinstance(data, dict):
+            data = data.get('records')
+        
+        if not data or not isinstance(data, list):
+            return device_response({"error": "No records provided"}, 400, encode_attendance_batch_response)
+        
+        if len(data) > MAX_BATCH_SIZE:
+            return device_response({
+                "error": f"Too many records in batch (maximum {MAX_BATCH_SIZE})"
+            }, 413, encode_attendance_batch_response)
+        
+        # Collect every identifier referenced by the batch
+        student_db_ids = set()
+        student_codes = set()
+        finger_ids = set()
+        course_ids = set()
+        
+        for record in data:
+            if not isinstance(record, dict):
+                continue
+            
+            if record.get('student_id') is not None:
+                try:
+                    student_db_ids.add(int(record['student_id']))
+                except (ValueError, TypeError):
+                    pass
+                student_codes.add(str(record['student_id']))
+            elif record.get('fingerprint_id') is not None:
+                try:
+                    finger_ids.add(int(record['fingerprint_id']))
+                except (ValueError, TypeError):
+                    pass
+            
+            try:
+                course_ids.add(int(record.get('course_id')))
+            except (ValueError, TypeError):
+                pass
+        
+        # Resolve the sensor's slots to student database IDs
+        finger_map = {}
+        if finger_ids:
+            rows = (db.session.query(Fingerprint.finger_id, Fingerprint.student_id)
+                    .filter(Fingerprint.finger_id.in_(finger_ids),
+                            Fingerprint.device_id.is_(None) if device_id is None
+                            else Fingerprint.device_id == device_id)
+                    .order_by(Fingerprint.id)
+                    .all())
+            for finger_id, student_db_id in rows:
+                finger_map.setdefault(finger_id, student_db_id)
+            student_db_ids.update(finger_map.values())
+        
+        # Resolve students by database ID or student_id string
+        students_by_id = {}
+        students_by_code = {}
+        if student_db_ids or student_codes:
+            rows = (db.session.query(Student.id, Student.student_id,
+                                     Student.first_name, Student.last_name)
+                    .filter(db.or_(Student.id.in_(student_db_ids),
+                                   Student.student_id.in_(student_codes)))
+                    .all())
+            for row in rows:
+                students_by_id[row.id] = row
+                students_by_code[row.student_id] = row
+        
+        # Resolve courses
+        courses_by_id = {}
+        if course_ids:
+            rows = (db.session.query(Course.id, Course.title)
+                    .filter(Course.id.in_(course_ids))
+                    .all())
+            courses_by_id = {row.id: row for row in rows}
+        
+        # Check enrollment for every (student, course) pair in one query
+        enrolled = set()
+        if students_by_id and courses_by_id:
+            rows = (db.session.query(student_course.c.student_id, student_course.c.course_id)
+                    .filter(student_course.c.student_id.in_(students_by_id.keys()),
+                            student_course.c.course_id.in_(courses_by_id.keys()))
+                    .all())
+            enrolled = {(row[0], row[1]) for row in rows}
+        
+        # Validate each record and build attendance rows
+        results = []
+        pending = []
+        
+        for index, record in enumerate(data):
+            if not isinstance(record, dict):
+                results.append({'index': index, 'success': False, 'error': "Invalid record"})
+                continue
+            
+            if record.get('course_id') is None:
+                results.append({'index': index, 'success': False,
+                                'error': "Missing required field: course_id"})
+                continue
+            
+            student = None
+            if record.get('student_id') is not None:
+                student_id_value = record['student_id']
+                try:
+                    student = students_by_id.get(int(student_id_value))
+                except (ValueError, TypeError):
+                    pass
+                if not student:
+                    student = students_by_code.get(str(student_id_value))
+            elif record.get('fingerprint_id') is not None:
+                try:
+                    student = students_by_id.get(finger_map.get(int(record['fingerprint_id'])))
+                except (ValueError, TypeError):
+                    pass
+            else:
+                results.append({'index': index, 'success': False,
+                                'error': "Missing required field: student_id"})
+                continue
+            
+            if not student:
+                results.append({'index': index, 'success': False, 'error': "Student not found"})
+                continue
+            
+            try:
+                course = courses_by_id.get(int(record['course_id']))
+            except (ValueError, TypeError):
+                course = None
+            
+            if not course:
+                results.append({'index': index, 'success': False, 'error': "Course not found",
+                                'course_id': str(record['course_id'])})
+                continue
+            
+            if (student.id, course.id) not in enrolled:
+                results.append({'index': index, 'success': False,
+                                'error': "Student is not enrolled in this course",
+                                'student_name': f"{student.first_name} {student.last_name}",
+                                'course_name': course.title})
+                continue
+            
+            attendance = Attendance(
+                student_id=student.id,
+                course_id=course.id,
+                timestamp=parse_attendance_timestamp(record.get('timestamp')),
+                status=normalize_attendance_status(record.get('status')),
+                synced=True  # This is coming from an API, so it's already synced
+            )
+            key = attendance_dedupe.key(student.id, course.id, attendance.timestamp)
+            if key is not None:
+                attendance.dedupe_slot = key[2]
+            results.append({'index': index, 'success': True, 'duplicate': False,
+                            'attendance': attendance, 'key': key})
+        
+        # Scans recorded before (checked in one query) or repeated within the batch are not written
+        keys = {result['key'] for result in results if result.get('key') is not None}
+        recorded = attendance_dedupe.find_recorded(keys) if keys else {}
+        first_in_batch = {}
+        for result in results:
+            key = result.pop('key', None)
+            if 'attendance' not in result:
+                continue
+            attendance = result['attendance']
+            if key is None:
+                pending.append(attendance)
+                continue
+            attendance_id = attendance_dedupe.match(key, attendance.timestamp, recorded)
+            repeated = attendance_dedupe.match(key, attendance.timestamp, first_in_batch)
+            if attendance_id is not None:
+                del result['attendance']
+                result['attendance_id'] = attendance_id
+                result['duplicate'] = True
+            elif repeated is not None:
+                result['attendance'] = repeated
+                result['duplicate'] = True
+            else:
+                first_in_batch[key] = (attendance, epoch_seconds(attendance.timestamp))
+                pending.append(attendance)
+        
+        # Insert all new records in a single transaction
+        if pending:
+            db.session.add_all(pending)
+            try:
+                db.session.flush()
+            except IntegrityError:
+                # Another worker recorded some of these scans meanwhile; a retry answers them as duplicates
+                db.session.rollback()
+                return device_response({"error": "Conflicting attendance recorded concurrently, retry the batch"},
+                                       409, encode_attendance_batch_response)
+        
+        # Read generated IDs before commit expires the instances
+        for result in results:
+            if 'attendance' in result:
+                result['attendance_id'] = result.pop('attendance').id
+        new_ids = {key: (attendance.id, attendance.timestamp) for key, (attendance, _) in first_in_batch.items()}
+        
+        if pending:
+            db.session.commit()
+        for key, (attendance_id, timestamp) in new_ids.items():
+            attendance_dedupe.add(key, attendance_id, timestamp)
+        
+        succeeded = sum(1 for result in results if result['success'])
+        return device_response({
+            'success': True,
+            'count': len(results),
+            'recorded': len(pending),
+            'duplicates': succeeded - len(pending),
+            'failed': len(results) - succeeded,
+            'results': results
+        }, 200, encode_attendance_batch_response)
+        
+    except Exception as e:
+        logger.error(f"Error recording attendance batch: {str(e)}")
+        db.session.rollback()
+        return device_response({"error": "Internal server error"}, 500, encode_attendance_batch_response)
 
 @api.route('/students', methods=['GET'])
 def get_students():
@@ -212,28 +706,55 @@ def get_students():
 
 @api.route('/courses', methods=['GET'])
 def get_courses():
-    """API endpoint to get course list (accessible to IoT devices)"""
+    """API endpoint to get course list (accessible to IoT devices)
+    
+    Served from the cached catalog snapshot, as JSON or in the binary wire
+    format. Devices that send the ETag of the catalog they already have
+    get 304 Not Modified.
+    """
     try:
-        courses = Course.query.all()
-        
-        results = []
-        for course in courses:
-            results.append({
-                'id': course.id,
-                'code': course.course_code,
-                'title': course.title,
-                'description': course.description,
-                'student_count': course.students.count()
-            })
+        snapshot = course_catalog.get_snapshot()
         
-        return jsonify({
-            'success': True,
-            'count': len(results),
-            'courses': results
-        })
+        if wants_binary():
+            response = Response(snapshot.binary, mimetype=BINARY_MIMETYPE)
+            response.set_etag(f"{snapshot.version}-bin")
+        else:
+            response = Response(snapshot.body, mimetype='application/json')
+            response.set_etag(snapshot.version)
+        response.vary.add('Accept')
+        # Clients may keep the catalog but must revalidate it on every use
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
         
     except Exception as e:
         logger.error(f"Error fetching courses: {str(e)}")
+        return device_response({"error": "Internal server error"}, 500, encode_error)
+
+@api.route('/wire-schema', methods=['GET'])
+def get_wire_schema():
+    """API endpoint publishing the layouts of the binary wire format"""
+    return jsonify(SCHEMA)
+
+@api.route('/changes', methods=['GET'])
+def get_roster_changes():
+    """API endpoint to get roster changes since a version (accessible to IoT devices)
+    
+    Returns students, courses, enrollments and fingerprint mappings created,
+    changed or deleted after ?since=<version>. Clients keep the returned
+    version and pass it next time; since=0 returns the whole roster. When
+    has_more is true the client should ask again right away.
+    """
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = request.args.get('limit', MAX_CHANGES, type=int)
+        if since < 0 or limit < 1:
+            return json_response({"error": "since must be >= 0 and limit >= 1"}, 400)
+        
+        changes = get_changes(since, min(limit, MAX_CHANGES))
+        return jsonify(dict(changes, success=True))
+        
+    except Exception as e:
+        logger.error(f"Error fetching roster changes: {str(e)}")
         return json_response({"error": "Internal server error"}, 500)
 
 @api.route('/statistics', methods=['GET'])
@@ -241,20 +762,15 @@ def get_courses():
 def get_statistics():
     """API endpoint to get attendance statistics"""
     try:
-        # Get total counts
-        student_count = Student.query.count()
-        course_count = Course.query.count()
-        attendance_count = Attendance.query.count()
-        
-        # Get status distribution
-        present_count = Attendance.query.filter_by(status='present').count()
-        late_count = Attendance.query.filter_by(status='late').count()
-        absent_count = Attendance.query.filter_by(status='absent').count()
+        # Get total counts in one round trip
+        student_count, course_count = db.session.query(
+            db.select(func.count(Student.id)).scalar_subquery(),
+            db.select(func.count(Course.id)).scalar_subquery()
+        ).one()
         
-        # Calculate percentage
-        present_percent = (present_count / attendance_count * 100) if attendance_count > 0 else 0
-        late_percent = (late_count / attendance_count * 100) if attendance_count > 0 else 0
-        absent_percent = (absent_count / attendance_count * 100) if attendance_count > 0 else 0
+        # Get status distribution (single GROUP BY over attendance)
+        stats = attendance_manager.get_attendance_statistics()
+        attendance_count = stats['total_records']
         
         return jsonify({
             'success': True,
@@ -263,16 +779,8 @@ def get_statistics():
                 'courses': course_count,
                 'attendance_records': attendance_count
             },
-            'attendance_status': {
-                'present': present_count,
-                'late': late_count,
-                'absent': absent_count
-            },
-            'attendance_percentage': {
-                'present': round(present_percent, 2),
-                'late': round(late_percent, 2),
-                'absent': round(absent_percent, 2)
-            }
+            'attendance_status': stats['status_counts'],
+            'attendance_percentage': stats['percentages']
         })
         
     except Exception as e:
@@ -281,60 +789,178 @@ def get_statistics():
 
 @api.route('/verify-fingerprint', methods=['POST'])
 def verify_fingerprint():
-    """API endpoint for IoT device to verify a fingerprint template"""
+    """
+    API endpoint for IoT device to verify a fingerprint
+    
+    Accepts either a base64-encoded raw 'template', matched 1:N on the
+    server against every enrolled template, or a 'fingerprint_id' already
+    matched on the sensor (a slot of the sensor given by 'device_id', see
+    get_sensor_device_id()). Speaks JSON or the binary wire format, where
+    the template is sent as raw bytes.
+    """
     try:
-        data = request.get_json()
+        try:
+            data = get_device_payload(decode_verify_request)
+        except WireFormatError as e:
+            return device_response({"error": f"Invalid binary message: {str(e)}"}, 400, encode_verify_response)
         
         if not data:
-            return json_response({"error": "No data provided"}, 400)
+            return device_response({"error": "No data provided"}, 400, encode_verify_response)
             
-        # In a real implementation, we would receive a fingerprint template
-        # and compare it against stored templates in the database
-        
-        # For this demo, we'll just check if fingerprint_id is provided
-        if 'fingerprint_id' not in data:
-            return json_response({"error": "Missing fingerprint_id field"}, 400)
+        if data.get('template'):
+            # Match a raw sensor template against every enrolled template
+            try:
+                template = data['template']
+                if not isinstance(template, bytes):
+                    template = base64.b64decode(template, validate=True)
+                match = template_matcher.match(template)
+            except (ValueError, TypeError, binascii.Error):
+                return device_response({"error": "Invalid template"}, 400, encode_verify_response)
             
-        fingerprint_id = data['fingerprint_id']
-        
-        # Find fingerprint in database
-        from models import Fingerprint
-        fingerprint = Fingerprint.query.filter_by(finger_id=fingerprint_id).first()
+            if not match:
+                return device_response({
+                    "success": False,
+                    "message": "No matching fingerprint found"
+                }, 200, encode_verify_response)
+            
+            fingerprint_id = match['finger_id']
+            score = round(match['score'], 4)
+            student = fingerprint_index.get_student(match['student_id'])
+        elif 'fingerprint_id' in data:
+            # Trust the finger ID matched on the sensor itself
+            fingerprint_id = data['fingerprint_id']
+            score = None
+            try:
+                device_id = get_sensor_device_id(data)
+            except (ValueError, TypeError):
+                return device_response({"error": "Invalid device_id"}, 400, encode_verify_response)
+            
+            # Resolve the fingerprint from the in-memory index (one version check when warm)
+            student = fingerprint_index.lookup(fingerprint_id, device_id)
+        else:
+            return device_response({"error": "Missing fingerprint_id or template field"}, 400, encode_verify_response)
         
-        if not fingerprint:
-            return json_response({
+        if not student:
+            return device_response({
                 "success": False,
                 "message": "No matching fingerprint found"
-            })
-            
-        # Get the student associated with the fingerprint
-        student = Student.query.get(fingerprint.student_id)
+            }, 200, encode_verify_response)
         
         # Get courses the student is enrolled in
-        enrolled_courses = []
-        for course in student.courses:
-            enrolled_courses.append({
-                'id': course.id,
-                'code': course.course_code,
-                'title': course.title
-            })
+        enrolled_courses = [
+            {'id': course.id, 'code': course.code, 'title': course.title}
+            for course in fingerprint_index.get_courses(student)
+        ]
         
         # Return student information with enrolled courses
-        return jsonify({
+        return device_response({
             "success": True,
             "message": "Fingerprint verified",
             "student": {
                 "id": student.id,
                 "student_id": student.student_id,
                 "name": f"{student.first_name} {student.last_name}",
-                "fingerprint_id": fingerprint.finger_id,
+                "fingerprint_id": int(fingerprint_id),
                 "enrolled_courses": enrolled_courses
-            }
-        })
+            },
+            "score": score
+        }, 200, encode_verify_response)
         
     except Exception as e:
         logger.error(f"Error verifying fingerprint: {str(e)}")
-        return json_response({"error": "Internal server error"}, 500)
+        return device_response({"error": "Internal server error"}, 500, encode_verify_response)
+
+@api.route('/scan', methods=['POST'])
+def record_scan():
+    """
+    API endpoint recording attendance for a sensor match in one round trip
+    
+    Replaces the verify-fingerprint + attendance call pair made per scan:
+    takes the 'fingerprint_id' matched on the sensor and a 'course_id'
+    (plus optional 'timestamp', 'status' and 'device_id', the sensor whose
+    slot the fingerprint_id is; see get_sensor_device_id()), resolves the student from the
+    fingerprint index, checks the course and enrollment with one query and
+    writes the attendance in the same transaction. Returns the student's
+    display name for the device screen. Speaks JSON or the binary wire
+    format.
+    """
+    try:
+        try:
+            data = get_device_payload(decode_scan_request)
+        except WireFormatError as e:
+            return device_response({"error": f"Invalid binary message: {str(e)}"}, 400, encode_scan_response)
+        
+        if not data:
+            return device_response({"error": "No data provided"}, 400, encode_scan_response)
+        
+        for field in ['fingerprint_id', 'course_id']:
+            if field not in data:
+                return device_response({"error": f"Missing required field: {field}"}, 400, encode_scan_response)
+        
+        try:
+            course_id = int(data['course_id'])
+        except (ValueError, TypeError):
+            return device_response({"error": "Course not found", "course_id": str(data['course_id'])}, 404, encode_scan_response)
+        
+        try:
+            device_id = get_sensor_device_id(data)
+        except (ValueError, TypeError):
+            return device_response({"error": "Invalid device_id"}, 400, encode_scan_response)
+        
+        # Resolve the fingerprint from the in-memory index (one version check when warm)
+        student = fingerprint_index.lookup(data['fingerprint_id'], device_id)
+        if not student:
+            return device_response({
+                "error": "No matching fingerprint found",
+                "fingerprint_id": str(data['fingerprint_id'])
+            }, 404, encode_scan_response)
+        
+        name = f"{student.first_name} {student.last_name}"
+        
+        # Course and enrollment from the database, so the write sees committed roster changes
+        course = (db.session.query(Course.title, student_course.c.student_id.label('enrolled'))
+                  .outerjoin(student_course, and_(student_course.c.course_id == Course.id,
+                                                  student_course.c.student_id == student.id))
+                  .filter(Course.id == course_id)
+                  .first())
+        if not course:
+            return device_response({"error": "Course not found", "course_id": str(course_id)}, 404, encode_scan_response)
+        
+        if course.enrolled is None:
+            return device_response({
+                "error": "Student is not enrolled in this course",
+                "student_id": student.student_id,
+                "course_id": str(course_id),
+                "student_name": name,
+                "course_name": course.title
+            }, 403, encode_scan_response)
+        
+        attendance = Attendance(
+            student_id=student.id,
+            course_id=course_id,
+            timestamp=parse_attendance_timestamp(data.get('timestamp')),
+            status=normalize_attendance_status(data.get('status')),
+            synced=True
+        )
+        # A repeat scan within the dedupe window is answered with the first record, not written
+        attendance_id, duplicate = add_attendance(attendance)
+        
+        return device_response({
+            "success": True,
+            "attendance_id": attendance_id,
+            "duplicate": duplicate,
+            "message": f"Attendance already recorded for {name}" if duplicate else f"Attendance recorded for {name}",
+            "student": {
+                "id": student.id,
+                "student_id": student.student_id,
+                "name": name
+            }
+        }, 200, encode_scan_response)
+        
+    except Exception as e:
+        logger.error(f"Error recording scan: {str(e)}")
+        db.session.rollback()
+        return device_response({"error": "Internal server error"}, 500, encode_scan_response)
 
 def register_api_routes(app):
     """Register API routes with Flask app"""
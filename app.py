@@ -34,6 +34,12 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Push enrollment progress over server-sent events (/enroll/events). An open stream holds a web
+# worker for the whole enrollment (up to ENROLLMENT_TIMEOUT, 120s), so only enable this when serving
+# with a threaded or async worker class, e.g. `gunicorn --worker-class gthread --threads 8`.
+# When disabled, browsers poll /enroll/status instead.
+app.config["ENROLLMENT_EVENTS"] = os.environ.get("ENROLLMENT_EVENTS", "").lower() in ("1", "true", "yes")
+
 # Initialize extensions
 db.init_app(app)
 login_manager.init_app(app)
@@ -41,10 +47,28 @@ login_manager.login_view = 'login'
 
 # Import models to ensure tables are created
 with app.app_context():
-    from models import User, Student, Course, Attendance, Fingerprint
+    from models import User, Student, Course, Attendance, Fingerprint, AttendanceDailyCount
     db.create_all()
     logger.info("Database tables created")
 
+    # create_all() skips columns and indexes added to tables that already exist. Missing columns are
+    # nullable additions (a catalog-only change), so they are added now: the startup warm-up below
+    # queries them. Index builds can take long on big tables and are left to `flask upgrade-db`.
+    from migrations import missing_columns, missing_indexes, add_column
+    schema_ready = True
+    for column in missing_columns(db.engine):
+        try:
+            add_column(db.engine, column)
+            logger.info(f"Added missing column {column.table.name}.{column.name}")
+        except Exception as e:
+            schema_ready = False
+            logger.error(f"Could not add column {column.table.name}.{column.name} ({str(e)}); "
+                         f"queries on this table will fail until you run `flask upgrade-db`")
+    pending = missing_indexes(db.engine)
+    if pending:
+        logger.warning(f"Database is missing indexes ({', '.join(index.name for index in pending)}); "
+                       f"run `flask upgrade-db` to create them")
+
 # Import and register routes
 from routes import register_routes
 register_routes(app)
@@ -53,6 +77,55 @@ register_routes(app)
 from api import register_api_routes
 register_api_routes(app)
 
+# Repeat scans of a student for a course within this many seconds are recorded once (0 disables)
+from attendance_dedupe import attendance_dedupe, DEDUPE_WINDOW
+attendance_dedupe.window = int(os.environ.get("ATTENDANCE_DEDUPE_WINDOW", DEDUPE_WINDOW))
+
+# Register attendance rollup maintenance (keeps daily counts in step with writes)
+from attendance_rollup import register_rollup_commands
+register_rollup_commands(app)
+
+# Background attendance sync, fingerprint scans and enrollment watchers run inside this app's context
+from sync_worker import sync_worker
+from scan_jobs import scan_jobs
+from enrollment_watcher import enrollment_watchers
+sync_worker.init_app(app)
+scan_jobs.init_app(app)
+enrollment_watchers.init_app(app)
+
+# Fingerprint sensors: registered devices are routed by course/room, SENSOR_IP is the fallback
+from device_registry import device_registry, register_device_commands, DEFAULT_SENSOR_IP
+sensor_ip = os.environ.get("SENSOR_IP", DEFAULT_SENSOR_IP)
+device_registry.default_address = (sensor_ip, int(os.environ.get("SENSOR_PORT", 80))) if sensor_ip else None
+register_device_commands(app)
+
+# Register schema migration commands (flask upgrade-db)
+from migrations import register_migration_commands
+register_migration_commands(app)
+
+# Register roster change log maintenance (flask compact-change-log)
+from roster_changes import register_change_commands
+register_change_commands(app)
+
+# Warm the finger ID -> student index, template matcher and sensor registry used by the scan paths,
+# and the course catalog devices fetch on boot
+# (TEMPLATE_INDEX_PATH="" disables persisting the template index to disk)
+from template_matcher import template_matcher
+template_matcher.index_path = os.environ.get(
+    "TEMPLATE_INDEX_PATH", os.path.join(app.instance_path, "template_index.npz")
+)
+if schema_ready:
+    with app.app_context():
+        from fingerprint_index import fingerprint_index
+        fingerprint_index.warm()
+        template_matcher.warm()
+        device_registry.warm()
+        from course_catalog import course_catalog
+        course_catalog.warm()
+else:
+    # Warming would query the missing columns and stop the app before `flask upgrade-db` could run
+    logger.warning("Skipping cache warm-up until the database schema is upgraded")
+
 # User loader callback for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
@@ -27,8 +27,20 @@
 #define LCD_ADDRESS 0x27
 #define SERVER_URL "http://192.168.43.164:5000"
 #define MAX_OFFLINE_RECORDS 50
+#define SYNC_BATCH_SIZE 10  // Offline records replayed per /api/attendance/batch request
 #define NTP_SERVER "pool.ntp.org"
 
+// Binary wire format for scans and batches (wire_format.py on the server, layouts served
+// at GET /api/wire-schema): packed little-endian structs, the ESP32's native byte order
+#define WIRE_MIMETYPE "application/vnd.fingerprint-attendance.v1"
+#define WIRE_VERSION 1
+#define WIRE_SCAN_REQUEST 0x03
+#define WIRE_ATTENDANCE_BATCH_REQUEST 0x04
+#define WIRE_SCAN_RESPONSE 0x84
+#define WIRE_ATTENDANCE_BATCH_RESPONSE 0x85
+#define WIRE_STATUS_PRESENT 0
+#define WIRE_MAX_RESPONSE 800  // A scan response with three 255-byte strings
+
 // WiFi credentials
 const char* ssid = "YOUR_WIFI_SSID";
 const char* password = "YOUR_WIFI_PASSWORD";
@@ -72,11 +84,59 @@ struct AttendanceRecord {
   bool synced;
 };
 
+struct __attribute__((packed)) WireHeader {
+  uint8_t version;
+  uint8_t type;
+};
+
+struct __attribute__((packed)) WireScanRecord {
+  uint32_t fingerprintId;
+  uint32_t courseId;
+  int64_t timestamp;  // Unix seconds
+  uint8_t status;
+};
+
+struct __attribute__((packed)) WireScanRequest {
+  WireHeader header;
+  WireScanRecord record;
+};
+
+struct __attribute__((packed)) WireBatchRequest {
+  WireHeader header;
+  uint16_t count;
+  WireScanRecord records[SYNC_BATCH_SIZE];  // Only `count` are sent
+};
+
+// Followed by the message, student_id and name strings (u8 length + UTF-8 bytes each)
+struct __attribute__((packed)) WireScanResponse {
+  WireHeader header;
+  bool success;
+  uint32_t attendanceId;
+  uint32_t studentDbId;
+  bool duplicate;
+};
+
+// Followed by `count` WireBatchResult entries in request order
+struct __attribute__((packed)) WireBatchResponse {
+  WireHeader header;
+  uint16_t count;
+  uint16_t recorded;
+  uint16_t duplicates;
+  uint16_t failed;
+};
+
+struct __attribute__((packed)) WireBatchResult {
+  bool success;
+  bool duplicate;
+  uint32_t attendanceId;
+};
+
 Course courses[10];  // Maximum 10 courses support
 int courseCount = 0;
 int selectedCourseIndex = 0;
 AttendanceRecord offlineBuffer[MAX_OFFLINE_RECORDS];
 int offlineRecordCount = 0;
+String lastStudentName = "";  // Set by the server on an online scan
 uint32_t lastButtonPressTime = 0;
 const uint32_t debounceDelay = 200;  // Debounce delay in ms
 
@@ -537,9 +597,9 @@ void verifyFingerprint() {
     Serial.print("Found ID #"); Serial.print(fingerprintId);
     Serial.print(" with confidence of "); Serial.println(confidence);
     
-    // If online, verify with server
+    // If online, verify and record on the server in one request
     if (WiFi.status() == WL_CONNECTED) {
-      verifyWithServer(fingerprintId);
+      recordScanWithServer(fingerprintId);
     } else {
       // Skip online verification if offline
       currentState = RECORD_ATTENDANCE;
@@ -562,43 +622,110 @@ void verifyFingerprint() {
 }
 
 /**
- * Verify fingerprint validity with server
+ * Pack one scan in the wire format's record layout
+ */
+WireScanRecord packScanRecord(uint32_t fingerprintId, const String &courseId, time_t timestamp) {
+  WireScanRecord record;
+  record.fingerprintId = fingerprintId;
+  record.courseId = (uint32_t)courseId.toInt();
+  record.timestamp = (int64_t)timestamp;
+  record.status = WIRE_STATUS_PRESENT;
+  return record;
+}
+
+/**
+ * POST a binary message, asking for a binary response
+ */
+int postWireMessage(HTTPClient &http, const void *message, size_t size) {
+  http.addHeader("Content-Type", WIRE_MIMETYPE);
+  http.addHeader("Accept", WIRE_MIMETYPE);
+  return http.POST((uint8_t *)message, size);
+}
+
+/**
+ * Read a binary response body into buffer and check its header
+ * Returns the body length, or -1 if it is missing, too long or of another type
+ */
+int readWireResponse(HTTPClient &http, uint8_t *buffer, size_t size, uint8_t type) {
+  int length = http.getSize();
+  if (length < (int)sizeof(WireHeader) || length > (int)size) {
+    return -1;
+  }
+  if (http.getStreamPtr()->readBytes(buffer, length) != (size_t)length) {
+    return -1;
+  }
+  const WireHeader *header = (const WireHeader *)buffer;
+  if (header->version != WIRE_VERSION || header->type != type) {
+    return -1;
+  }
+  return length;
+}
+
+/**
+ * Read a wire format string (u8 length + UTF-8 bytes) at offset, advancing it
+ */
+bool readWireString(const uint8_t *data, int length, int &offset, String &value) {
+  if (offset >= length || offset + 1 + data[offset] > length) {
+    return false;
+  }
+  int size = data[offset];
+  value = "";
+  value.reserve(size);
+  for (int i = 0; i < size; i++) {
+    value += (char)data[offset + 1 + i];
+  }
+  offset += 1 + size;
+  return true;
+}
+
+/**
+ * Verify the fingerprint and record attendance on the server in one request
  */
-void verifyWithServer(uint32_t fingerprintId) {
+void recordScanWithServer(uint32_t fingerprintId) {
+  time_t now;
+  time(&now);
+  
   HTTPClient http;
-  String url = String(SERVER_URL) + "/api/verify-fingerprint";
+  String url = String(SERVER_URL) + "/api/scan";
   
   http.begin(url);
-  http.addHeader("Content-Type", "application/json");
   
-  // Create JSON payload
-  DynamicJsonDocument doc(256);
-  doc["fingerprint_id"] = fingerprintId;
-  doc["course_id"] = courses[selectedCourseIndex].id;
+  WireScanRequest request;
+  request.header.version = WIRE_VERSION;
+  request.header.type = WIRE_SCAN_REQUEST;
+  request.record = packScanRecord(fingerprintId, courses[selectedCourseIndex].id, now);
   
-  String payload;
-  serializeJson(doc, payload);
-  
-  int httpCode = http.POST(payload);
+  int httpCode = postWireMessage(http, &request, sizeof(request));
   
   if (httpCode == HTTP_CODE_OK) {
-    // Server verification successful
-    currentState = RECORD_ATTENDANCE;
-  } else {
-    // Server verification failed
+    // Recorded on the server; keep the name for the result screen
+    static uint8_t response[WIRE_MAX_RESPONSE];
+    int length = readWireResponse(http, response, sizeof(response), WIRE_SCAN_RESPONSE);
+    int offset = sizeof(WireScanResponse);
+    String message, studentId, name;
+    if (length >= offset &&
+        readWireString(response, length, offset, message) &&
+        readWireString(response, length, offset, studentId) &&
+        readWireString(response, length, offset, name)) {
+      lastStudentName = name;
+    }
+    currentState = SHOW_RESULT;
+  } else if (httpCode >= 400 && httpCode < 500) {
+    // Rejected by the server (unknown fingerprint or not enrolled): nothing to buffer
     lcd.clear();
     lcd.setCursor(0, 0);
-    lcd.print("Server verify");
+    lcd.print(httpCode == 403 ? "Not enrolled" : "Unknown finger");
     lcd.setCursor(0, 1);
-    lcd.print("failed: ");
-    lcd.print(httpCode);
+    lcd.print("Try again");
     
     digitalWrite(LED_YELLOW, LOW);
     digitalWrite(LED_RED, HIGH);
     delay(2000);
     digitalWrite(LED_RED, LOW);
     
-    // Continue to attendance recording anyway, but mark as offline
+    currentState = WAIT_FINGERPRINT;
+  } else {
+    // Server unreachable or failing: record offline and sync later
     currentState = RECORD_ATTENDANCE;
   }
   
@@ -652,27 +779,82 @@ void recordAttendance() {
 
 /**
  * Attempt to send attendance record to server
+ * Returns true once the server has answered: a record it rejects (4xx) would
+ * be rejected again on every replay, so only network and 5xx failures are buffered
  */
 bool sendAttendanceToServer(uint32_t fingerprintId, String courseId, time_t timestamp) {
   HTTPClient http;
-  String url = String(SERVER_URL) + "api/attendance";
+  String url = String(SERVER_URL) + "/api/scan";
   
   http.begin(url);
-  http.addHeader("Content-Type", "application/json");
   
-  // Create JSON payload
-  DynamicJsonDocument doc(256);
-  doc["fingerprint_id"] = fingerprintId;
-  doc["course_id"] = courseId;
-  doc["timestamp"] = timestamp;
+  WireScanRequest request;
+  request.header.version = WIRE_VERSION;
+  request.header.type = WIRE_SCAN_REQUEST;
+  request.record = packScanRecord(fingerprintId, courseId, timestamp);
+  
+  int httpCode = postWireMessage(http, &request, sizeof(request));
+  
+  http.end();
+  return (httpCode > 0 && httpCode < 500);
+}
+
+/**
+ * Replay up to SYNC_BATCH_SIZE offline records starting at `start` in one
+ * request to /api/attendance/batch, marking every record the server answered
+ * (recorded, duplicate or rejected) as synced
+ * Returns false if the records must be kept for a later retry
+ */
+bool sendAttendanceBatch(int start, int count) {
+  HTTPClient http;
+  String url = String(SERVER_URL) + "/api/attendance/batch";
+  
+  http.begin(url);
+  http.setTimeout(15000);
+  
+  static WireBatchRequest request;
+  request.header.version = WIRE_VERSION;
+  request.header.type = WIRE_ATTENDANCE_BATCH_REQUEST;
+  request.count = count;
+  for (int i = 0; i < count; i++) {
+    const AttendanceRecord &record = offlineBuffer[start + i];
+    request.records[i] = packScanRecord(record.fingerprintId, record.courseId, record.timestamp);
+  }
   
-  String payload;
-  serializeJson(doc, payload);
+  int httpCode = postWireMessage(http, &request,
+                                 offsetof(WireBatchRequest, records) + count * sizeof(WireScanRecord));
+  bool delivered = false;
   
-  int httpCode = http.POST(payload);
+  if (httpCode == HTTP_CODE_OK) {
+    // One result per record, in the order they were sent
+    static uint8_t response[sizeof(WireBatchResponse) + SYNC_BATCH_SIZE * sizeof(WireBatchResult)];
+    int length = readWireResponse(http, response, sizeof(response), WIRE_ATTENDANCE_BATCH_RESPONSE);
+    const WireBatchResponse *summary = (const WireBatchResponse *)response;
+    if (length >= (int)sizeof(WireBatchResponse) && summary->count == count &&
+        length == (int)(sizeof(WireBatchResponse) + count * sizeof(WireBatchResult))) {
+      const WireBatchResult *results = (const WireBatchResult *)(response + sizeof(WireBatchResponse));
+      for (int index = 0; index < count; index++) {
+        if (!results[index].success) {
+          Serial.print("Server rejected offline record for fingerprint ");
+          Serial.println(offlineBuffer[start + index].fingerprintId);
+        }
+        offlineBuffer[start + index].synced = true;
+      }
+      delivered = true;
+    }
+  } else if (httpCode >= 400 && httpCode < 500 && httpCode != 409) {
+    // The whole batch was refused; retrying would be refused again
+    Serial.print("Server rejected offline batch: HTTP ");
+    Serial.println(httpCode);
+    for (int i = start; i < start + count; i++) {
+      offlineBuffer[i].synced = true;
+    }
+    delivered = true;
+  }
+  // 409 (conflicting concurrent write), 5xx and network errors: keep for the next sync
   
   http.end();
-  return (httpCode == HTTP_CODE_OK);
+  return delivered;
 }
 
 /**
@@ -683,7 +865,12 @@ void showResult() {
   lcd.setCursor(0, 0);
   lcd.print("Attendance");
   lcd.setCursor(0, 1);
-  lcd.print("Recorded!");
+  if (lastStudentName.length() > 0) {
+    lcd.print(lastStudentName.substring(0, LCD_COLS));
+    lastStudentName = "";
+  } else {
+    lcd.print("Recorded!");
+  }
   
   digitalWrite(LED_GREEN, HIGH);
   delay(2000);
@@ -715,24 +902,17 @@ void syncOfflineRecords() {
   }
   
   if (currentSyncIndex < offlineRecordCount) {
-    if (!offlineBuffer[currentSyncIndex].synced) {
-      bool success = sendAttendanceToServer(
-        offlineBuffer[currentSyncIndex].fingerprintId,
-        offlineBuffer[currentSyncIndex].courseId,
-        offlineBuffer[currentSyncIndex].timestamp
-      );
-      
-      if (success) {
-        offlineBuffer[currentSyncIndex].synced = true;
-        saveOfflineRecords();
-      }
+    int count = min(SYNC_BATCH_SIZE, offlineRecordCount - currentSyncIndex);
+    
+    if (sendAttendanceBatch(currentSyncIndex, count)) {
+      saveOfflineRecords();
     }
     
     // Update display
+    currentSyncIndex += count;
     lcd.setCursor(9, 1);
-    lcd.print(currentSyncIndex + 1);
+    lcd.print(currentSyncIndex);
     
-    currentSyncIndex++;
   } else {
     // Cleanup synced records
     int newCount = 0;
@@ -0,0 +1,216 @@
+import calendar
+import logging
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from models import Attendance
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Seconds during which repeated scans of a student for a course count as one (0 disables)
+DEDUPE_WINDOW = 300
+
+# Most recent scans remembered by each process
+DEDUPE_MAX_ENTRIES = 10000
+
+
+def epoch_seconds(timestamp):
+    """Get a naive UTC or timezone-aware datetime as whole seconds since the Unix epoch"""
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+def dedupe_slot(timestamp, window):
+    """
+    Get the dedupe window a timestamp falls in
+
+    Windows are aligned to the Unix epoch, so every worker process maps the
+    same scan time to the same slot.
+
+    Args:
+        timestamp (datetime): Attendance time (naive UTC or timezone-aware)
+        window (int): Window length in seconds
+
+    Returns:
+        int: Window number since the epoch
+    """
+    return epoch_seconds(timestamp) // window
+
+
+class AttendanceDedupe:
+    """
+    Process-local memory of recent scans, keyed by (student, course, slot)
+
+    Students tap two or three times and devices replay their buffers, so
+    the same scan often arrives again within seconds. A repeat found here
+    is answered with the attendance already recorded, without touching the
+    database. The unique index on (student_id, course_id, dedupe_slot)
+    makes the rule hold across worker processes and restarts: a repeat this
+    process has not seen fails to insert and is answered the same way.
+
+    Slots are aligned to the epoch, so taps either side of a slot boundary
+    land in different slots; a scan less than window seconds after the one
+    recorded in the previous slot is a repeat as well. Two processes
+    recording such a pair at the same moment may both insert it.
+    """
+
+    def __init__(self, window=DEDUPE_WINDOW, max_entries=DEDUPE_MAX_ENTRIES):
+        """
+        Initialize an empty cache
+
+        Args:
+            window (int): Dedupe window in seconds (0 disables deduplication)
+            max_entries (int): Entries kept before the oldest are evicted
+        """
+        self.window = window
+        self.max_entries = max_entries
+        # key -> (attendance ID, scan time in epoch seconds, monotonic expiry), oldest first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def key(self, student_id, course_id, timestamp):
+        """Get the dedupe key of a scan, or None when deduplication is disabled"""
+        if not self.window or self.window <= 0:
+            return None
+        return (student_id, course_id, dedupe_slot(timestamp, self.window))
+
+    @staticmethod
+    def previous(key):
+        """Get the key of the slot before a key's"""
+        return key[:2] + (key[2] - 1,)
+
+    def match(self, key, timestamp, recorded):
+        """
+        Find the recorded scan a new scan repeats
+
+        Args:
+            key (tuple): Key of the new scan
+            timestamp (datetime): Time of the new scan
+            recorded (dict): key -> (attendance, scan time in epoch seconds), as from find_recorded()
+
+        Returns:
+            The attendance recorded in the scan's slot, or in the previous slot
+            less than one window earlier; None if the scan is new
+        """
+        if key in recorded:
+            return recorded[key][0]
+        previous = recorded.get(self.previous(key))
+        if previous is not None and epoch_seconds(timestamp) - previous[1] < self.window:
+            return previous[0]
+        return None
+
+    def get(self, key):
+        """
+        Find the attendance already recorded for a key
+
+        Returns:
+            tuple: (attendance ID, scan time in epoch seconds), or None if this
+                   process has not seen the scan recently
+        """
+        with self.lock:
+            self.evict_expired()
+            entry = self.entries.get(key)
+            return entry[:2] if entry else None
+
+    def add(self, key, attendance_id, timestamp):
+        """Remember a recorded scan for one window"""
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (attendance_id, epoch_seconds(timestamp), time.monotonic() + self.window)
+            self.evict_expired()
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def evict_expired(self):
+        # Every entry lives for one window, so expiry follows insertion order (caller holds the lock)
+        now = time.monotonic()
+        while self.entries:
+            key, (attendance_id, seconds, expires_at) = next(iter(self.entries.items()))
+            if expires_at > now:
+                break
+            del self.entries[key]
+
+    def clear(self):
+        """Forget every remembered scan"""
+        with self.lock:
+            self.entries.clear()
+
+    def find_recorded(self, keys):
+        """
+        Find attendance recorded for dedupe keys and their previous slots,
+        from memory first, then with one query
+
+        Args:
+            keys (iterable): Keys returned by key()
+
+        Returns:
+            dict: key -> (attendance ID, scan time in epoch seconds) for the
+                  keys already recorded; pass it to match()
+        """
+        recorded = {}
+        missing = set()
+        for key in keys:
+            for wanted in (key, self.previous(key)):
+                entry = self.get(wanted)
+                if entry is None:
+                    missing.add(wanted)
+                else:
+                    recorded[wanted] = entry
+        missing -= recorded.keys()
+        if missing:
+            rows = (db.session.query(Attendance.id, Attendance.student_id, Attendance.course_id,
+                                     Attendance.dedupe_slot, Attendance.timestamp)
+                    .filter(tuple_(Attendance.student_id, Attendance.course_id,
+                                   Attendance.dedupe_slot).in_(missing))
+                    .all())
+            for attendance_id, student_id, course_id, slot, timestamp in rows:
+                key = (student_id, course_id, slot)
+                recorded[key] = (attendance_id, epoch_seconds(timestamp))
+                self.add(key, attendance_id, timestamp)
+        return recorded
+
+
+attendance_dedupe = AttendanceDedupe()
+
+
+def add_attendance(attendance):
+    """
+    Insert and commit an attendance record unless it repeats a recent scan
+
+    A repeat is not written: the ID of the attendance it repeats (see
+    AttendanceDedupe.match()) is returned instead. The session is rolled
+    back when the database rejects a repeat recorded by another process.
+
+    Args:
+        attendance (Attendance): New record with student_id, course_id and timestamp set
+
+    Returns:
+        tuple: (attendance ID, True if the scan was a duplicate)
+    """
+    key = attendance_dedupe.key(attendance.student_id, attendance.course_id, attendance.timestamp)
+    if key is not None:
+        # Memory first; one query when this process has not seen the slot or the previous one
+        attendance_id = attendance_dedupe.match(key, attendance.timestamp, attendance_dedupe.find_recorded([key]))
+        if attendance_id is not None:
+            return attendance_id, True
+        attendance.dedupe_slot = key[2]
+
+    db.session.add(attendance)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        recorded = attendance_dedupe.find_recorded([key]) if key is not None else {}
+        if key not in recorded:
+            raise
+        logger.info(f"Duplicate scan of student {key[0]} for course {key[1]} rejected by the database")
+        return recorded[key][0], True
+
+    # Read before commit expires the object, saving a reload
+    attendance_id, timestamp = attendance.id, attendance.timestamp
+    db.session.commit()
+    if key is not None:
+        attendance_dedupe.add(key, attendance_id, timestamp)
+    return attendance_id, False
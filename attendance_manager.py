@@ -1,20 +1,58 @@
 import logging
 import json
 import random
+import time
 from datetime import datetime
+from sqlalchemy import func, update
 from models import Attendance, Student, Course
 from extensions import db
+from attendance_rollup import get_status_counts
+from attendance_outbox import get_sync_cursor, read_outbox, acknowledge_outbox
+from attendance_dedupe import add_attendance
 
 logger = logging.getLogger(__name__)
 
+# Attendance IDs per UPDATE statement when marking records as synced
+SYNC_CHUNK_SIZE = 1000
+
+# Records sent to the central server per sync request
+SYNC_BATCH_SIZE = 500
+
+
+class SyncError(Exception):
+    """Raised when the central server does not accept a sync batch"""
+
+def is_day_aligned(value, boundary):
+    """
+    Check whether a date filter falls on a day boundary
+    
+    Args:
+        value (date or datetime, optional): Filter value
+        boundary (time): Expected time of day for datetime values
+        
+    Returns:
+        bool: True if the value is unset, a date, or a datetime at the boundary
+    """
+    if value is None or not isinstance(value, datetime):
+        return True
+    return value.time() == boundary
+
 class AttendanceManager:
     """
     Class to manage attendance records and synchronization
     """
     
-    def __init__(self):
-        """Initialize the attendance manager"""
+    def __init__(self, sync_latency=1.0, sync_failure_rate=0.1):
+        """
+        Initialize the attendance manager
+        
+        Args:
+            sync_latency (float): Simulated seconds per request to the central server
+            sync_failure_rate (float): Simulated fraction of failed sync requests
+        """
         self.last_sync_time = None
+        self.sync_latency = sync_latency
+        self.sync_failure_rate = sync_failure_rate
     
     def record_attendance(self, student_id, course_id, status='present'):
         """
@@ -26,7 +64,23 @@ class AttendanceManager:
             status (str): Attendance status ('present', 'late', 'absent')
             
         Returns:
-            Attendance: The created attendance record or None if failed
+            Attendance: The created record (or the one already recorded for a repeat scan), None if failed
+        """
+        attendance, duplicate = self.record_scan(student_id, course_id, status)
+        return attendance
+    
+    def record_scan(self, student_id, course_id, status='present'):
+        """
+        Record a new attendance entry, reporting whether it repeated a recent scan
+        
+        Args:
+            student_id (int): Database ID of the student
+            course_id (int): Database ID of the course
+            status (str): Attendance status ('present', 'late', 'absent')
+            
+        Returns:
+            tuple: (Attendance, True if the record already existed within the dedupe window),
+                   or (None, False) if failed
         """
         try:
             # Validate student and course existence
@@ -35,14 +89,14 @@ class AttendanceManager:
             
             if not student or not course:
                 logger.error(f"Student ID {student_id} or Course ID {course_id} not found")
-                return None
+                return None, False
             
             # Check if student is enrolled in the course
             if course not in student.courses:
                 logger.warning(f"Student {student.student_id} is not enrolled in course {course.course_code}")
-                return None  # Prevent attendance recording for non-enrolled students
+                return None, False  # Prevent attendance recording for non-enrolled students
             
-            # Create new attendance record
+            # Create new attendance record (a repeat scan within the dedupe window is not written)
             attendance = Attendance(
                 student_id=student_id,
                 course_id=course_id,
@@ -50,17 +104,19 @@ class AttendanceManager:
                 status=status,
                 synced=False  # Mark as not synced initially
             )
+            attendance_id, duplicate = add_attendance(attendance)
             
-            db.session.add(attendance)
-            db.session.commit()
+            if duplicate:
+                logger.info(f"Ignored repeat scan of {student.student_id} in {course.course_code}")
+                return db.session.get(Attendance, attendance_id), True
             
             logger.info(f"Recorded {status} attendance for {student.first_name} {student.last_name} in {course.course_code}")
-            return attendance
+            return attendance, False
             
         except Exception as e:
             logger.error(f"Error recording attendance: {str(e)}")
             db.session.rollback()
-            return None
+            return None, False
     
     def get_unsynced_records(self):
         """
@@ -69,7 +125,7 @@ class AttendanceManager:
         Returns:
             list: List of unsynced Attendance objects
         """
-        return Attendance.query.filter_by(synced=False).all()
+        return Attendance.query.filter(Attendance.synced == db.false()).all()
     
     def mark_as_synced(self, attendance_ids):
         """
@@ -82,13 +138,7 @@ class AttendanceManager:
             int: Number of records marked as synced
         """
         try:
-            count = 0
-            for attendance_id in attendance_ids:
-                attendance = Attendance.query.get(attendance_id)
-                if attendance:
-                    attendance.synced = True
-                    count += 1
-            
+            count = self.update_synced_flags(attendance_ids)
             db.session.commit()
             logger.info(f"Marked {count} attendance records as synced")
             return count
@@ -98,18 +148,119 @@ class AttendanceManager:
             db.session.rollback()
             return 0
     
-    def sync_attendance_data(self):
+    def update_synced_flags(self, attendance_ids):
+        """
+        Set the synced flag of attendance records without committing
+        
+        Args:
+            attendance_ids (list): List of attendance record IDs
+            
+        Returns:
+            int: Number of records updated
+        """
+        # One set-based UPDATE per chunk instead of loading every record
+        attendance_ids = sorted(set(attendance_ids))
+        count = 0
+        for start in range(0, len(attendance_ids), SYNC_CHUNK_SIZE):
+            chunk = attendance_ids[start:start + SYNC_CHUNK_SIZE]
+            result = db.session.execute(
+                update(Attendance)
+                .where(Attendance.id.in_(chunk))
+                .values(synced=True)
+                .execution_options(synchronize_session=False)
+            )
+            count += result.rowcount
+        return count
+    
+    def get_sync_batch(self, limit=SYNC_BATCH_SIZE):
+        """
+        Get the next batch of unacknowledged outbox changes
+        
+        Args:
+            limit (int): Maximum number of outbox entries
+            
+        Returns:
+            tuple: (records to send as dictionaries, outbox IDs covered by the batch)
+        """
+        records = {}
+        outbox_ids = []
+        for row in read_outbox(limit):
+            outbox_ids.append(row.outbox_id)
+            if row.timestamp is None:
+                # Record was deleted after it was written; nothing left to send
+                continue
+            # Entries carry current values, so repeated changes collapse into one record
+            records[row.attendance_id] = {
+                'id': row.attendance_id,
+                'student_id': row.student_id,
+                'course_id': row.course_id,
+                'timestamp': row.timestamp.isoformat(),
+                'status': row.status
+            }
+        return list(records.values()), outbox_ids
+    
+    def push_attendance_batch(self, records):
+        """
+        Send a batch of attendance records to the central server
+        
+        Args:
+            records (list): Records from get_sync_batch()
+            
+        Raises:
+            SyncError: If the server did not accept the batch
+        """
+        # In a real implementation, this would send the records to a remote server
+        # For simulation, we wait for a network round trip and fail 10% of the time
+        logger.info(f"Syncing {len(records)} attendance records...")
+        time.sleep(self.sync_latency)
+        if random.random() < self.sync_failure_rate:
+            raise SyncError('Network error during sync')
+    
+    def sync_attendance_data(self, batch_size=SYNC_BATCH_SIZE, push=None, on_batch=None):
         """
         Synchronize unsynced attendance data with the central server
         
+        Sends the attendance outbox (see attendance_outbox.py) in batches of
+        batch_size, acknowledging the entries and marking records synced
+        after each accepted batch, so finding work costs O(new changes) and
+        memory stays bounded for any backlog size. No lock is held during the
+        push; a batch acknowledged by another worker meanwhile stops the sync.
+        Runs in the caller's thread; the /sync route hands this to the
+        background sync worker (see sync_worker.py).
+        
+        Args:
+            batch_size (int): Records sent per request
+            push (callable, optional): Sends one batch, raising SyncError on failure
+                                       (defaults to push_attendance_batch)
+            on_batch (callable, optional): Called with the number of records after each synced batch
+        
         Returns:
             dict: Dictionary with sync results
         """
+        push = push or self.push_attendance_batch
+        count = 0
         try:
-            # Get all unsynced records
-            unsynced_records = self.get_unsynced_records()
+            while True:
+                cursor = get_sync_cursor()
+                batch, outbox_ids = self.get_sync_batch(limit=batch_size)
+                # End the read transaction so nothing stays locked during the push
+                db.session.commit()
+                if not outbox_ids:
+                    break
+                
+                if batch:
+                    push(batch)
+                if not acknowledge_outbox(outbox_ids, cursor):
+                    db.session.rollback()
+                    raise SyncError('Sync cursor was advanced by another worker')
+                # Errors propagate, so a batch that can't be acknowledged isn't pushed again and again
+                self.update_synced_flags([record['id'] for record in batch])
+                db.session.commit()
+                count += len(batch)
+                if on_batch:
+                    on_batch(len(batch))
             
-            if not unsynced_records:
+            if not count:
                 logger.info("No unsynced attendance records to sync")
                 return {
                     'status': 'success',
@@ -117,57 +268,31 @@ class AttendanceManager:
                     'count': 0
                 }
             
-            # In a real implementation, this would send the records to a remote server
-            # For simulation, we'll just mark them as synced
-            
-            # Prepare records for sync
-            attendance_ids = [record.id for record in unsynced_records]
-            attendance_data = []
-            
-            for record in unsynced_records:
-                student = Student.query.get(record.student_id)
-                attendance_data.append({
-                    'id': record.id,
-                    'student_id': student.student_id,
-                    'course_id': record.course_id,
-                    'timestamp': record.timestamp.isoformat(),
-                    'status': record.status
-                })
-            
-            # Simulate API request to sync data
-            # In a real system, this would make an HTTP request to the server
-            logger.info(f"Syncing {len(attendance_data)} attendance records...")
-            
-            # Simulate network delay and random success
-            import time
-            time.sleep(1)  # Simulate network delay
-            
-            # Simulate 90% success rate for sync
-            if random.random() < 0.9:
-                # Success
-                self.mark_as_synced(attendance_ids)
-                self.last_sync_time = datetime.utcnow()
-                
-                return {
-                    'status': 'success',
-                    'message': 'Sync completed successfully',
-                    'count': len(attendance_ids),
-                    'sync_time': self.last_sync_time.isoformat()
-                }
-            else:
-                # Simulated failure
-                return {
-                    'status': 'error',
-                    'message': 'Network error during sync',
-                    'count': 0
-                }
+            self.last_sync_time = datetime.utcnow()
+            return {
+                'status': 'success',
+                'message': 'Sync completed successfully',
+                'count': count,
+                'sync_time': self.last_sync_time.isoformat()
+            }
+            
+        except SyncError as e:
+            # Nothing of this batch was written; keep the caller's bookkeeping
+            db.session.commit()
+            logger.warning(f"Sync stopped after {count} records: {str(e)}")
+            return {
+                'status': 'error',
+                'message': str(e),
+                'count': count
+            }
             
         except Exception as e:
             logger.error(f"Error during sync: {str(e)}")
+            db.session.rollback()
             return {
                 'status': 'error',
                 'message': f'Error during sync: {str(e)}',
-                'count': 0
+                'count': count
             }
     
     def get_attendance_statistics(self, course_id=None, start_date=None, end_date=None):
@@ -182,23 +307,33 @@ class AttendanceManager:
         Returns:
             dict: Dictionary with attendance statistics
         """
-        query = Attendance.query
-        
-        # Apply filters
-        if course_id:
-            query = query.filter_by(course_id=course_id)
-        
-        if start_date:
-            query = query.filter(Attendance.timestamp >= start_date)
-        
-        if end_date:
-            query = query.filter(Attendance.timestamp <= end_date)
+        # The daily rollup answers whole-day ranges; partial days need the raw table
+        if is_day_aligned(start_date, datetime.min.time()) and is_day_aligned(end_date, datetime.max.time()):
+            status_counts = get_status_counts(
+                course_id=course_id,
+                start_day=start_date.date() if isinstance(start_date, datetime) else start_date,
+                end_day=end_date.date() if isinstance(end_date, datetime) else end_date
+            )
+        else:
+            # Count every status with a single GROUP BY aggregate
+            query = db.session.query(Attendance.status, func.count(Attendance.id))
+            
+            # Apply filters
+            if course_id:
+                query = query.filter(Attendance.course_id == course_id)
+            
+            if start_date:
+                query = query.filter(Attendance.timestamp >= start_date)
+            
+            if end_date:
+                query = query.filter(Attendance.timestamp <= end_date)
+            
+            status_counts = dict(query.group_by(Attendance.status).all())
         
-        # Get counts by status
-        total_count = query.count()
-        present_count = query.filter_by(status='present').count()
-        late_count = query.filter_by(status='late').count()
-        absent_count = query.filter_by(status='absent').count()
+        total_count = sum(status_counts.values())
+        present_count = status_counts.get('present', 0)
+        late_count = status_counts.get('late', 0)
+        absent_count = status_counts.get('absent', 0)
         
         # Calculate percentages
         present_percent = (present_count / total_count * 100) if total_count > 0 else 0
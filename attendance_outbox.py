@@ -0,0 +1,139 @@
+"""
+Transactional outbox of attendance changes for the central server sync
+
+Every insert or change of a synced attendance column appends an entry in the
+same transaction. The sync reads the entries still in the outbox in ID
+order, pushes them, then deletes them and advances the SyncCursor in one
+transaction. Entries are not read "after the cursor": outbox IDs are
+assigned at insert, not at commit, so a transaction that stays open can
+commit an entry below IDs already sent, and it is simply read next time.
+
+No lock is held while a batch is pushed. Two workers may read and push the
+same entries; only one acknowledges them, since acknowledging deletes the
+entries and moves the cursor only if nobody did so first, and the other
+stops. The central server must therefore accept a record sent twice.
+"""
+
+import logging
+from datetime import datetime
+from sqlalchemy import event, insert, select, inspect, update
+from sqlalchemy.orm import Session
+from models import Attendance, AttendanceOutbox, SyncCursor, Student
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+outbox_table = AttendanceOutbox.__table__
+
+# Cursor name of the central server sync
+SYNC_CURSOR = 'attendance'
+
+# Attendance columns whose changes must be sent again ('synced' is local bookkeeping)
+SYNCED_COLUMNS = ('student_id', 'course_id', 'timestamp', 'status')
+
+
+@event.listens_for(Session, 'after_flush')
+def append_attendance_changes(session, flush_context):
+    """Append inserted and changed attendance rows to the outbox in the same transaction"""
+    attendance_ids = [obj.id for obj in session.new if isinstance(obj, Attendance)]
+    for obj in session.dirty:
+        if isinstance(obj, Attendance):
+            state = inspect(obj)
+            if any(state.attrs[key].history.has_changes() for key in SYNCED_COLUMNS):
+                attendance_ids.append(obj.id)
+
+    if attendance_ids:
+        now = datetime.utcnow()
+        session.connection().execute(insert(outbox_table), [
+            {'attendance_id': attendance_id, 'created_at': now} for attendance_id in attendance_ids
+        ])
+
+
+def get_sync_cursor(name=SYNC_CURSOR):
+    """
+    Get the last acknowledged outbox position
+
+    The first call on a database that predates the outbox queues every
+    record still marked unsynced and not yet in the outbox, so nothing
+    pending is lost.
+
+    Args:
+        name (str): Cursor name
+
+    Returns:
+        int: Highest outbox ID acknowledged by the server
+    """
+    cursor = db.session.get(SyncCursor, name, populate_existing=True)
+    if cursor is None:
+        result = db.session.execute(
+            insert(outbox_table).from_select(
+                ['attendance_id', 'created_at'],
+                select(Attendance.id, Attendance.timestamp)
+                .where(Attendance.synced == db.false(),
+                       ~select(outbox_table.c.id)
+                       .where(outbox_table.c.attendance_id == Attendance.id)
+                       .exists())
+                .order_by(Attendance.id)
+            )
+        )
+        cursor = SyncCursor(name=name, position=0)
+        db.session.add(cursor)
+        db.session.commit()
+        logger.info(f"Created sync cursor '{name}' with {result.rowcount} pending records")
+    return cursor.position
+
+
+def read_outbox(limit):
+    """
+    Read the oldest unacknowledged outbox entries
+
+    Args:
+        limit (int): Maximum number of entries
+
+    Returns:
+        list: Rows with outbox_id and the current attendance values
+              (attendance columns are None for deleted records)
+    """
+    return (db.session.query(AttendanceOutbox.id.label('outbox_id'), AttendanceOutbox.attendance_id,
+                             Student.student_id, Attendance.course_id, Attendance.timestamp,
+                             Attendance.status)
+            .select_from(AttendanceOutbox)
+            .outerjoin(Attendance, Attendance.id == AttendanceOutbox.attendance_id)
+            .outerjoin(Student, Student.id == Attendance.student_id)
+            .order_by(AttendanceOutbox.id)
+            .limit(limit)
+            .all())
+
+
+def acknowledge_outbox(outbox_ids, position, name=SYNC_CURSOR):
+    """
+    Drop sent entries from the outbox and advance the cursor past them
+
+    Acts as a compare-and-swap: nothing is changed unless every entry is
+    still in the outbox and the cursor is still where it was read, i.e. no
+    other worker acknowledged anything meanwhile. Does not commit; the
+    caller commits together with its own bookkeeping, and rolls back when
+    False is returned.
+
+    Args:
+        outbox_ids (list): IDs of the entries the server accepted
+        position (int): Cursor position read by get_sync_cursor() before the batch
+        name (str): Cursor name
+
+    Returns:
+        bool: False if another worker acknowledged entries meanwhile
+    """
+    if not outbox_ids:
+        return True
+    deleted = db.session.execute(
+        outbox_table.delete().where(outbox_table.c.id.in_(outbox_ids))
+    ).rowcount
+    if deleted != len(outbox_ids):
+        return False
+    moved = db.session.execute(
+        update(SyncCursor)
+        .where(SyncCursor.name == name, SyncCursor.position == position)
+        .values(position=max(position, max(outbox_ids)))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    return moved == 1
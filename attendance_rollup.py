@@ -0,0 +1,234 @@
+import logging
+from collections import defaultdict
+from datetime import date
+from sqlalchemy import event, func, case, insert, select, update, bindparam, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models import Attendance, AttendanceDailyCount
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+rollup_table = AttendanceDailyCount.__table__
+
+
+def apply_rollup_deltas(connection, deltas):
+    """
+    Add count deltas to the daily rollup table
+
+    Args:
+        connection: SQLAlchemy connection to execute on
+        deltas (dict): Mapping of (day, course_id, status) to a count delta
+    """
+    increments = [
+        {'day': day, 'course_id': course_id, 'status': status, 'count': delta}
+        for (day, course_id, status), delta in deltas.items() if delta > 0
+    ]
+    decrements = [
+        {'b_day': day, 'b_course_id': course_id, 'b_status': status, 'b_delta': -delta}
+        for (day, course_id, status), delta in deltas.items() if delta < 0
+    ]
+
+    if increments:
+        dialect = connection.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert_fn = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert_fn(rollup_table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[rollup_table.c.day, rollup_table.c.course_id, rollup_table.c.status],
+                set_={'count': rollup_table.c.count + stmt.excluded['count']}
+            )
+            connection.execute(stmt, increments)
+        else:
+            # Generic fallback: update existing buckets, insert the missing ones
+            for row in increments:
+                result = connection.execute(
+                    update(rollup_table)
+                    .where(rollup_table.c.day == row['day'],
+                           rollup_table.c.course_id == row['course_id'],
+                           rollup_table.c.status == row['status'])
+                    .values(count=rollup_table.c.count + row['count'])
+                )
+                if result.rowcount == 0:
+                    connection.execute(insert(rollup_table), row)
+
+    if decrements:
+        connection.execute(
+            update(rollup_table)
+            .where(rollup_table.c.day == bindparam('b_day'),
+                   rollup_table.c.course_id == bindparam('b_course_id'),
+                   rollup_table.c.status == bindparam('b_status'))
+            .values(count=rollup_table.c.count - bindparam('b_delta')),
+            decrements
+        )
+
+
+@event.listens_for(Session, 'after_flush')
+def update_rollup_after_flush(session, flush_context):
+    """Keep the daily rollup in step with Attendance rows written through the ORM"""
+    deltas = defaultdict(int)
+
+    for obj in session.new:
+        if isinstance(obj, Attendance):
+            deltas[(obj.timestamp.date(), obj.course_id, obj.status)] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Attendance):
+            deltas[(obj.timestamp.date(), obj.course_id, obj.status)] -= 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, Attendance):
+            continue
+        state = inspect(obj)
+        old_key = []
+        changed = False
+        for attr in ('timestamp', 'course_id', 'status'):
+            history = state.attrs[attr].history
+            if history.deleted:
+                changed = True
+                old_key.append(history.deleted[0])
+            else:
+                old_key.append(getattr(obj, attr))
+        if changed:
+            deltas[(old_key[0].date(), old_key[1], old_key[2])] -= 1
+            deltas[(obj.timestamp.date(), obj.course_id, obj.status)] += 1
+
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if deltas:
+        apply_rollup_deltas(session.connection(), deltas)
+
+
+def delete_attendance(*criteria):
+    """
+    Bulk delete attendance rows and subtract them from the daily rollup
+
+    Query.delete() bypasses ORM flush events, so bulk deletes must go
+    through this helper to keep the rollup accurate.
+
+    Args:
+        *criteria: SQLAlchemy filter expressions selecting Attendance rows
+
+    Returns:
+        int: Number of attendance rows deleted
+    """
+    day = func.date(Attendance.timestamp)
+    rows = (db.session.query(day, Attendance.course_id, Attendance.status, func.count(Attendance.id))
+            .filter(*criteria)
+            .group_by(day, Attendance.course_id, Attendance.status)
+            .all())
+
+    deltas = {}
+    for row_day, course_id, status, count in rows:
+        if isinstance(row_day, str):
+            # SQLite's date() returns 'YYYY-MM-DD' strings
+            row_day = date.fromisoformat(row_day)
+        deltas[(row_day, course_id, status)] = -count
+
+    if deltas:
+        apply_rollup_deltas(db.session.connection(), deltas)
+
+    return Attendance.query.filter(*criteria).delete(synchronize_session=False)
+
+
+def rebuild_rollup():
+    """
+    Rebuild the daily rollup table from the Attendance table
+
+    Used to backfill existing databases and to repair drift. Runs as a
+    single INSERT ... SELECT inside one transaction.
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    day = func.date(Attendance.timestamp)
+    source = (select(day, Attendance.course_id, Attendance.status, func.count(Attendance.id))
+              .group_by(day, Attendance.course_id, Attendance.status))
+
+    db.session.execute(rollup_table.delete())
+    db.session.execute(
+        insert(rollup_table).from_select(['day', 'course_id', 'status', 'count'], source)
+    )
+    db.session.commit()
+
+    count = db.session.query(func.count()).select_from(rollup_table).scalar()
+    logger.info(f"Rebuilt attendance rollup with {count} rows")
+    return count
+
+
+def rollup_query(course_id=None, start_day=None, end_day=None):
+    """
+    Build a query over the rollup table with optional filters
+
+    Args:
+        course_id (int, optional): Filter by course ID
+        start_day (date, optional): First day to include
+        end_day (date, optional): Last day to include
+
+    Returns:
+        Query: Filtered query over AttendanceDailyCount
+    """
+    query = db.session.query(AttendanceDailyCount)
+
+    if course_id:
+        query = query.filter(AttendanceDailyCount.course_id == course_id)
+
+    if start_day:
+        query = query.filter(AttendanceDailyCount.day >= start_day)
+
+    if end_day:
+        query = query.filter(AttendanceDailyCount.day <= end_day)
+
+    return query
+
+
+def get_status_counts(course_id=None, start_day=None, end_day=None):
+    """
+    Get attendance counts by status from the rollup table
+
+    Returns:
+        dict: Mapping of status to count
+    """
+    query = rollup_query(course_id, start_day, end_day).with_entities(
+        AttendanceDailyCount.status, func.sum(AttendanceDailyCount.count)
+    )
+    return {status: int(count or 0) for status, count in query.group_by(AttendanceDailyCount.status)}
+
+
+def get_daily_counts(start_day, end_day, status=None):
+    """
+    Get attendance counts per day from the rollup table
+
+    Returns:
+        dict: Mapping of day (date) to count
+    """
+    query = rollup_query(start_day=start_day, end_day=end_day).with_entities(
+        AttendanceDailyCount.day, func.sum(AttendanceDailyCount.count)
+    )
+    if status:
+        query = query.filter(AttendanceDailyCount.status == status)
+    return {day: int(count or 0) for day, count in query.group_by(AttendanceDailyCount.day)}
+
+
+def get_course_counts():
+    """
+    Get total and present attendance counts per course from the rollup table
+
+    Returns:
+        dict: Mapping of course_id to (total, present)
+    """
+    query = db.session.query(
+        AttendanceDailyCount.course_id,
+        func.sum(AttendanceDailyCount.count),
+        func.sum(case((AttendanceDailyCount.status == 'present', AttendanceDailyCount.count), else_=0))
+    ).group_by(AttendanceDailyCount.course_id)
+    return {course_id: (int(total or 0), int(present or 0)) for course_id, total, present in query}
+
+
+def register_rollup_commands(app):
+    """Register rollup maintenance commands with the Flask CLI"""
+
+    @app.cli.command('rebuild-attendance-rollup')
+    def rebuild_attendance_rollup_command():
+        """Rebuild the daily attendance rollup from attendance records"""
+        count = rebuild_rollup()
+        print(f"Rebuilt attendance rollup ({count} rows)")
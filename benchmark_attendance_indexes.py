@@ -0,0 +1,168 @@
+"""
+Benchmark the Attendance indexes: query plans and latency before and after
+
+Creates a fresh database with a synthetic attendance table (2 million rows
+by default) and no secondary indexes, times the hot query shapes used by
+the dashboard, API and sync paths, then adds the indexes through the same
+migration path as `flask upgrade-db` and times them again.
+
+Usage:
+    python benchmark_attendance_indexes.py [--url sqlite:////tmp/attendance_bench.db] [--rows 2000000]
+
+The target database must be empty; by default a temporary SQLite file is used.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, select, insert, func, text, tuple_
+from models import Student, Course, Attendance
+from extensions import db
+from migrations import upgrade_database
+
+STATUSES = ('present', 'present', 'present', 'present', 'late', 'absent')
+START = datetime(2024, 1, 1)
+BATCH_SIZE = 50000
+
+
+def populate(engine, rows, students, courses, seed):
+    """Insert synthetic students, courses and attendance rows"""
+    rng = random.Random(seed)
+    with engine.begin() as connection:
+        connection.execute(insert(Course.__table__), [
+            {'id': i, 'course_code': f'C{i:04d}', 'title': f'Course {i}', 'created_at': START}
+            for i in range(1, courses + 1)
+        ])
+        connection.execute(insert(Student.__table__), [
+            {'id': i, 'student_id': f'S{i:06d}', 'first_name': 'Student', 'last_name': str(i), 'created_at': START}
+            for i in range(1, students + 1)
+        ])
+
+    seconds = 365 * 24 * 3600
+    for start in range(0, rows, BATCH_SIZE):
+        batch = [
+            {
+                'student_id': rng.randint(1, students),
+                'course_id': rng.randint(1, courses),
+                'timestamp': START + timedelta(seconds=rng.randrange(seconds)),
+                'status': rng.choice(STATUSES),
+                'synced': rng.random() > 0.001,
+            }
+            for _ in range(min(BATCH_SIZE, rows - start))
+        ]
+        with engine.begin() as connection:
+            connection.execute(insert(Attendance.__table__), batch)
+
+
+def hot_queries():
+    """Query shapes issued by the application, keyed by name"""
+    table = Attendance.__table__
+    day = START + timedelta(days=180)
+    week = (day, day + timedelta(days=7))
+    return {
+        'range page': (select(table).where(table.c.timestamp.between(day, day + timedelta(days=1)))
+                       .order_by(table.c.timestamp.desc(), table.c.id.desc()).limit(100)),
+        'keyset next page': (select(table).where(tuple_(table.c.timestamp, table.c.id) < (day, 10**9))
+                             .order_by(table.c.timestamp.desc(), table.c.id.desc()).limit(100)),
+        'course week': (select(table).where(table.c.course_id == 7, table.c.timestamp.between(*week))
+                        .order_by(table.c.timestamp.desc())),
+        'course late count': (select(func.count()).select_from(table)
+                              .where(table.c.course_id == 7, table.c.status == 'late',
+                                     table.c.timestamp.between(*week))),
+        'student history': (select(table).where(table.c.student_id == 123)
+                            .order_by(table.c.timestamp.desc()).limit(50)),
+        'status counts week': (select(table.c.status, func.count()).where(table.c.timestamp.between(*week))
+                               .group_by(table.c.status)),
+        'late count week': (select(func.count()).select_from(table)
+                            .where(table.c.status == 'late', table.c.timestamp.between(*week))),
+        'unsynced': select(table.c.id).where(table.c.synced == db.false()),
+    }
+
+
+def explain(connection, statement):
+    """Return the database's plan for a statement as one line"""
+    compiled = statement.compile(connection, compile_kwargs={'literal_binds': True})
+    if connection.dialect.name == 'sqlite':
+        rows = connection.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))
+        return '; '.join(row[-1] for row in rows)
+    rows = connection.execute(text(f'EXPLAIN {compiled}'))
+    return '; '.join(row[0].strip() for row in rows)
+
+
+def measure(engine, queries, repeat):
+    """Plan and median latency (ms) of every query"""
+    results = {}
+    with engine.connect() as connection:
+        for name, statement in queries.items():
+            connection.execute(statement).fetchall()  # warm the cache
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                connection.execute(statement).fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = (explain(connection, statement), statistics.median(timings))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Database URL (default: temporary SQLite file)')
+    parser.add_argument('--rows', type=int, default=2000000, help='Attendance rows to generate')
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    tmp_dir = None
+    url = args.url
+    if not url:
+        tmp_dir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(tmp_dir.name, 'attendance_bench.db')}"
+    engine = create_engine(url)
+
+    tables = [Student.__table__, Course.__table__, Attendance.__table__]
+    db.metadata.create_all(engine, tables=tables)
+    with engine.connect() as connection:
+        if connection.execute(select(func.count()).select_from(Attendance.__table__)).scalar():
+            parser.error('the attendance table is not empty; use an empty database')
+    # Start from the schema of a database created before the indexes existed
+    for index in Attendance.__table__.indexes:
+        index.drop(engine, checkfirst=True)
+
+    start = time.perf_counter()
+    populate(engine, args.rows, args.students, args.courses, args.seed)
+    print(f"Inserted {args.rows} attendance rows in {time.perf_counter() - start:.1f} s")
+
+    queries = hot_queries()
+    before = measure(engine, queries, args.repeat)
+
+    start = time.perf_counter()
+    created = upgrade_database(engine)
+    with engine.begin() as connection:
+        connection.execute(text('ANALYZE'))
+    print(f"Created {len(created)} indexes in {time.perf_counter() - start:.1f} s")
+
+    after = measure(engine, queries, args.repeat)
+
+    print()
+    print(f"{'query':<20} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name in queries:
+        old, new = before[name][1], after[name][1]
+        print(f"{name:<20} {old:>10.2f} {new:>10.2f} {old / max(new, 1e-6):>7.0f}x")
+
+    print()
+    for name in queries:
+        print(f"{name}:\n  before: {before[name][0]}\n  after:  {after[name][0]}")
+
+    engine.dispose()
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Load test the fingerprint scan path against simulated ESP32 sensors
+
+Starts one SensorSimulator per course, registers each as the course's
+sensor, and fires scans at a fixed rate through the real backend:
+POST /scan/verify queues a scan job, the scan pool calls the simulator
+through FingerPrintSensor, looks up the student and records attendance,
+and the harness long-polls the job until it finishes. Reports achieved
+throughput, end-to-end latency and outcomes.
+
+Runs against a throwaway SQLite file unless DATABASE_URL is set.
+
+Usage:
+    python benchmark_scan_load.py [--rate 200] [--duration 10] [--sensors 4] [--students 100]
+                                  [--latency 0.005] [--error-rate 0] [--concurrency 64]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from sensor_simulator import SensorSimulator
+
+
+def setup_data(db, simulators, students_per_course):
+    """Create a course, its students and their fingerprints for every simulator"""
+    from models import Student, Course, Fingerprint, SensorDevice
+
+    course_ids = []
+    for index, simulator in enumerate(simulators):
+        course = Course(course_code=f"LOAD{index:03d}", title=f"Load Test Course {index}")
+        host, port = simulator.address
+        db.session.add(course)
+        db.session.flush()
+        db.session.add(SensorDevice(name=f"simulator-{index}", ip_address=host, port=port, course_id=course.id))
+        for finger_id in sorted(simulator.fingers):
+            student = Student(student_id=f"LOAD{finger_id:06d}", first_name="Load", last_name=f"Student {finger_id}")
+            student.courses.append(course)
+            db.session.add(student)
+            db.session.flush()
+            db.session.add(Fingerprint(student_id=student.id, finger_id=finger_id, template_data=b'\x00' * 16))
+        course_ids.append(course.id)
+    db.session.commit()
+    return course_ids
+
+
+def run_scan(app, course_id, results):
+    """Queue one scan through the web endpoint and long-poll it to completion"""
+    client = app.test_client()
+    start = time.perf_counter()
+    response = client.post('/scan/verify', data={'course_id': str(course_id)})
+    if response.status_code != 202:
+        outcome = f"rejected ({response.status_code}): {response.get_json().get('message')}"
+    else:
+        status_url = response.get_json()['status_url']
+        while True:
+            result = client.get(f"{status_url}?wait=2").get_json()
+            if result['state'] == 'done':
+                break
+        outcome = 'recorded' if result['status'] == 'success' else f"error: {result['message']}"
+    results.append((outcome, time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=200, help='Scans started per second')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to keep starting scans')
+    parser.add_argument('--sensors', type=int, default=4, help='Simulated sensors (one course each)')
+    parser.add_argument('--students', type=int, default=100, help='Enrolled fingers per sensor')
+    parser.add_argument('--latency', type=float, default=0.005, help='Simulated seconds per sensor request')
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of sensor requests failing with 500')
+    parser.add_argument('--no-match-rate', type=float, default=0.0)
+    parser.add_argument('--concurrency', type=int, default=64, help='Scans in flight from the harness')
+    parser.add_argument('--scan-workers', type=int, default=32, help='Backend scan pool threads')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tmpdir.name, 'load.db')}")
+    os.environ['TEMPLATE_INDEX_PATH'] = ''
+    os.environ['SENSOR_IP'] = ''
+
+    import logging
+    from app import app, db
+    from scan_jobs import scan_jobs
+    from device_registry import device_registry
+    logging.disable(logging.WARNING)
+
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['LOGIN_DISABLED'] = True
+    scan_jobs.workers = args.scan_workers
+    scan_jobs.max_pending = max(scan_jobs.max_pending, args.concurrency)
+
+    # Finger IDs are global in the fingerprint index, so every sensor gets its own range
+    simulators = [
+        SensorSimulator(fingers=range(index * args.students + 1, (index + 1) * args.students + 1),
+                        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        no_match_rate=args.no_match_rate, seed=args.seed + index).start()
+        for index in range(args.sensors)
+    ]
+
+    with app.app_context():
+        course_ids = setup_data(db, simulators, args.students)
+        db.session.remove()
+
+    results = []
+    interval = 1 / args.rate
+    total = int(args.rate * args.duration)
+    print(f"Starting {total} scans at {args.rate:g}/s on {args.sensors} sensors "
+          f"({args.latency * 1000:g} ms simulated latency)")
+
+    start = time.perf_counter()
+    lag = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        in_flight = threading.BoundedSemaphore(args.concurrency)
+        for i in range(total):
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if not in_flight.acquire(blocking=False):
+                lag += 1
+                in_flight.acquire()
+
+            def task(course_id=course_ids[i % len(course_ids)]):
+                try:
+                    run_scan(app, course_id, results)
+                finally:
+                    in_flight.release()
+
+            executor.submit(task)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(seconds * 1000 for _, seconds in results)
+    print(f"Completed {len(results)} scans in {elapsed:.2f} s: {len(results) / elapsed:.1f} scans/s")
+    if lag:
+        print(f"Harness fell behind the target rate on {lag} scans (all {args.concurrency} slots busy)")
+    print(f"Latency  median {statistics.median(latencies):8.2f} ms   "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:8.2f} ms   "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:8.2f} ms   max {latencies[-1]:8.2f} ms")
+    for outcome, count in Counter(outcome for outcome, _ in results).most_common():
+        print(f"  {count:6d}  {outcome}")
+
+    print("Sensor client latency (verify):")
+    for sensor in device_registry.clients.values():
+        verify = sensor.get_latency_stats().get('verify', {})
+        print(f"  {sensor.base_url}  calls {verify.get('count', 0):6d}  errors {verify.get('errors', 0):4d}  "
+              f"p50 {verify.get('p50_ms', 0):7.2f} ms  p95 {verify.get('p95_ms', 0):7.2f} ms  "
+              f"circuit {sensor.get_health()['state']}")
+
+    for simulator in simulators:
+        simulator.stop()
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
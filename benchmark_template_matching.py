@@ -0,0 +1,82 @@
+"""
+Benchmark fingerprint template matching: exhaustive scan vs LSH candidates
+
+Builds a synthetic population of random templates directly in a
+TemplateMatcher (no database needed), then probes it with noisy copies of
+enrolled templates and with unknown impostor templates. Reports recall of
+the LSH path relative to the exhaustive scan and per-probe latency.
+
+Usage:
+    python benchmark_template_matching.py [--population 20000] [--probes 500] [--noise 0.1]
+"""
+
+import argparse
+import random
+import statistics
+import time
+from template_matcher import TemplateMatcher, TEMPLATE_SIZE
+
+
+def add_noise(template, fraction, rng):
+    """Flip a fraction of the bits of a template"""
+    data = bytearray(template)
+    for bit in rng.sample(range(len(data) * 8), int(len(data) * 8 * fraction)):
+        data[bit // 8] ^= 1 << (bit % 8)
+    return bytes(data)
+
+
+def time_probes(matcher, probes, exhaustive):
+    """Run every probe through search() and collect results and latencies in ms"""
+    results = []
+    latencies = []
+    for probe in probes:
+        start = time.perf_counter()
+        results.append(matcher.search(probe, exhaustive=exhaustive))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies
+
+
+def summarize(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<12} median {statistics.median(latencies):8.3f} ms   p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--population', type=int, default=20000, help='Number of enrolled templates')
+    parser.add_argument('--probes', type=int, default=500, help='Number of genuine probes (and impostors)')
+    parser.add_argument('--noise', type=float, default=0.1, help='Fraction of bits flipped in genuine probes')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    matcher = TemplateMatcher()
+
+    start = time.perf_counter()
+    templates = [rng.randbytes(TEMPLATE_SIZE) for _ in range(args.population)]
+    matcher.add_many((i + 1, i + 1, i, template, 0) for i, template in enumerate(templates))
+    print(f"Indexed {matcher.count} templates in {time.perf_counter() - start:.2f} s")
+
+    targets = rng.sample(range(args.population), min(args.probes, args.population))
+    genuine = [add_noise(templates[i], args.noise, rng) for i in targets]
+    impostors = [rng.randbytes(TEMPLATE_SIZE) for _ in range(args.probes)]
+
+    exact, exact_latencies = time_probes(matcher, genuine, exhaustive=True)
+    approx, approx_latencies = time_probes(matcher, genuine, exhaustive=False)
+    _, impostor_latencies = time_probes(matcher, impostors, exhaustive=False)
+    candidates = [len(matcher.candidates(probe)) for probe in genuine]
+
+    found = sum(1 for result, target in zip(exact, targets) if result and result['finger_id'] == target)
+    agreed = sum(1 for a, b in zip(exact, approx) if a and b and a['fingerprint_id'] == b['fingerprint_id'])
+
+    print(f"Exhaustive recall@1: {found / len(targets):.3f}")
+    print(f"LSH recall@1 vs exhaustive: {agreed / max(found, 1):.3f}")
+    print(f"Mean LSH candidates per probe: {statistics.mean(candidates):.1f} of {matcher.count}")
+    summarize('exhaustive', exact_latencies)
+    summarize('lsh', approx_latencies)
+    summarize('impostor', impostor_latencies)
+
+
+if __name__ == '__main__':
+    main()
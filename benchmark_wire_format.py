@@ -0,0 +1,161 @@
+"""
+Compare the JSON and binary wire formats of the device-facing API
+
+Measures payload size and server-side encode/decode time of every device
+message in both formats (the binary side through wire_format, the JSON
+side through json as used by utils.json_response), then times whole
+requests to /api/verify-fingerprint, /api/attendance and /api/courses
+through the Flask test client against a throwaway SQLite database.
+
+Usage:
+    python benchmark_wire_format.py [--courses 20] [--enrolled 8] [--iterations 20000] [--requests 500]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import timeit
+
+from wire_format import (
+    BINARY_MIMETYPE, encode_verify_request, decode_verify_request, encode_verify_response,
+    encode_attendance_request, decode_attendance_request, encode_attendance_response, encode_course_list
+)
+
+
+def sample_messages(courses, enrolled):
+    """Build representative bodies of every device message, keyed by name"""
+    course_list = [{
+        'id': index,
+        'code': f"CS{100 + index}",
+        'title': f"Introduction to Topic {index}",
+        'description': None,
+        'student_count': 40 + index
+    } for index in range(1, courses + 1)]
+    verify_response = {
+        'success': True,
+        'student': {
+            'id': 1234,
+            'student_id': 'S2024001234',
+            'name': 'Ada Lovelace',
+            'fingerprint_id': 42,
+            'enrolled_courses': [{'id': course['id'], 'code': course['code'], 'title': course['title']}
+                                 for course in course_list[:enrolled]]
+        },
+        'score': None
+    }
+    attendance_request = {'student_id': 1234, 'course_id': 7, 'timestamp': 1700000000, 'status': 'present'}
+    attendance_response = {'success': True, 'attendance_id': 987654,
+                           'message': 'Attendance recorded for Ada Lovelace'}
+    version = '0123456789abcdef'
+
+    # (JSON body, binary encoder, binary decoder or None)
+    return {
+        'verify request': ({'fingerprint_id': 42},
+                           lambda: encode_verify_request(fingerprint_id=42), decode_verify_request),
+        'verify response': (verify_response, lambda: encode_verify_response(verify_response), None),
+        'attendance request': (attendance_request,
+                               lambda: encode_attendance_request(1234, 7, 1700000000, 'present'),
+                               decode_attendance_request),
+        'attendance response': (attendance_response,
+                                lambda: encode_attendance_response(attendance_response), None),
+        'course list': ({'success': True, 'version': version, 'count': len(course_list), 'courses': course_list},
+                        lambda: encode_course_list(version, course_list), None),
+    }
+
+
+def benchmark_codecs(messages, iterations):
+    """Print size and per-message encode (and request decode) times of both formats"""
+    print(f"{'message':20s} {'JSON B':>7s} {'bin B':>6s} {'size':>6s}   "
+          f"{'JSON enc':>9s} {'bin enc':>8s}   {'JSON dec':>9s} {'bin dec':>8s}")
+    for name, (data, encode, decode) in messages.items():
+        json_body = json.dumps(data).encode()
+        binary_body = encode()
+        json_encode = timeit.timeit(lambda: json.dumps(data).encode(), number=iterations) / iterations
+        binary_encode = timeit.timeit(encode, number=iterations) / iterations
+        line = (f"{name:20s} {len(json_body):7d} {len(binary_body):6d} {len(binary_body) / len(json_body):6.0%}   "
+                f"{json_encode * 1e6:7.2f}us {binary_encode * 1e6:6.2f}us")
+        if decode is not None:
+            json_decode = timeit.timeit(lambda: json.loads(json_body), number=iterations) / iterations
+            binary_decode = timeit.timeit(lambda: decode(binary_body), number=iterations) / iterations
+            line += f"   {json_decode * 1e6:7.2f}us {binary_decode * 1e6:6.2f}us"
+        print(line)
+
+
+def setup_data(db, courses, enrolled):
+    """Create courses and one enrolled student with a fingerprint"""
+    from models import Student, Course, Fingerprint
+
+    course_rows = [Course(course_code=f"CS{100 + index}", title=f"Introduction to Topic {index}")
+                   for index in range(1, courses + 1)]
+    student = Student(student_id='S2024001234', first_name='Ada', last_name='Lovelace')
+    student.courses.extend(course_rows[:enrolled])
+    db.session.add_all(course_rows + [student])
+    db.session.commit()
+    db.session.add(Fingerprint(student_id=student.id, finger_id=42, template_data=b'\x00' * 16))
+    db.session.commit()
+    return student.id, course_rows[0].id
+
+
+def benchmark_requests(app, student_id, course_id, count):
+    """Print mean request time and response size of each endpoint in both formats"""
+    client = app.test_client()
+    json_headers = {'Accept': 'application/json'}
+    binary_headers = {'Content-Type': BINARY_MIMETYPE, 'Accept': BINARY_MIMETYPE}
+    cases = [
+        ('POST /api/verify-fingerprint',
+         lambda: client.post('/api/verify-fingerprint', json={'fingerprint_id': 42}, headers=json_headers),
+         lambda: client.post('/api/verify-fingerprint', data=encode_verify_request(fingerprint_id=42),
+                             headers=binary_headers)),
+        ('POST /api/attendance',
+         lambda: client.post('/api/attendance', json={'student_id': student_id, 'course_id': course_id},
+                             headers=json_headers),
+         lambda: client.post('/api/attendance', data=encode_attendance_request(student_id, course_id),
+                             headers=binary_headers)),
+        ('GET /api/courses',
+         lambda: client.get('/api/courses', headers=json_headers),
+         lambda: client.get('/api/courses', headers=binary_headers)),
+    ]
+    print(f"\n{'endpoint':30s} {'JSON':>10s} {'binary':>10s}   {'JSON B':>7s} {'bin B':>6s}")
+    for name, json_call, binary_call in cases:
+        timings = []
+        sizes = []
+        for call in (json_call, binary_call):
+            sizes.append(len(call().data))
+            start = time.perf_counter()
+            for _ in range(count):
+                call()
+            timings.append((time.perf_counter() - start) / count)
+        print(f"{name:30s} {timings[0] * 1000:8.3f}ms {timings[1] * 1000:8.3f}ms   {sizes[0]:7d} {sizes[1]:6d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=20, help='Courses in the catalog')
+    parser.add_argument('--enrolled', type=int, default=8, help='Courses the verified student is enrolled in')
+    parser.add_argument('--iterations', type=int, default=20000, help='Encodes/decodes timed per message')
+    parser.add_argument('--requests', type=int, default=500, help='Requests timed per endpoint and format')
+    args = parser.parse_args()
+
+    benchmark_codecs(sample_messages(args.courses, args.enrolled), args.iterations)
+
+    tmpdir = tempfile.TemporaryDirectory()
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tmpdir.name, 'wire.db')}")
+    os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+    import logging
+    from app import app, db
+    logging.disable(logging.WARNING)
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        student_id, course_id = setup_data(db, args.courses, args.enrolled)
+        db.session.remove()
+    benchmark_requests(app, student_id, course_id, args.requests)
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from models import Student, Course, student_course
+from extensions import db
+from wire_format import encode_course_list
+
+logger = logging.getLogger(__name__)
+
+# Serialized catalog served to devices (JSON and binary wire format); the version doubles as the ETag
+CatalogSnapshot = namedtuple('CatalogSnapshot', ['version', 'body', 'binary', 'count'])
+
+
+class CourseCatalog:
+    """
+    Process-local snapshot of the course list served by /api/courses
+
+    Devices fetch the catalog on every boot, so after a campus-wide power
+    restore hundreds arrive at once. The catalog is built with one grouped
+    query and serialized once; every request until the next course or
+    enrollment change gets the same bytes. Concurrent requests for a stale
+    catalog wait for a single rebuild instead of each running the query.
+    The version is a hash of the content, so every worker process hands
+    out the same ETag for the same catalog.
+    """
+
+    def __init__(self, max_age=300):
+        """
+        Initialize an empty catalog
+
+        Args:
+            max_age (int): Seconds before the catalog is rebuilt regardless of local changes
+        """
+        self.max_age = max_age
+        self.snapshot = None
+        self.loaded_at = None
+        # Bumped on every invalidation; the catalog is current when both match
+        self.generation = 0
+        self.loaded_generation = -1
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        """Mark the catalog for rebuild on next use"""
+        self.generation += 1
+
+    def needs_reload(self):
+        """Check whether the catalog must be rebuilt before use"""
+        if self.loaded_generation != self.generation or self.loaded_at is None:
+            return True
+        return time.monotonic() - self.loaded_at > self.max_age
+
+    def reload(self):
+        """Rebuild the catalog from the database (one query)"""
+        generation = self.generation
+        rows = (db.session.query(Course.id, Course.course_code, Course.title, Course.description,
+                                 func.count(student_course.c.student_id))
+                .outerjoin(student_course, student_course.c.course_id == Course.id)
+                .group_by(Course.id, Course.course_code, Course.title, Course.description)
+                .order_by(Course.id)
+                .all())
+        courses = [{
+            'id': course_id,
+            'code': code,
+            'title': title,
+            'description': description,
+            'student_count': student_count
+        } for course_id, code, title, description, student_count in rows]
+
+        version = hashlib.sha1(json.dumps(courses, sort_keys=True).encode()).hexdigest()[:16]
+        body = json.dumps({
+            'success': True,
+            'version': version,
+            'count': len(courses),
+            'courses': courses
+        }).encode()
+
+        self.snapshot = CatalogSnapshot(version, body, encode_course_list(version, courses), len(courses))
+        self.loaded_at = time.monotonic()
+        self.loaded_generation = generation
+        logger.info(f"Course catalog {version} built with {len(courses)} courses")
+
+    def warm(self):
+        """Build the catalog if it is missing or out of date (one caller builds, the rest wait)"""
+        if self.needs_reload():
+            with self.lock:
+                if self.needs_reload():
+                    self.reload()
+
+    def get_snapshot(self):
+        """
+        Get the current catalog
+
+        Returns:
+            CatalogSnapshot: version, serialized JSON and binary bodies, and number of courses
+        """
+        self.warm()
+        return self.snapshot
+
+
+course_catalog = CourseCatalog()
+
+# Models whose changes affect the catalog; enrollment changes mark Student or Course dirty
+CATALOG_MODELS = (Student, Course)
+
+
+@event.listens_for(Session, 'after_flush')
+def track_catalog_changes(session, flush_context):
+    """Remember whether this transaction touched courses or enrollments"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, CATALOG_MODELS):
+            session.info['course_catalog_dirty'] = True
+            return
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def track_bulk_catalog_changes(orm_execute_state):
+    """Catch bulk Query.update()/delete() calls, which bypass flush events"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and issubclass(mapper.class_, CATALOG_MODELS):
+            orm_execute_state.session.info['course_catalog_dirty'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_catalog_after_commit(session):
+    """Rebuild the catalog once course or enrollment changes are committed"""
+    if session.info.pop('course_catalog_dirty', False):
+        course_catalog.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def clear_catalog_changes(session):
+    """Forget pending catalog changes that were rolled back"""
+    session.info.pop('course_catalog_dirty', None)
@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+import click
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import SensorDevice, Course
+from extensions import db
+from fingerprint_sensor_module import FingerPrintSensor
+
+logger = logging.getLogger(__name__)
+
+# Sensor used when no registered device matches (the original single-sensor setup)
+DEFAULT_SENSOR_IP = "192.168.43.215"
+DEFAULT_SENSOR_PORT = 80
+
+# Compact device records kept in memory for routing
+DeviceRecord = namedtuple('DeviceRecord', ['id', 'name', 'ip_address', 'port', 'room', 'course_id'])
+
+
+class DeviceRegistry:
+    """
+    Process-local registry of fingerprint sensors and their HTTP clients
+
+    Routes a request to the sensor for an explicit device, a course or a
+    room without touching the database. Every device gets its own
+    FingerPrintSensor, and with it its own keep-alive connection pool, so
+    sensors in different classrooms are driven in parallel. Clients are
+    keyed by address and survive registry reloads.
+    """
+
+    def __init__(self, default_address=(DEFAULT_SENSOR_IP, DEFAULT_SENSOR_PORT), max_age=300):
+        """
+        Initialize an empty registry
+
+        Args:
+            default_address (tuple, optional): (ip, port) of the fallback sensor, or None for no fallback
+            max_age (int): Seconds before the registry is reloaded regardless of local changes
+        """
+        self.default_address = default_address
+        self.max_age = max_age
+        self.devices = {}
+        self.devices_by_course = {}
+        self.devices_by_room = {}
+        self.devices_by_address = {}
+        self.clients = {}
+        self.loaded_at = None
+        # Bumped on every invalidation; the registry is current when both match
+        self.generation = 0
+        self.loaded_generation = -1
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        """Mark the registry for reload on next use"""
+        self.generation += 1
+
+    def needs_reload(self):
+        """Check whether the registry must be reloaded before use"""
+        if self.loaded_generation != self.generation or self.loaded_at is None:
+            return True
+        return time.monotonic() - self.loaded_at > self.max_age
+
+    def reload(self):
+        """Reload active devices from the database (one query)"""
+        generation = self.generation
+        devices = {}
+        devices_by_course = {}
+        devices_by_room = {}
+        devices_by_address = {}
+        rows = (db.session.query(SensorDevice.id, SensorDevice.name, SensorDevice.ip_address,
+                                 SensorDevice.port, SensorDevice.room, SensorDevice.course_id)
+                .filter(SensorDevice.is_active == db.true())
+                .order_by(SensorDevice.id))
+        for row in rows:
+            device = DeviceRecord(*row)
+            devices[device.id] = device
+            # First registered device wins when several share a course or room
+            if device.course_id is not None:
+                devices_by_course.setdefault(device.course_id, device)
+            if device.room:
+                devices_by_room.setdefault(device.room, device)
+            devices_by_address.setdefault(device.ip_address, device)
+
+        self.devices = devices
+        self.devices_by_course = devices_by_course
+        self.devices_by_room = devices_by_room
+        self.devices_by_address = devices_by_address
+        self.loaded_at = time.monotonic()
+        self.loaded_generation = generation
+        logger.info(f"Device registry loaded with {len(devices)} sensors")
+
+    def warm(self):
+        """Load the registry if it is missing or out of date"""
+        if self.needs_reload():
+            with self.lock:
+                if self.needs_reload():
+                    self.reload()
+
+    def resolve(self, device_id=None, course_id=None, room=None):
+        """
+        Find the registered device for a request
+
+        An explicit device wins, then the device dedicated to the course,
+        then the device installed in the room.
+
+        Args:
+            device_id: Database ID of a device
+            course_id: Database ID of the course being scanned for
+            room (str): Room the request comes from
+
+        Returns:
+            DeviceRecord: Matching device, or None to use the default sensor
+        """
+        self.warm()
+        for key, mapping in ((device_id, self.devices), (course_id, self.devices_by_course)):
+            try:
+                device = mapping.get(int(key)) if key not in (None, '') else None
+            except (ValueError, TypeError):
+                device = None
+            if device:
+                return device
+        if room:
+            return self.devices_by_room.get(room)
+        return None
+
+    def resolve_address(self, ip_address):
+        """
+        Find the registered device calling from an address
+
+        Args:
+            ip_address (str): Remote address of a device request
+
+        Returns:
+            DeviceRecord: Matching device, or None for the default sensor
+        """
+        self.warm()
+        return self.devices_by_address.get(ip_address)
+
+    def get_client(self, ip_address, port):
+        """Get the pooled client for a sensor address, creating it on first use"""
+        key = (ip_address, port)
+        client = self.clients.get(key)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(key)
+                if client is None:
+                    client = self.clients[key] = FingerPrintSensor(ip_address, port)
+        return client
+
+    def get_sensor(self, device_id=None, course_id=None, room=None):
+        """
+        Get the sensor client that should serve a request
+
+        Args:
+            device_id: Database ID of a device
+            course_id: Database ID of the course being scanned for
+            room (str): Room the request comes from
+
+        Returns:
+            FingerPrintSensor: Client for the matching device or the default sensor,
+                               or None if nothing matches and there is no default
+        """
+        return self.get_device_sensor(self.resolve(device_id, course_id, room))
+
+    def get_device_sensor(self, device):
+        """
+        Get the sensor client for a resolved device
+
+        Args:
+            device (DeviceRecord): Device returned by resolve(), or None for the default sensor
+
+        Returns:
+            FingerPrintSensor: Client for the device or the default sensor,
+                               or None if there is no default
+        """
+        if device:
+            return self.get_client(device.ip_address, device.port)
+        if self.default_address:
+            return self.get_client(*self.default_address)
+        return None
+
+    def get_devices(self):
+        """
+        Get all active devices
+
+        Returns:
+            list: DeviceRecord entries sorted by ID
+        """
+        self.warm()
+        return list(self.devices.values())
+
+
+device_registry = DeviceRegistry()
+
+
+@event.listens_for(Session, 'after_flush')
+def track_device_changes(session, flush_context):
+    """Remember whether this transaction touched registered devices"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SensorDevice):
+            session.info['device_registry_dirty'] = True
+            return
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def track_bulk_device_changes(orm_execute_state):
+    """Catch bulk Query.update()/delete() calls, which bypass flush events"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and issubclass(mapper.class_, SensorDevice):
+            orm_execute_state.session.info['device_registry_dirty'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_registry_after_commit(session):
+    """Reload the registry once device changes are committed"""
+    if session.info.pop('device_registry_dirty', False):
+        device_registry.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def clear_device_changes(session):
+    """Forget pending device changes that were rolled back"""
+    session.info.pop('device_registry_dirty', None)
+
+
+def register_device_commands(app):
+    """Register sensor device management commands with the Flask CLI"""
+
+    @app.cli.command('add-sensor')
+    @click.argument('name')
+    @click.argument('ip_address')
+    @click.option('--port', default=80, help='HTTP port of the ESP32')
+    @click.option('--room', help='Room the sensor is installed in')
+    @click.option('--course', 'course_code', help='Course code the sensor is dedicated to')
+    def add_sensor_command(name, ip_address, port, room, course_code):
+        """Register a fingerprint sensor"""
+        course_id = None
+        if course_code:
+            course = Course.query.filter_by(course_code=course_code).first()
+            if not course:
+                raise click.ClickException(f"Unknown course {course_code}")
+            course_id = course.id
+        db.session.add(SensorDevice(name=name, ip_address=ip_address, port=port,
+                                    room=room, course_id=course_id))
+        db.session.commit()
+        print(f"Registered sensor {name} at {ip_address}:{port}")
+
+    @app.cli.command('list-sensors')
+    def list_sensors_command():
+        """List registered fingerprint sensors"""
+        for device in SensorDevice.query.order_by(SensorDevice.id):
+            state = 'active' if device.is_active else 'inactive'
+            print(f"{device.id}\t{device.name}\t{device.ip_address}:{device.port}\t"
+                  f"room={device.room or '-'}\tcourse={device.course_id or '-'}\t{state}")
@@ -0,0 +1,200 @@
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from models import Fingerprint
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Seconds between enrollment status requests to the sensor
+ENROLLMENT_POLL_INTERVAL = 1.0
+
+# Watchers give up after this many seconds without a final status
+ENROLLMENT_TIMEOUT = 120
+
+# Watchers stop once nobody has been listening for this many seconds
+ENROLLMENT_IDLE_TIMEOUT = 30
+
+# Statuses after which an enrollment produces no further updates
+FINAL_STATUSES = ('complete', 'error')
+
+# Updates buffered per subscriber; a slow tab only misses intermediate progress
+SUBSCRIBER_QUEUE_SIZE = 16
+
+
+class EnrollmentWatcher:
+    """
+    Polls one sensor's enrollment progress and fans it out to subscribers
+
+    However many browser tabs follow an enrollment, the sensor is asked
+    for its status once per interval. When the enrollment completes the
+    watcher saves the fingerprint, so the template is stored exactly once.
+    """
+
+    def __init__(self, app, sensor, student_id, finger_id, device_id=None, interval=ENROLLMENT_POLL_INTERVAL):
+        """
+        Initialize a watcher (call start() to begin polling)
+
+        Args:
+            app: Flask app whose context the fingerprint is saved in
+            sensor (FingerPrintSensor): Sensor running the enrollment
+            student_id (int): Database ID of the student being enrolled
+            finger_id (int): Sensor finger ID assigned to the enrollment
+            device_id (int, optional): Database ID of the sensor's device (None for the default sensor)
+            interval (float): Seconds between status requests
+        """
+        self.app = app
+        self.sensor = sensor
+        self.student_id = student_id
+        self.finger_id = finger_id
+        self.device_id = device_id
+        self.interval = interval
+        self.latest = {'status': 'waiting', 'progress': 0, 'message': 'Waiting for sensor...'}
+        self.subscribers = set()
+        self.last_subscriber_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='enrollment-watcher', daemon=True)
+
+    @property
+    def finished(self):
+        return self.stopped.is_set()
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        """Stop polling after the current request (a new enrollment replaced this one)"""
+        self.cancelled.set()
+
+    def subscribe(self):
+        """
+        Start receiving status updates
+
+        Returns:
+            Queue: Receives status dictionaries, starting with the latest one
+        """
+        updates = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            updates.put_nowait(self.latest)
+            self.subscribers.add(updates)
+        return updates
+
+    def unsubscribe(self, updates):
+        """Stop receiving status updates"""
+        with self.lock:
+            self.subscribers.discard(updates)
+            self.last_subscriber_at = time.monotonic()
+
+    def publish(self, status):
+        """Send a status to every subscriber, dropping its oldest update if it is behind"""
+        with self.lock:
+            self.latest = status
+            for updates in self.subscribers:
+                if updates.full():
+                    try:
+                        updates.get_nowait()
+                    except queue.Empty:
+                        pass
+                updates.put_nowait(status)
+
+    def run(self):
+        """Poll the sensor until the enrollment ends, times out or loses its audience"""
+        started = time.monotonic()
+        try:
+            while True:
+                status = self.sensor.get_enrollment_status()
+                if status.get('status') == 'complete' and 'template_data' in status:
+                    status = self.save(status)
+                # Templates are stored server-side only; browsers just see progress
+                self.publish({key: value for key, value in status.items() if key != 'template_data'})
+                if status.get('status') in FINAL_STATUSES:
+                    return
+
+                now = time.monotonic()
+                if now - started > ENROLLMENT_TIMEOUT:
+                    self.publish({'status': 'error', 'progress': 0, 'message': 'Enrollment timed out'})
+                    return
+                with self.lock:
+                    idle = not self.subscribers and now - self.last_subscriber_at > ENROLLMENT_IDLE_TIMEOUT
+                if idle or self.cancelled.wait(self.interval):
+                    return
+        except Exception as e:
+            logger.error(f"Enrollment watcher failed: {str(e)}")
+            self.publish({'status': 'error', 'progress': 0, 'message': 'Failed to communicate with fingerprint sensor'})
+        finally:
+            self.stopped.set()
+
+    def save(self, status):
+        """Store the enrolled template; returns the status to publish"""
+        with self.app.app_context():
+            try:
+                exists = db.session.query(Fingerprint.id).filter_by(
+                    student_id=self.student_id, finger_id=self.finger_id, device_id=self.device_id
+                ).first()
+                if not exists:
+                    db.session.add(Fingerprint(
+                        student_id=self.student_id,
+                        finger_id=self.finger_id,
+                        device_id=self.device_id,
+                        template_data=status['template_data'],
+                        created_at=datetime.utcnow()
+                    ))
+                    db.session.commit()
+                    logger.info(f"Fingerprint enrolled for student {self.student_id}, finger {self.finger_id}")
+                return status
+            except Exception as e:
+                logger.error(f"Database error saving fingerprint: {str(e)}")
+                db.session.rollback()
+                return {'status': 'error', 'progress': 0, 'message': 'Failed to save fingerprint to database'}
+            finally:
+                db.session.remove()
+
+
+class EnrollmentWatchers:
+    """One EnrollmentWatcher per sensor with an active enrollment in this process"""
+
+    def __init__(self, interval=ENROLLMENT_POLL_INTERVAL):
+        self.app = None
+        self.interval = interval
+        self.watchers = {}
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        """Bind watchers to the Flask app whose context fingerprints are saved in"""
+        self.app = app
+
+    def watch(self, sensor, student_id, finger_id, device_id=None):
+        """
+        Get the watcher for an enrollment, starting it if needed
+
+        The watcher for the same enrollment is shared (a finished one keeps
+        serving its final status); it is restarted if it stopped without a
+        final status, and replaced when another enrollment starts on the sensor.
+
+        Args:
+            sensor (FingerPrintSensor): Sensor running the enrollment
+            student_id (int): Database ID of the student being enrolled
+            finger_id (int): Sensor finger ID assigned to the enrollment
+            device_id (int, optional): Database ID of the sensor's device (None for the default sensor)
+
+        Returns:
+            EnrollmentWatcher
+        """
+        with self.lock:
+            watcher = self.watchers.get(sensor.base_url)
+            if (watcher is None or
+                    (watcher.student_id, watcher.finger_id) != (student_id, finger_id) or
+                    (watcher.finished and watcher.latest.get('status') not in FINAL_STATUSES)):
+                if watcher is not None:
+                    watcher.cancel()
+                watcher = EnrollmentWatcher(self.app, sensor, student_id, finger_id, device_id, self.interval)
+                self.watchers[sensor.base_url] = watcher
+                watcher.start()
+            return watcher
+
+
+enrollment_watchers = EnrollmentWatchers()
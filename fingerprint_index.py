@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from models import Student, Course, Fingerprint, ChangeLog, student_course
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Compact records kept in memory for the scan hot path
+StudentRecord = namedtuple('StudentRecord', ['id', 'student_id', 'first_name', 'last_name', 'course_ids'])
+CourseRecord = namedtuple('CourseRecord', ['id', 'code', 'title'])
+
+
+class FingerprintIndex:
+    """
+    Process-local index mapping sensor finger IDs to students
+
+    Every sensor numbers its own template slots, so fingerprints are keyed
+    by (device ID, finger ID); device ID None is the default sensor. This
+    lets the verify endpoints resolve a finger ID, the student's name and
+    enrolled courses with a single index-only query. The index is rebuilt
+    lazily after any committed change to students, courses, enrollments or
+    fingerprints in this process, and when the roster change log (see
+    roster_changes.py) has a newer version than the one loaded, which is
+    checked on every use so changes made by other worker processes are
+    never served stale. max_age bounds how long writes that bypass the
+    ORM, and so the change log, can go unnoticed.
+    """
+
+    def __init__(self, max_age=300):
+        """
+        Initialize an empty index
+
+        Args:
+            max_age (int): Seconds before the index is reloaded regardless of local changes
+        """
+        self.max_age = max_age
+        self.students_by_finger = {}
+        self.students_by_id = {}
+        self.courses = {}
+        self.loaded_at = None
+        self.loaded_version = None
+        # Bumped on every invalidation; the index is current when both match
+        self.generation = 0
+        self.loaded_generation = -1
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        """Mark the index for rebuild on next use"""
+        self.generation += 1
+
+    def latest_version(self):
+        """Get the latest committed roster change version (one index lookup)"""
+        return db.session.query(func.max(ChangeLog.version)).scalar() or 0
+
+    def needs_reload(self, version):
+        """Check whether the index must be rebuilt before use"""
+        if self.loaded_generation != self.generation or self.loaded_at is None:
+            return True
+        if version != self.loaded_version:
+            return True
+        return time.monotonic() - self.loaded_at > self.max_age
+
+    def reload(self, version):
+        """
+        Rebuild the index from the database (three queries, no template data)
+
+        Args:
+            version (int): Change log version read before loading
+        """
+        generation = self.generation
+        courses = {
+            row.id: CourseRecord(row.id, row.course_code, row.title)
+            for row in db.session.query(Course.id, Course.course_code, Course.title)
+        }
+
+        enrollments = {}
+        for student_id, course_id in db.session.query(student_course.c.student_id, student_course.c.course_id):
+            enrollments.setdefault(student_id, []).append(course_id)
+
+        students_by_finger = {}
+        students_by_id = {}
+        rows = (db.session.query(Fingerprint.device_id, Fingerprint.finger_id, Student.id, Student.student_id,
+                                 Student.first_name, Student.last_name)
+                .join(Student, Fingerprint.student_id == Student.id)
+                .order_by(Fingerprint.id))
+        for row in rows:
+            if row.id not in students_by_id:
+                students_by_id[row.id] = StudentRecord(
+                    row.id, row.student_id, row.first_name, row.last_name,
+                    frozenset(enrollments.get(row.id, ()))
+                )
+            # Slots are unique per sensor; keep the first one should old data disagree
+            students_by_finger.setdefault((row.device_id, row.finger_id), students_by_id[row.id])
+
+        self.courses = courses
+        self.students_by_finger = students_by_finger
+        self.students_by_id = students_by_id
+        self.loaded_at = time.monotonic()
+        self.loaded_version = version
+        self.loaded_generation = generation
+        logger.info(f"Fingerprint index loaded with {len(students_by_finger)} fingerprints")
+
+    def warm(self):
+        """Load the index if it is missing or out of date"""
+        # Read before loading, so a change committed meanwhile triggers another reload
+        version = self.latest_version()
+        if self.needs_reload(version):
+            with self.lock:
+                if self.needs_reload(version):
+                    self.reload(version)
+
+    def lookup(self, finger_id, device_id=None):
+        """
+        Find the student enrolled with a sensor finger ID
+
+        Args:
+            finger_id: Finger ID reported by the sensor
+            device_id (int, optional): Database ID of the sensor that matched it (None for the default sensor)
+
+        Returns:
+            StudentRecord: Matching student, or None if the finger is not enrolled on that sensor
+        """
+        self.warm()
+        try:
+            finger_id = int(finger_id)
+        except (ValueError, TypeError):
+            return None
+        return self.students_by_finger.get((device_id, finger_id))
+
+    def get_student(self, student_id):
+        """
+        Find an enrolled student by database ID
+
+        Args:
+            student_id (int): Database ID of the student
+
+        Returns:
+            StudentRecord: Matching student, or None if they have no fingerprints
+        """
+        self.warm()
+        return self.students_by_id.get(student_id)
+
+    def get_courses(self, student):
+        """
+        Get the courses a student is enrolled in
+
+        Args:
+            student (StudentRecord): Student returned by lookup()
+
+        Returns:
+            list: CourseRecord entries sorted by course ID
+        """
+        courses = self.courses
+        return [courses[course_id] for course_id in sorted(student.course_ids) if course_id in courses]
+
+
+fingerprint_index = FingerprintIndex()
+
+# Models whose changes affect the index; enrollment changes mark Student or Course dirty
+INDEXED_MODELS = (Student, Course, Fingerprint)
+
+
+@event.listens_for(Session, 'after_flush')
+def track_index_changes(session, flush_context):
+    """Remember whether this transaction touched indexed data"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, INDEXED_MODELS):
+            session.info['fingerprint_index_dirty'] = True
+            return
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def track_bulk_index_changes(orm_execute_state):
+    """Catch bulk Query.update()/delete() calls, which bypass flush events"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and issubclass(mapper.class_, INDEXED_MODELS):
+            orm_execute_state.session.info['fingerprint_index_dirty'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_index_after_commit(session):
+    """Invalidate the index once changes to indexed data are committed"""
+    if session.info.pop('fingerprint_index_dirty', False):
+        fingerprint_index.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def clear_index_changes(session):
+    """Forget pending index changes that were rolled back"""
+    session.info.pop('fingerprint_index_dirty', None)
@@ -1,22 +1,320 @@
+import logging
 import requests
+import threading
+import time
+from collections import deque
 from typing import Optional, Dict, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 
+# Seconds allowed to open a TCP connection to the ESP32
+CONNECT_TIMEOUT = 3.05
+
+# Seconds to wait for the ESP32's response, per operation
+DEFAULT_TIMEOUTS = {
+    'status': 5,
+    'init': 5,
+    'enroll': 30,
+    'verify': 10,
+    'delete': 5,
+    'template_count': 5,
+    'enrollment_status': 5,
+    'enrollment_start': 5,
+}
+
+# Operations that wait for a finger on the sensor; a read timeout on these means nobody
+# placed a finger in time, not that the sensor is down, so it does not count towards the breaker
+FINGER_OPERATIONS = ('enroll', 'verify')
+
+# Latency samples kept per operation for percentiles
+LATENCY_SAMPLES = 256
+
+# Consecutive failed calls after which a sensor's circuit opens
+BREAKER_FAILURE_THRESHOLD = 3
+
+# Seconds between background /status probes while a circuit is open
+BREAKER_PROBE_INTERVAL = 5.0
+
+# Seconds a successful call counts as a heartbeat, so connect() need not ask again
+HEALTH_TTL = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """Call counts and latency percentiles per sensor operation"""
+
+    def __init__(self, samples: int = LATENCY_SAMPLES):
+        self.samples = samples
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation: str, seconds: float, error: bool = False) -> None:
+        """Record the duration of one call."""
+        with self.lock:
+            entry = self.calls.get(operation)
+            if entry is None:
+                entry = self.calls[operation] = {
+                    'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0,
+                    'recent': deque(maxlen=self.samples)
+                }
+            entry['count'] += 1
+            entry['errors'] += int(error)
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['recent'].append(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Get count, errors and mean/p50/p95/max latency in milliseconds per operation."""
+        with self.lock:
+            result = {}
+            for operation, entry in self.calls.items():
+                recent = sorted(entry['recent'])
+                result[operation] = {
+                    'count': entry['count'],
+                    'errors': entry['errors'],
+                    'mean_ms': round(entry['total'] / entry['count'] * 1000, 2),
+                    'p50_ms': round(recent[len(recent) // 2] * 1000, 2),
+                    'p95_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 2),
+                    'max_ms': round(entry['max'] * 1000, 2),
+                }
+            return result
+
+
+class SensorUnavailable(requests.ConnectionError):
+    """Raised without contacting the ESP32 while its circuit is open."""
+
+
+class CircuitBreaker:
+    """Cached health of one sensor that fails calls fast while it is down.
+
+    While closed, calls go through and consecutive failures are counted.
+    After failure_threshold failures the circuit opens: calls raise
+    SensorUnavailable at once instead of waiting out their timeouts, and a
+    background thread probes the sensor every probe_interval seconds. The
+    first successful probe closes the circuit, so no user request is spent
+    finding out whether a dead sensor came back.
+    """
+
+    def __init__(self, probe, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 probe_interval: float = BREAKER_PROBE_INTERVAL, name: str = 'sensor'):
+        """Initialize a closed circuit.
+
+        Args:
+            probe (callable): Returns True if the sensor answers; called from the probe thread
+            failure_threshold (int): Consecutive failures that open the circuit
+            probe_interval (float): Seconds between probes while open
+            name (str): Sensor name used in log messages
+        """
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.name = name
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.last_success_at = None
+        self.last_failure_at = None
+        self.last_error = None
+        self.prober = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == 'open'
+
+    def is_healthy(self, max_age: float = HEALTH_TTL) -> bool:
+        """Check whether the sensor answered within the last max_age seconds."""
+        return (self.state == 'closed' and self.last_success_at is not None and
+                time.monotonic() - self.last_success_at <= max_age)
+
+    def before_call(self) -> None:
+        """Raise SensorUnavailable if calls must not reach the sensor."""
+        if self.state == 'open':
+            raise SensorUnavailable(f"{self.name} is unavailable: {self.last_error}")
+
+    def record_success(self) -> None:
+        """Record that the sensor answered, closing the circuit if it was open."""
+        with self.lock:
+            if self.state == 'open':
+                logger.info(f"{self.name} is reachable again; circuit closed")
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self.last_success_at = time.monotonic()
+            self.last_error = None
+
+    def record_failure(self, error: Any) -> None:
+        """Record a failed call, opening the circuit once the threshold is reached."""
+        with self.lock:
+            self.consecutive_failures += 1
+            self.last_failure_at = time.monotonic()
+            self.last_error = str(error)
+            if self.state == 'closed' and self.consecutive_failures >= self.failure_threshold:
+                self.state = 'open'
+                logger.warning(f"{self.name} failed {self.consecutive_failures} calls "
+                               f"({self.last_error}); circuit opened")
+                if self.prober is None or not self.prober.is_alive():
+                    self.prober = threading.Thread(target=self.run_probes, name='sensor-probe', daemon=True)
+                    self.prober.start()
+
+    def run_probes(self) -> None:
+        """Probe the sensor until it answers or the breaker is stopped."""
+        while self.state == 'open' and not self.stopped.wait(self.probe_interval):
+            try:
+                healthy = self.probe()
+                error = 'probe failed'
+            except Exception as e:
+                healthy = False
+                error = e
+            if healthy:
+                self.record_success()
+            else:
+                self.record_failure(error)
+
+    def stop(self) -> None:
+        """Stop background probing."""
+        self.stopped.set()
+
+    def health(self) -> Dict[str, Any]:
+        """Get the cached health state."""
+        now = time.monotonic()
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+            'seconds_since_success': (round(now - self.last_success_at, 1)
+                                      if self.last_success_at is not None else None),
+        }
+
+
 class FingerPrintSensor:
-    def __init__(self, esp_ip_address: str, port: int = 80):
+    def __init__(self, esp_ip_address: str, port: int = 80, timeouts: Optional[Dict[str, float]] = None,
+                 retries: int = 2, backoff_factor: float = 0.2, pool_maxsize: int = 4,
+                 failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 probe_interval: float = BREAKER_PROBE_INTERVAL):
         """Initialize the fingerprint sensor communication module.
         
+        All calls go through one requests.Session, so the TCP connection to
+        the ESP32 is kept alive and reused instead of being opened per call.
+        A circuit breaker tracks the sensor's health and fails calls fast
+        while it is unreachable.
+        
         Args:
             esp_ip_address (str): IP address of the ESP32
             port (int): Port number (default is 80)
+            timeouts (dict, optional): Read timeouts in seconds overriding DEFAULT_TIMEOUTS per operation
+            retries (int): Retries for failed connections, and for GET requests on read errors
+                           or 502/503/504 responses (POSTs are never resent once delivered)
+            backoff_factor (float): Exponential backoff factor between retries
+            pool_maxsize (int): Connections kept open to the ESP32
+            failure_threshold (int): Consecutive failed calls that open the circuit
+            probe_interval (float): Seconds between background probes while the circuit is open
         """
         self.base_url = f"http://{esp_ip_address}:{port}"
         self.is_connected = False
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.stats = LatencyStats()
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.breaker = CircuitBreaker(self.probe, failure_threshold=failure_threshold,
+                                      probe_interval=probe_interval, name=self.base_url)
+
+    def request(self, operation: str, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request to the ESP32 over the pooled session, recording its latency.
+        
+        Args:
+            operation (str): Operation name used for the timeout and latency stats
+            method (str): HTTP method
+            path (str): Endpoint path on the ESP32
+            
+        Returns:
+            requests.Response
+            
+        Raises:
+            SensorUnavailable: If the circuit is open (the ESP32 is not contacted)
+            requests.RequestException: If the request failed after retries
+        """
+        self.breaker.before_call()
+        kwargs.setdefault('timeout', (CONNECT_TIMEOUT, self.timeouts[operation]))
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        except requests.ReadTimeout:
+            self.stats.record(operation, time.perf_counter() - start, error=True)
+            if operation not in FINGER_OPERATIONS:
+                self.breaker.record_failure(f"{operation} timed out")
+                self.is_connected = False
+            raise
+        except requests.RequestException as e:
+            self.stats.record(operation, time.perf_counter() - start, error=True)
+            self.breaker.record_failure(e)
+            self.is_connected = False
+            raise
+        self.stats.record(operation, time.perf_counter() - start, error=response.status_code >= 500)
+        if response.status_code >= 500:
+            self.breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            self.breaker.record_success()
+        return response
 
-    def connect(self) -> bool:
-        """Test connection to the ESP32."""
+    def probe(self) -> bool:
+        """Ask the ESP32 for its status without going through the circuit breaker."""
+        try:
+            response = self.session.get(f"{self.base_url}/status",
+                                        timeout=(CONNECT_TIMEOUT, self.timeouts['status']))
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def is_available(self) -> bool:
+        """Check whether calls may reach the ESP32 (its circuit is not open)."""
+        return not self.breaker.is_open
+
+    def get_health(self) -> Dict[str, Any]:
+        """Get the cached health of the ESP32."""
+        return self.breaker.health()
+
+    def get_latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get call counts and latency percentiles per operation."""
+        return self.stats.summary()
+
+    def close(self) -> None:
+        """Close pooled connections to the ESP32 and stop background probing."""
+        self.breaker.stop()
+        self.session.close()
+
+    def connect(self, max_age: float = HEALTH_TTL) -> bool:
+        """Test connection to the ESP32.
+        
+        Any call the sensor answered within max_age seconds serves as a
+        heartbeat, so /status is only requested when the health is stale.
+        While the circuit is open this returns False without a request.
+        
+        Args:
+            max_age (float): Seconds a previous successful call is trusted (0 always asks)
+        """
+        if self.breaker.is_open:
+            self.is_connected = False
+            return False
+        if max_age > 0 and self.breaker.is_healthy(max_age):
+            self.is_connected = True
+            return True
         try:
-            response = requests.get(f"{self.base_url}/status", timeout=5)
+            response = self.request('status', 'GET', '/status')
             self.is_connected = response.status_code == 200
             return self.is_connected
         except requests.RequestException:
@@ -26,11 +324,7 @@ class FingerPrintSensor:
     def initialize_sensor(self) -> bool:
         """Initialize the fingerprint sensor."""
         try:
-            response = requests.post(
-                f"{self.base_url}/init",
-                json={"command": "initialize"},
-                timeout=5
-            )
+            response = self.request('init', 'POST', '/init', json={"command": "initialize"})
             return response.status_code == 200
         except requests.RequestException:
             return False
@@ -45,11 +339,7 @@ class FingerPrintSensor:
             Dict containing success status and message
         """
         try:
-            response = requests.post(
-                f"{self.base_url}/enroll",
-                json={"finger_id": finger_id},
-                timeout=30
-            )
+            response = self.request('enroll', 'POST', '/enroll', json={"finger_id": finger_id})
             return response.json()
         except requests.RequestException as e:
             return {"success": False, "message": str(e)}
@@ -61,11 +351,7 @@ class FingerPrintSensor:
             Dict containing success status, finger_id if found, and message
         """
         try:
-            response = requests.post(
-                f"{self.base_url}/verify",
-                json={"command": "verify"},
-                timeout=10
-            )
+            response = self.request('verify', 'POST', '/verify', json={"command": "verify"})
             return response.json()
         except requests.RequestException as e:
             return {"success": False, "message": str(e), "finger_id": None}
@@ -80,11 +366,7 @@ class FingerPrintSensor:
             Dict containing success status and message
         """
         try:
-            response = requests.post(
-                f"{self.base_url}/delete",
-                json={"finger_id": finger_id},
-                timeout=5
-            )
+            response = self.request('delete', 'POST', '/delete', json={"finger_id": finger_id})
             return response.json()
         except requests.RequestException as e:
             return {"success": False, "message": str(e)}
@@ -96,7 +378,7 @@ class FingerPrintSensor:
             Number of stored templates, or -1 if failed
         """
         try:
-            response = requests.get(f"{self.base_url}/template-count", timeout=5)
+            response = self.request('template_count', 'GET', '/template-count')
             data = response.json()
             return data.get("count", -1)
         except requests.RequestException:
@@ -109,11 +391,7 @@ class FingerPrintSensor:
             bool: True if enrollment process started successfully
         """
         try:
-            response = requests.post(
-                f"{self.base_url}/init",
-                json={"command": "start_enrollment"},
-                timeout=5
-            )
+            response = self.request('init', 'POST', '/init', json={"command": "start_enrollment"})
             return response.status_code == 200
         except requests.RequestException:
             return False
@@ -129,10 +407,7 @@ class FingerPrintSensor:
             - template_data: fingerprint template data (if status is 'complete')
         """
         try:
-            response = requests.get(
-                f"{self.base_url}/enrollment-status",
-                timeout=5
-            )
+            response = self.request('enrollment_status', 'GET', '/enrollment-status')
             if response.status_code == 200:
                 return response.json()
             else:
@@ -158,10 +433,7 @@ class FingerPrintSensor:
             - message: str containing any error message (if success is False)
         """
         try:
-            response = requests.get(
-                f"{self.base_url}/enrollment/start",
-                timeout=5
-            )
+            response = self.request('enrollment_start', 'GET', '/enrollment/start')
             if response.status_code == 200:
                 data = response.json()
                 if data.get('status') == 'success':
@@ -93,6 +93,7 @@ class FingerprintEnrollForm(FlaskForm):
         (5, 'Left Thumb'), (6, 'Left Index'), (7, 'Left Middle'), 
         (8, 'Left Ring'), (9, 'Left Little')
     ], coerce=int, validators=[DataRequired()])
+    device = SelectField('Sensor', coerce=int, validators=[Optional()])
     submit = SubmitField('Start Enrollment')
 
 
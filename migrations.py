@@ -0,0 +1,140 @@
+import logging
+from sqlalchemy import inspect, text
+from models import Attendance, Fingerprint, ChangeLog
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Tables whose model columns and indexes are brought up to date on existing databases
+# (db.create_all() only creates them together with a new table)
+MIGRATED_TABLES = (Attendance.__table__, Fingerprint.__table__, ChangeLog.__table__)
+
+
+def missing_columns(connection, tables=MIGRATED_TABLES):
+    """
+    Find model columns that don't exist in the database yet
+
+    Args:
+        connection: SQLAlchemy connection or engine to inspect
+        tables (tuple): Tables to check
+
+    Returns:
+        list: Column objects to add, in table order
+    """
+    inspector = inspect(connection)
+    missing = []
+    for table in tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(column for column in table.columns if column.name not in existing)
+    return missing
+
+
+def add_column(engine, column):
+    """
+    Add a nullable column to an existing table
+
+    Only nullable columns without a server default are added this way, which
+    is a catalog-only change on PostgreSQL and SQLite (no table rewrite).
+
+    Args:
+        engine: SQLAlchemy engine
+        column (Column): Column to add
+    """
+    if not column.nullable or column.server_default is not None:
+        raise ValueError(f"Column {column.table.name}.{column.name} must be nullable without a server default")
+    preparer = engine.dialect.identifier_preparer
+    column_type = column.type.compile(dialect=engine.dialect)
+    with engine.begin() as connection:
+        connection.execute(text(
+            f"ALTER TABLE {preparer.format_table(column.table)} "
+            f"ADD COLUMN {preparer.format_column(column)} {column_type}"
+        ))
+
+
+def missing_indexes(connection, tables=MIGRATED_TABLES):
+    """
+    Find model indexes that don't exist in the database yet
+
+    Args:
+        connection: SQLAlchemy connection or engine to inspect
+        tables (tuple): Tables to check
+
+    Returns:
+        list: Index objects to create, ordered by name
+    """
+    inspector = inspect(connection)
+    missing = []
+    for table in tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in sorted(table.indexes, key=lambda index: index.name)
+                       if index.name not in existing)
+    return missing
+
+
+def create_index(engine, index):
+    """
+    Create an index on an existing table
+
+    On PostgreSQL the index is built with CREATE INDEX CONCURRENTLY so writes
+    to the table are not blocked while a large table is indexed.
+
+    Args:
+        engine: SQLAlchemy engine
+        index (Index): Index to create
+    """
+    if engine.dialect.name != 'postgresql':
+        index.create(engine, checkfirst=True)
+        return
+
+    # CONCURRENTLY cannot run inside a transaction block
+    index.dialect_kwargs['postgresql_concurrently'] = True
+    try:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            index.create(connection, checkfirst=True)
+    finally:
+        index.dialect_kwargs['postgresql_concurrently'] = False
+
+
+def upgrade_database(engine=None):
+    """
+    Bring an existing database schema up to date with the models
+
+    Creates missing tables, and any columns and indexes added to existing
+    tables. Safe to run repeatedly.
+
+    Args:
+        engine: SQLAlchemy engine (defaults to the application's engine)
+
+    Returns:
+        list: Names of the columns (table.column) and indexes that were created
+    """
+    engine = engine or db.engine
+    db.metadata.create_all(engine)
+
+    created = []
+    for column in missing_columns(engine):
+        logger.info(f"Adding column {column.name} to {column.table.name}")
+        add_column(engine, column)
+        created.append(f"{column.table.name}.{column.name}")
+    for index in missing_indexes(engine):
+        logger.info(f"Creating index {index.name} on {index.table.name}")
+        create_index(engine, index)
+        created.append(index.name)
+    return created
+
+
+def register_migration_commands(app):
+    """Register schema migration commands with the Flask CLI"""
+
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """Create tables, columns and indexes missing from an existing database"""
+        created = upgrade_database()
+        if created:
+            print(f"Created columns and indexes: {', '.join(created)}")
+        else:
+            print("Database schema is up to date")
@@ -76,18 +76,163 @@ class Attendance(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     status = db.Column(db.String(20), default='present', nullable=False)  # 'present', 'absent', 'late'
     synced = db.Column(db.Boolean, default=True)
+    # Dedupe window of a device scan (see attendance_dedupe.py); NULL for manual entries
+    dedupe_slot = db.Column(db.Integer)
+    
+    # Indexes for the hot query shapes: time ranges and keyset pages (timestamp, id),
+    # per-course and per-student history, and status counts over a time range.
+    # The unique index allows one device scan per student, course and dedupe window.
+    # Existing databases get them with `flask upgrade-db` (see migrations.py).
+    __table_args__ = (
+        db.Index('ix_attendance_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_attendance_course_timestamp', 'course_id', 'timestamp'),
+        db.Index('ix_attendance_student_timestamp', 'student_id', 'timestamp'),
+        db.Index('ix_attendance_status_timestamp', 'status', 'timestamp'),
+        db.Index('uq_attendance_dedupe', 'student_id', 'course_id', 'dedupe_slot', unique=True),
+    )
     
     def __repr__(self):
         return f'<Attendance {self.student_id} - {self.course_id} - {self.timestamp}>'
 
 
+# Partial index holding only rows still waiting to be synced (a small fraction of the table);
+# queries must compare against the literal false (Attendance.synced == db.false()) to use it
+db.Index('ix_attendance_unsynced', Attendance.id,
+         postgresql_where=Attendance.synced == db.false(),
+         sqlite_where=Attendance.synced == db.false())
+
+
 class Fingerprint(db.Model):
     """Fingerprint data model to store fingerprint templates"""
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
-    finger_id = db.Column(db.Integer, nullable=False)  # Usually 0-9 to represent different fingers
-    template_data = db.Column(db.LargeBinary, nullable=False)  # Store the actual fingerprint template data
+    finger_id = db.Column(db.Integer, nullable=False)  # Template slot on the sensor it was enrolled on
+    # Sensor holding the template; every sensor numbers its own slots (NULL = the default sensor)
+    device_id = db.Column(db.Integer, db.ForeignKey('sensor_device.id'), nullable=True)
+    # Store the actual fingerprint template data; deferred so roster and scan queries
+    # don't pull the blob; use undefer(Fingerprint.template_data) where bytes are needed
+    template_data = db.deferred(db.Column(db.LargeBinary, nullable=False))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Row version for the persisted template index; NULL on rows written before the column existed
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('uq_fingerprint_device_finger', 'device_id', 'finger_id', unique=True),
+    )
     
     def __repr__(self):
         return f'<Fingerprint {self.student_id} - Finger {self.finger_id}>'
+
+
+# NULLs are distinct in unique indexes, so slots of the default sensor need their own
+db.Index('uq_fingerprint_default_finger', Fingerprint.finger_id, unique=True,
+         postgresql_where=Fingerprint.device_id.is_(None),
+         sqlite_where=Fingerprint.device_id.is_(None))
+
+
+class SensorDevice(db.Model):
+    """ESP32 fingerprint sensor installed in a room, optionally dedicated to a course"""
+    __tablename__ = 'sensor_device'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), unique=True, nullable=False)
+    ip_address = db.Column(db.String(64), nullable=False)
+    port = db.Column(db.Integer, default=80, nullable=False)
+    room = db.Column(db.String(64), nullable=True, index=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id', ondelete="SET NULL"), nullable=True, index=True)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SensorDevice {self.name} - {self.ip_address}:{self.port}>'
+
+
+class AttendanceDailyCount(db.Model):
+    """Pre-aggregated attendance counts per day, course and status"""
+    __tablename__ = 'attendance_daily_count'
+    
+    day = db.Column(db.Date, primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id', ondelete="CASCADE"), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<AttendanceDailyCount {self.day} - {self.course_id} - {self.status}: {self.count}>'
+
+
+class SyncJob(db.Model):
+    """Background attendance sync job, stored so any web worker can report its status"""
+    __tablename__ = 'sync_job'
+    
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    status = db.Column(db.String(20), default='queued', nullable=False)  # 'queued', 'running', 'succeeded', 'failed'
+    synced_count = db.Column(db.Integer, default=0, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<SyncJob {self.id} - {self.status}>'
+
+
+class ScanJob(db.Model):
+    """Fingerprint scan running in the background, stored so any web worker can report its result"""
+    __tablename__ = 'scan_job'
+    
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    course_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # 'pending', 'done'
+    result = db.Column(db.Text, nullable=True)  # JSON response for the browser once done
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<ScanJob {self.id} - {self.status}>'
+
+
+class AttendanceOutbox(db.Model):
+    """Ordered log of attendance writes waiting to be sent to the central server"""
+    __tablename__ = 'attendance_outbox'
+    # Never reuse IDs of pruned entries, or new entries could land behind the cursor
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = db.Column(db.Integer, primary_key=True)  # Log position; sync reads entries after its cursor
+    attendance_id = db.Column(db.Integer, nullable=False)  # No FK: entries outlive deleted records
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<AttendanceOutbox {self.id} - Attendance {self.attendance_id}>'
+
+
+class ChangeLog(db.Model):
+    """Roster change feed: one entry per created, changed or deleted student, course, enrollment or fingerprint"""
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_entity_key', 'entity', 'entity_key', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Counter clients sync from (?since=<version>), assigned at commit so it follows commit order
+    version = db.Column(db.Integer, index=True)
+    entity = db.Column(db.String(20), nullable=False)  # 'student', 'course', 'enrollment', 'fingerprint'
+    entity_key = db.Column(db.String(64), nullable=False)  # Row ID, or 'student_id:course_id' for enrollments
+    deleted = db.Column(db.Boolean, default=False, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<ChangeLog {self.id} - {self.entity} {self.entity_key}>'
+
+
+class SyncCursor(db.Model):
+    """Named position in an ordered log (outbox position acknowledged by the central server, change log seed)"""
+    __tablename__ = 'sync_cursor'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    position = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SyncCursor {self.name}: {self.position}>'
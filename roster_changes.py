@@ -0,0 +1,336 @@
+import logging
+from datetime import datetime
+from sqlalchemy import event, insert, update, select, inspect, func, tuple_, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+from models import Student, Course, Fingerprint, ChangeLog, SyncCursor, student_course
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+change_table = ChangeLog.__table__
+
+# Cursor recording that rows predating the change log were seeded into it
+SEED_CURSOR = 'roster_changes'
+
+# Counter handing out change log versions, in commit order
+VERSION_CURSOR = 'change_log_version'
+
+# Most entries returned per feed request
+MAX_CHANGES = 1000
+
+# Feed entity name per model
+TRACKED_MODELS = {Student: 'student', Course: 'course', Fingerprint: 'fingerprint'}
+
+
+def enrollment_key(student_id, course_id):
+    return f"{student_id}:{course_id}"
+
+
+def collect_changes(session):
+    """
+    Get the feed entries for the objects in a flush
+
+    Returns:
+        dict: (entity, entity_key) -> deleted flag, last change winning
+    """
+    changes = {}
+    for obj in session.new:
+        entity = TRACKED_MODELS.get(type(obj))
+        if entity:
+            changes[(entity, str(obj.id))] = False
+    for obj in session.dirty:
+        entity = TRACKED_MODELS.get(type(obj))
+        # Collection-only changes leave the row itself untouched
+        if entity and session.is_modified(obj, include_collections=False):
+            changes[(entity, str(obj.id))] = False
+    for obj in session.deleted:
+        entity = TRACKED_MODELS.get(type(obj))
+        if entity:
+            changes[(entity, str(obj.id))] = True
+
+    # Enrollments change through either side of the relationship
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Student):
+            history = inspect(obj).attrs.courses.history
+            pairs = lambda courses: ((obj.id, course.id) for course in courses)
+        elif isinstance(obj, Course):
+            history = inspect(obj).attrs.students.history
+            pairs = lambda students: ((student.id, obj.id) for student in students)
+        else:
+            continue
+        for student_id, course_id in pairs(history.added):
+            changes[('enrollment', enrollment_key(student_id, course_id))] = False
+        removed = history.sum() if obj in session.deleted else history.deleted
+        for student_id, course_id in pairs(removed):
+            changes[('enrollment', enrollment_key(student_id, course_id))] = True
+    return changes
+
+
+def append_changes(session, changes):
+    """Write feed entries in the session's transaction; they get their versions at commit"""
+    if changes:
+        session.info['change_log_pending'] = True
+        now = datetime.utcnow()
+        session.connection().execute(insert(change_table), [
+            {'entity': entity, 'entity_key': entity_key, 'deleted': deleted, 'created_at': now}
+            for (entity, entity_key), deleted in changes.items()
+        ])
+
+
+@event.listens_for(Session, 'after_flush')
+def append_roster_changes(session, flush_context):
+    """Append roster changes to the change log in the same transaction"""
+    append_changes(session, collect_changes(session))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def append_bulk_roster_changes(orm_execute_state):
+    """Log the rows hit by bulk Query.update()/delete() calls, which bypass flush events"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    entity = TRACKED_MODELS.get(mapper.class_) if mapper is not None else None
+    if entity is None:
+        return
+
+    query = select(mapper.primary_key[0])
+    if orm_execute_state.statement.whereclause is not None:
+        query = query.where(orm_execute_state.statement.whereclause)
+    session = orm_execute_state.session
+    append_changes(session, {
+        (entity, str(row_id)): orm_execute_state.is_delete for row_id in session.execute(query).scalars()
+    })
+
+
+def insert_if_missing(connection, table):
+    """INSERT that does nothing when the primary key already exists"""
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(table).on_conflict_do_nothing()
+
+
+def assign_versions(connection):
+    """
+    Number the change log entries of the committing transaction
+
+    Change IDs follow insert order, so a transaction that logged a change
+    first but commits last would land below a version clients already
+    have. Versions are taken from a counter row that stays locked until
+    commit, so they follow commit order instead. The first versioned
+    commit creates the counter and gives older entries their ID as
+    version, which is what clients hold from before versions existed.
+
+    Args:
+        connection: Connection of the committing session
+    """
+    counter = SyncCursor.__table__
+    pending = connection.execute(
+        select(change_table.c.id).where(change_table.c.version.is_(None)).order_by(change_table.c.id)
+    ).scalars().all()
+    reserve = (update(counter)
+               .where(counter.c.name == VERSION_CURSOR)
+               .values(position=counter.c.position + len(pending)))
+    if not connection.execute(reserve).rowcount:
+        created = connection.execute(insert_if_missing(connection, counter).values(
+            name=VERSION_CURSOR, position=select(func.coalesce(func.max(change_table.c.id), 0)).scalar_subquery()
+        )).rowcount
+        if created:
+            connection.execute(update(change_table).where(change_table.c.version.is_(None))
+                               .values(version=change_table.c.id))
+            return
+        # Another worker created the counter first
+        connection.execute(reserve)
+    if not pending:
+        return
+
+    position = connection.execute(select(counter.c.position).where(counter.c.name == VERSION_CURSOR)).scalar()
+    first = position - len(pending) + 1
+    connection.execute(
+        update(change_table).where(change_table.c.id == bindparam('entry_id')).values(version=bindparam('entry_version')),
+        [{'entry_id': entry_id, 'entry_version': first + offset} for offset, entry_id in enumerate(pending)]
+    )
+
+
+@event.listens_for(Session, 'before_commit')
+def version_roster_changes(session):
+    """Give this transaction's change log entries their versions just before it commits"""
+    # before_commit runs ahead of the final flush, which may still log changes
+    session.flush()
+    if session.info.pop('change_log_pending', False):
+        assign_versions(session.connection())
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_roster_changes(session):
+    """Rolled back entries no longer need versions"""
+    session.info.pop('change_log_pending', None)
+
+
+def seed_change_log():
+    """
+    Log every existing roster row once, so the feed from version 0 is complete
+
+    Databases that predate the change log have rows no entry points to.
+    The first call queues them all; later calls only check the seed cursor.
+    """
+    if db.session.get(SyncCursor, SEED_CURSOR) is not None:
+        if db.session.get(SyncCursor, VERSION_CURSOR) is None:
+            # Log written before versions existed; number its entries now
+            db.session.info['change_log_pending'] = True
+            db.session.commit()
+        return
+
+    now = datetime.utcnow()
+    sources = [
+        select(db.literal('student'), db.cast(Student.id, db.String), db.false(), db.literal(now)),
+        select(db.literal('course'), db.cast(Course.id, db.String), db.false(), db.literal(now)),
+        select(db.literal('fingerprint'), db.cast(Fingerprint.id, db.String), db.false(), db.literal(now)),
+        select(db.literal('enrollment'),
+               db.cast(student_course.c.student_id, db.String) + ':' +
+               db.cast(student_course.c.course_id, db.String),
+               db.false(), db.literal(now)),
+    ]
+    count = 0
+    for source in sources:
+        result = db.session.execute(
+            insert(change_table).from_select(['entity', 'entity_key', 'deleted', 'created_at'], source)
+        )
+        count += result.rowcount
+    db.session.add(SyncCursor(name=SEED_CURSOR, position=db.session.query(func.max(ChangeLog.id)).scalar() or 0))
+    db.session.info['change_log_pending'] = True
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker seeded the log first
+        db.session.rollback()
+        return
+    logger.info(f"Seeded change log with {count} existing roster rows")
+
+
+def get_changes(since, limit=MAX_CHANGES):
+    """
+    Get roster changes after a version
+
+    Entries for the same row are collapsed and the row's current values
+    are returned, so the response grows with the number of changed rows,
+    not with the number of edits or the size of the roster. A client
+    deleting a student or course should drop its enrollments and
+    fingerprints as well.
+
+    Args:
+        since (int): Version the client has (0 for everything)
+        limit (int): Maximum number of change log entries to read
+
+    Returns:
+        dict: 'version' to send as the next since, 'has_more', and per entity
+              the changed rows and deleted IDs (enrollments: added/removed pairs)
+    """
+    seed_change_log()
+    entries = (db.session.query(ChangeLog.version, ChangeLog.entity, ChangeLog.entity_key, ChangeLog.deleted)
+               .filter(ChangeLog.version > since)
+               .order_by(ChangeLog.version)
+               .limit(limit + 1)
+               .all())
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for entry in entries:
+        latest[(entry.entity, entry.entity_key)] = entry.deleted
+    keys = {'student': set(), 'course': set(), 'fingerprint': set(), 'enrollment': set()}
+    deleted = {'student': set(), 'course': set(), 'fingerprint': set(), 'enrollment': set()}
+    for (entity, entity_key), is_deleted in latest.items():
+        (deleted if is_deleted else keys)[entity].add(entity_key)
+
+    students = [{
+        'id': row.id,
+        'student_id': row.student_id,
+        'name': f"{row.first_name} {row.last_name}",
+        'email': row.email
+    } for row in (db.session.query(Student.id, Student.student_id, Student.first_name,
+                                   Student.last_name, Student.email)
+                  .filter(Student.id.in_([int(key) for key in keys['student']]))
+                  .order_by(Student.id))] if keys['student'] else []
+
+    courses = [{
+        'id': row.id,
+        'code': row.course_code,
+        'title': row.title,
+        'description': row.description
+    } for row in (db.session.query(Course.id, Course.course_code, Course.title, Course.description)
+                  .filter(Course.id.in_([int(key) for key in keys['course']]))
+                  .order_by(Course.id))] if keys['course'] else []
+
+    fingerprints = [{
+        'id': row.id,
+        'finger_id': row.finger_id,
+        'device_id': row.device_id,
+        'student_id': row.student_id
+    } for row in (db.session.query(Fingerprint.id, Fingerprint.finger_id, Fingerprint.device_id,
+                                   Fingerprint.student_id)
+                  .filter(Fingerprint.id.in_([int(key) for key in keys['fingerprint']]))
+                  .order_by(Fingerprint.id))] if keys['fingerprint'] else []
+
+    pairs = [tuple(int(part) for part in key.split(':')) for key in keys['enrollment']]
+    enrollments = sorted(
+        db.session.query(student_course.c.student_id, student_course.c.course_id)
+        .filter(tuple_(student_course.c.student_id, student_course.c.course_id).in_(pairs))
+        .all()
+    ) if pairs else []
+
+    # Rows changed and then removed by a later, not yet logged transaction count as deleted
+    found = {
+        'student': {str(row['id']) for row in students},
+        'course': {str(row['id']) for row in courses},
+        'fingerprint': {str(row['id']) for row in fingerprints},
+        'enrollment': {enrollment_key(*pair) for pair in enrollments},
+    }
+    for entity in keys:
+        deleted[entity] |= keys[entity] - found[entity]
+
+    return {
+        'since': since,
+        'version': entries[-1].version if entries else since,
+        'has_more': has_more,
+        'students': {'changed': students, 'deleted': sorted(int(key) for key in deleted['student'])},
+        'courses': {'changed': courses, 'deleted': sorted(int(key) for key in deleted['course'])},
+        'fingerprints': {'changed': fingerprints, 'deleted': sorted(int(key) for key in deleted['fingerprint'])},
+        'enrollments': {
+            'added': [{'student_id': student_id, 'course_id': course_id} for student_id, course_id in enrollments],
+            'removed': [{'student_id': student_id, 'course_id': course_id} for student_id, course_id in
+                        sorted(tuple(int(part) for part in key.split(':')) for key in deleted['enrollment'])]
+        },
+    }
+
+
+def compact_change_log():
+    """
+    Delete change log entries superseded by a later entry for the same row
+
+    Safe for clients at any version: a superseded entry newer than their
+    version is always followed by the newer entry, which returns the row's
+    current state. Keeps the log at about one entry per row ever seen.
+
+    Returns:
+        int: Number of entries deleted
+    """
+    newer = aliased(ChangeLog)
+    superseded = (select(newer.id)
+                  .where(newer.entity == ChangeLog.entity,
+                         newer.entity_key == ChangeLog.entity_key,
+                         newer.version > ChangeLog.version)
+                  .exists())
+    count = ChangeLog.query.filter(superseded).delete(synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def register_change_commands(app):
+    """Register change log maintenance commands with the Flask CLI"""
+
+    @app.cli.command('compact-change-log')
+    def compact_change_log_command():
+        """Drop change log entries superseded by later changes to the same row"""
+        count = compact_change_log()
+        print(f"Removed {count} superseded change log entries")
@@ -1,22 +1,28 @@
+import json
 import logging
+import queue
 from datetime import datetime, timedelta
-from flask import render_template, redirect, url_for, flash, request, jsonify, session
+from flask import render_template, redirect, url_for, flash, request, jsonify, session, Response
 from flask_login import login_user, logout_user, login_required, current_user
 from urllib.parse import urlparse
+from sqlalchemy.orm import joinedload, contains_eager
 from app import db
 from models import User, Student, Course, Attendance, Fingerprint
 from forms import (
     LoginForm, RegistrationForm, StudentForm, CourseForm, EnrollmentForm, 
     FingerprintEnrollForm, AttendanceForm, SearchForm
 )
-from fingerprint_sensor_module import FingerPrintSensor
-from attendance_manager import AttendanceManager
+from device_registry import device_registry
+from sync_worker import sync_worker, serialize_job, SyncQueueFull
+from scan_jobs import scan_jobs, ScanQueueFull
+from enrollment_watcher import enrollment_watchers, FINAL_STATUSES
+from attendance_rollup import delete_attendance, get_status_counts, get_daily_counts, get_course_counts
 
 logger = logging.getLogger(__name__)
 
-# Initialize fingerprint sensor with ESP32 IP address
-fingerprint_sensor = FingerPrintSensor("192.168.43.215")  # Replace with your ESP32's IP
-attendance_manager = AttendanceManager()
+# Seconds between keep-alive comments on idle server-sent event streams
+ENROLLMENT_KEEPALIVE = 15
+
 
 def register_routes(app):
     """Register all routes with the Flask application"""
@@ -88,43 +94,33 @@ def register_routes(app):
     def dashboard():
         """Dashboard route showing attendance statistics"""
         # Get recent attendance data
-        recent_attendance = Attendance.query.order_by(Attendance.timestamp.desc()).limit(10).all()
+        recent_attendance = (Attendance.query
+                             .options(joinedload(Attendance.student), joinedload(Attendance.course))
+                             .order_by(Attendance.timestamp.desc())
+                             .limit(10)
+                             .all())
         
-        # Get attendance statistics
+        # Get attendance statistics from the daily rollup
         today = datetime.utcnow().date()
-        today_start = datetime.combine(today, datetime.min.time())
-        today_end = datetime.combine(today, datetime.max.time())
-        
-        today_attendance_count = Attendance.query.filter(
-            Attendance.timestamp.between(today_start, today_end)
-        ).count()
+        today_attendance_count = sum(get_status_counts(start_day=today, end_day=today).values())
         
         # Get weekly attendance data for chart
         week_start = today - timedelta(days=today.weekday())
-        week_dates = [(week_start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
+        week_days = [week_start + timedelta(days=i) for i in range(7)]
+        daily_counts = get_daily_counts(week_days[0], week_days[-1], status='present')
         
-        weekly_data = []
-        for day_date in week_dates:
-            day_start = datetime.strptime(day_date, '%Y-%m-%d')
-            day_end = day_start + timedelta(days=1)
-            
-            day_count = Attendance.query.filter(
-                Attendance.timestamp.between(day_start, day_end),
-                Attendance.status == 'present'
-            ).count()
-            
-            weekly_data.append({
-                'date': day_date,
-                'count': day_count
-            })
+        weekly_data = [
+            {'date': day.strftime('%Y-%m-%d'), 'count': daily_counts.get(day, 0)}
+            for day in week_days
+        ]
         
         # Get course statistics
         courses = Course.query.all()
+        course_counts = get_course_counts()
         course_stats = []
         
         for course in courses:
-            total = Attendance.query.filter_by(course_id=course.id).count()
-            present = Attendance.query.filter_by(course_id=course.id, status='present').count()
+            total, present = course_counts.get(course.id, (0, 0))
             
             attendance_rate = (present / total) * 100 if total > 0 else 0
             
@@ -223,7 +219,7 @@ def register_routes(app):
             Fingerprint.query.filter_by(student_id=student.id).delete()
             
             # Then delete all attendance records associated with the student
-            Attendance.query.filter_by(student_id=student.id).delete()
+            delete_attendance(Attendance.student_id == student.id)
             
             # Remove the student from all courses (many-to-many relationship)
             student.courses = []
@@ -344,8 +340,12 @@ def register_routes(app):
         """View attendance for a specific course"""
         course = Course.query.get_or_404(id)
         
-        # Get the attendance records for this course
-        attendance_records = Attendance.query.filter_by(course_id=course.id).order_by(Attendance.timestamp.desc()).all()
+        # Get the attendance records for this course (students loaded in the same query)
+        attendance_records = (Attendance.query
+                              .options(joinedload(Attendance.student))
+                              .filter_by(course_id=course.id)
+                              .order_by(Attendance.timestamp.desc())
+                              .all())
         
         # Group records by date
         grouped_records = {}
@@ -371,7 +371,7 @@ def register_routes(app):
             
         try:
             # First delete all attendance records for this course
-            Attendance.query.filter_by(course_id=course.id).delete()
+            delete_attendance(Attendance.course_id == course.id)
             
             # Remove all students from the course (many-to-many relationship)
             course.students = []
@@ -395,9 +395,20 @@ def register_routes(app):
         form = FingerprintEnrollForm()
         form.student.choices = [(s.id, f"{s.student_id} - {s.first_name} {s.last_name}") 
                                for s in Student.query.order_by(Student.last_name).all()]
+        form.device.choices = [(0, 'Default sensor')] + [
+            (d.id, f"{d.name} ({d.room})" if d.room else d.name) for d in device_registry.get_devices()
+        ]
         
         if form.validate_on_submit():
             student = Student.query.get(form.student.data)
+            device_id = form.device.data or None
+            fingerprint_sensor = device_registry.get_sensor(device_id=device_id)
+            if fingerprint_sensor is None:
+                flash('No fingerprint sensor is configured. Please register a sensor first.', 'error')
+                return redirect(url_for('enroll'))
+            if not fingerprint_sensor.is_available():
+                flash('The fingerprint sensor is offline. Please check the device and try again shortly.', 'error')
+                return redirect(url_for('enroll'))
             
             # Get next available ID from ESP32
             try:
@@ -411,19 +422,20 @@ def register_routes(app):
                     flash('Fingerprint sensor memory is full. Please delete some fingerprints first.', 'error')
                     return redirect(url_for('enroll'))
                 
-                # Check if this finger is already enrolled
-                existing = Fingerprint.query.filter_by(
-                    student_id=student.id, 
+                # Slots are numbered per sensor; one the sensor reports free may still be on record
+                existing = db.session.query(Fingerprint.id).filter_by(
+                    device_id=device_id,
                     finger_id=finger_id
                 ).first()
                 
                 if existing:
-                    flash(f'This finger is already enrolled for {student.first_name}. Please choose a different finger.', 'warning')
+                    flash(f'Sensor slot {finger_id} is already assigned to an enrolled fingerprint. Please delete it first.', 'warning')
                     return redirect(url_for('enroll'))
                 
                 # Store enrollment info in session
                 session['enrollment_student_id'] = student.id
                 session['enrollment_finger_id'] = finger_id
+                session['enrollment_device_id'] = device_id
             except Exception as e:
                 logger.error(f"Error getting next fingerprint ID: {str(e)}")
                 flash('Failed to communicate with fingerprint sensor. Please check the connection.', 'error')
@@ -436,6 +448,9 @@ def register_routes(app):
                     flash('Failed to start enrollment process. Please try again.', 'error')
                     return redirect(url_for('enroll'))
                     
+                # One watcher polls the sensor for every tab following this enrollment
+                enrollment_watchers.watch(fingerprint_sensor, student.id, finger_id, device_id)
+                    
                 flash(f'Place {student.first_name}\'s finger on the sensor to begin enrollment...', 'info')
                 return render_template('enroll.html', title='Fingerprint Enrollment', 
                                      form=form, enrolling=True, student=student)
@@ -447,53 +462,74 @@ def register_routes(app):
         
         return render_template('enroll.html', title='Fingerprint Enrollment', form=form)
 
+    def current_enrollment_watcher():
+        """
+        Get the watcher for the enrollment stored in the session
+        
+        Returns:
+            tuple: (EnrollmentWatcher, None), or (None, error status) when there is nothing to watch
+        """
+        if 'enrollment_student_id' not in session:
+            return None, {'status': 'error', 'progress': 0, 'message': 'No enrollment in progress'}
+        fingerprint_sensor = device_registry.get_sensor(device_id=session.get('enrollment_device_id'))
+        if fingerprint_sensor is None:
+            # The sensor was unregistered mid-enrollment; the enrollment cannot finish
+            session.pop('enrollment_student_id', None)
+            session.pop('enrollment_finger_id', None)
+            session.pop('enrollment_device_id', None)
+            return None, {'status': 'error', 'progress': 0, 'message': 'No fingerprint sensor configured'}
+        watcher = enrollment_watchers.watch(fingerprint_sensor, session['enrollment_student_id'],
+                                            session['enrollment_finger_id'], session.get('enrollment_device_id'))
+        return watcher, None
+
     @app.route('/enroll/status', methods=['GET'])
     @login_required
     def enrollment_status():
-        """AJAX endpoint to check enrollment status"""
-        if 'enrollment_student_id' not in session:
-            return jsonify({'status': 'error', 'message': 'No enrollment in progress'})
+        """AJAX endpoint to check enrollment status (served from the shared watcher)"""
+        watcher, error = current_enrollment_watcher()
+        if watcher is None:
+            return jsonify(error)
+        
+        status = watcher.latest
+        if status.get('status') in FINAL_STATUSES:
+            session.pop('enrollment_student_id', None)
+            session.pop('enrollment_finger_id', None)
+            session.pop('enrollment_device_id', None)
+        return jsonify(status)
+
+    @app.route('/enroll/events', methods=['GET'])
+    @login_required
+    def enrollment_events():
+        """Server-sent events stream of enrollment progress
         
-        try:
-            # Get status from ESP32
-            status = fingerprint_sensor.get_enrollment_status()
-            
-            # If enrollment is complete, save the fingerprint template
-            if status['status'] == 'complete' and 'template_data' in status:
-                student_id = session.pop('enrollment_student_id', None)
-                finger_id = session.pop('enrollment_finger_id', None)
-                
-                if student_id and finger_id is not None:
-                    student = Student.query.get(student_id)
-                    
-                    # Create new fingerprint record
-                    fingerprint = Fingerprint(
-                        student_id=student.id,
-                        finger_id=finger_id,
-                        template_data=status['template_data'],
-                        created_at=datetime.utcnow()
-                    )
-                    
+        Answers 204 unless ENROLLMENT_EVENTS is enabled (see app.py), which
+        tells the browser not to reconnect and to poll /enroll/status instead.
+        """
+        if not app.config.get('ENROLLMENT_EVENTS'):
+            return Response(status=204)
+        watcher, error = current_enrollment_watcher()
+        if watcher is None:
+            return Response(f"data: {json.dumps(error)}\n\n", mimetype='text/event-stream')
+        
+        updates = watcher.subscribe()
+        
+        def stream():
+            try:
+                while True:
                     try:
-                        db.session.add(fingerprint)
-                        db.session.commit()
-                        logger.info(f"Fingerprint enrolled for student {student.id}, finger {finger_id}")
-                    except Exception as e:
-                        logger.error(f"Database error saving fingerprint: {str(e)}")
-                        db.session.rollback()
-                        return jsonify({
-                            'status': 'error',
-                            'message': 'Failed to save fingerprint to database'
-                        })
-            
-            return jsonify(status)
-            
-        except Exception as e:
-            logger.error(f"Error checking enrollment status: {str(e)}")
-            return jsonify({
-                'status': 'error',
-                'message': 'Failed to communicate with fingerprint sensor'
-            })
+                        status = updates.get(timeout=ENROLLMENT_KEEPALIVE)
+                    except queue.Empty:
+                        # Comment line keeps proxies from closing an idle stream
+                        yield ': keep-alive\n\n'
+                        continue
+                    yield f"data: {json.dumps(status)}\n\n"
+                    if status.get('status') in FINAL_STATUSES:
+                        return
+            finally:
+                watcher.unsubscribe(updates)
+        
+        return Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
     @app.route('/enroll/process', methods=['POST'])
     @login_required
@@ -505,6 +541,8 @@ def register_routes(app):
         try:
             student_id = session['enrollment_student_id']
             finger_id = session['enrollment_finger_id']
+            device_id = session.get('enrollment_device_id')
+            fingerprint_sensor = device_registry.get_sensor(device_id=device_id)
 
             # Start enrollment process on ESP32
             result = fingerprint_sensor.enroll_finger(finger_id)
@@ -514,6 +552,7 @@ def register_routes(app):
                 fingerprint = Fingerprint(
                     student_id=student_id,
                     finger_id=finger_id,
+                    device_id=device_id,
                     created_at=datetime.utcnow()
                 )
                 
@@ -523,6 +562,7 @@ def register_routes(app):
                 # Clear enrollment session data
                 session.pop('enrollment_student_id', None)
                 session.pop('enrollment_finger_id', None)
+                session.pop('enrollment_device_id', None)
 
                 student = Student.query.get(student_id)
                 return jsonify({
@@ -571,10 +611,11 @@ def register_routes(app):
             flash(f'Attendance recorded for {student.first_name} {student.last_name} in {course.title}', 'success')
             return redirect(url_for('attendance'))
         
-        # Get attendance records for display
+        # Get attendance records for display (populate relationships from the joins)
         attendance_records = (Attendance.query
                               .join(Student)
                               .join(Course)
+                              .options(contains_eager(Attendance.student), contains_eager(Attendance.course))
                               .order_by(Attendance.timestamp.desc())
                               .limit(100)
                               .all())
@@ -587,86 +628,93 @@ def register_routes(app):
     def scan():
         """Page to scan fingerprint for attendance"""
         courses = Course.query.all()
-        return render_template('scan.html', title='Scan Fingerprint', courses=courses)
+        return render_template('scan.html', title='Scan Fingerprint', courses=courses,
+                               devices=device_registry.get_devices())
     
     @app.route('/scan/verify', methods=['POST'])
     @login_required
     def verify_fingerprint():
-        """AJAX endpoint to verify a fingerprint and record attendance"""
+        """AJAX endpoint to start verifying a fingerprint and recording attendance"""
         course_id = request.form.get('course_id')
         
-        if not course_id:
+        if not course_id or not course_id.isdigit():
             return jsonify({'status': 'error', 'message': 'Course is required'})
         
+        # Dispatch to the chosen sensor, else the one for this course or room
+        device = device_registry.resolve(device_id=request.form.get('device_id'), course_id=course_id,
+                                         room=request.form.get('room'))
+        fingerprint_sensor = device_registry.get_device_sensor(device)
+        if fingerprint_sensor is None:
+            return jsonify({'status': 'error', 'message': 'No fingerprint sensor configured for this course'})
+        if not fingerprint_sensor.is_available():
+            # The sensor's circuit is open; don't queue a scan that would fail anyway
+            return jsonify({'status': 'error', 'message': 'Fingerprint sensor is offline, please try again shortly'}), 503
+        
+        # Waiting for the finger happens on the scan pool, not in this request worker
         try:
-            # Attempt to connect to the sensor if not already connected
-            if not fingerprint_sensor.is_connected:
-                if not fingerprint_sensor.connect():
-                    return jsonify({
-                        'status': 'error',
-                        'message': 'Failed to connect to fingerprint sensor'
-                    })
-
-            # Verify fingerprint using ESP32
-            result = fingerprint_sensor.verify_finger()
-            
-            if result.get('success'):
-                finger_id = result.get('finger_id')
-                # Look up the student by their enrolled fingerprint
-                fingerprint = Fingerprint.query.filter_by(finger_id=finger_id).first()
-                
-                if not fingerprint:
-                    return jsonify({
-                        'status': 'error',
-                        'message': 'Fingerprint found but not enrolled in system'
-                    })
-
-                # Record attendance for the matched student
-                attendance = attendance_manager.record_attendance(
-                    student_id=fingerprint.student_id,
-                    course_id=int(course_id),
-                    status='present'
-                )
-                
-                if attendance:
-                    student = Student.query.get(fingerprint.student_id)
-                    return jsonify({
-                        'status': 'success', 
-                        'message': f'Attendance recorded for {student.first_name} {student.last_name}'
-                    })
-                else:
-                    return jsonify({
-                        'status': 'error',
-                        'message': 'Failed to record attendance in database'
-                    })
-            else:
-                return jsonify({
-                    'status': 'error',
-                    'message': result.get('message', 'No match found')
-                })
-                
-        except Exception as e:
-            logger.error(f"Error during fingerprint verification: {str(e)}")
-            return jsonify({
-                'status': 'error',
-                'message': f'Verification error: {str(e)}'
-            })
+            # The finger ID the sensor matches is one of that device's slots
+            job_id = scan_jobs.submit(fingerprint_sensor, int(course_id), device.id if device else None)
+        except ScanQueueFull:
+            return jsonify({'status': 'error', 'message': 'Too many scans in progress, please try again'}), 503
+        
+        return jsonify({
+            'status': 'pending',
+            'job_id': job_id,
+            'status_url': url_for('scan_result', job_id=job_id)
+        }), 202
+    
+    @app.route('/scan/jobs/<job_id>', methods=['GET'])
+    @login_required
+    def scan_result(job_id):
+        """Long-poll for a scan result; `wait` is the number of seconds to wait for it"""
+        result = scan_jobs.get_result(job_id, wait=request.args.get('wait', 0, type=float))
+        if result is None:
+            return jsonify({'status': 'error', 'message': 'Scan not found'}), 404
+        return jsonify(result), 200
     
     @app.route('/sync', methods=['GET'])
     @login_required
     def sync_data():
-        """Sync attendance data with central server"""
-        # This would handle the sync operation with the remote server
-        # For our demo, we'll just simulate success
-        result = attendance_manager.sync_attendance_data()
+        """Queue a background sync of attendance data with the central server"""
+        wants_json = request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'application/json'
+        try:
+            job_id = sync_worker.enqueue()
+        except SyncQueueFull:
+            if wants_json:
+                return jsonify({'status': 'error', 'message': 'Sync queue is full, try again later'}), 503
+            flash('Sync queue is full, please try again later', 'danger')
+            return redirect(url_for('attendance'))
         
-        if result['status'] == 'success':
-            flash(f'Successfully synced {result["count"]} attendance records', 'success')
-        else:
-            flash(f'Sync failed: {result["message"]}', 'danger')
-            
+        if wants_json:
+            return jsonify({
+                'status': 'queued',
+                'job_id': job_id,
+                'status_url': url_for('sync_status', job_id=job_id)
+            }), 202
+        
+        flash('Sync started in the background', 'info')
         return redirect(url_for('attendance'))
 
+    @app.route('/sync/<job_id>', methods=['GET'])
+    @login_required
+    def sync_status(job_id):
+        """Report the progress of a background sync job"""
+        job = sync_worker.get_job(job_id)
+        if not job:
+            return jsonify({'error': 'Sync job not found'}), 404
+        return jsonify(serialize_job(job)), 200
+
+    @app.route('/sensor/stats', methods=['GET'])
+    @login_required
+    def sensor_stats():
+        """Report health, call counts and latency of requests to each fingerprint sensor"""
+        return jsonify([{
+            'base_url': sensor.base_url,
+            'connected': sensor.is_connected,
+            'health': sensor.get_health(),
+            'operations': sensor.get_latency_stats()
+        } for sensor in list(device_registry.clients.values())]), 200
+
     @app.route('/api/enrollment/available', methods=['GET'])
     @login_required
     def get_unenrolled_students():
@@ -674,8 +722,7 @@ def register_routes(app):
         try:
             # Query for students without fingerprint records
             unenrolled_students = Student.query\
-                .outerjoin(Fingerprint)\
-                .filter(Fingerprint.id.is_(None))\
+                .filter(~Student.fingerprints.any())\
                 .all()
             
             students_data = []
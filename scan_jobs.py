@@ -0,0 +1,249 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from models import ScanJob
+from extensions import db
+from attendance_manager import AttendanceManager
+from fingerprint_index import fingerprint_index
+
+logger = logging.getLogger(__name__)
+
+# Threads waiting on sensors; one scan occupies a thread for up to the verify timeout
+SCAN_WORKERS = 16
+
+# Scans accepted but not finished before new ones are refused
+SCAN_MAX_PENDING = 64
+
+# Longest a status request may wait for a scan to finish. A waiting request holds a
+# web worker (thread or process) for this long, so a deployment with sync workers needs
+# about one spare worker per browser waiting on a scan; keep it short
+SCAN_MAX_WAIT = 2
+
+# Seconds between database checks when the scan runs in another process
+SCAN_POLL_INTERVAL = 0.25
+
+# Longest a scan waits for its sensor while other scans are using it
+SCAN_LOCK_WAIT = 30
+
+# A pending scan older than this is failed when polled: the sensor wait plus the connect
+# and verify timeouts fit well within it, so the process that ran the scan has died
+SCAN_JOB_TIMEOUT = timedelta(seconds=60)
+
+# Finished scan jobs are deleted after this long
+SCAN_JOB_RETENTION = timedelta(hours=1)
+
+# Least seconds between deletions of old scan jobs by one process
+SCAN_PRUNE_INTERVAL = 300
+
+
+class ScanQueueFull(Exception):
+    """Raised when too many scans are already in progress"""
+
+
+def verify_and_record(sensor, course_id, manager, device_id=None):
+    """
+    Wait for a finger on a sensor and record attendance for the matched student
+
+    Args:
+        sensor (FingerPrintSensor): Sensor to scan on
+        course_id (int): Database ID of the course
+        manager (AttendanceManager): Manager used to record attendance
+        device_id (int, optional): Database ID of the sensor's device (None for the default sensor),
+            whose slots the matched finger ID refers to
+
+    Returns:
+        dict: status ('success' or 'error') and message for the browser
+    """
+    try:
+        # Attempt to connect to the sensor if not already connected
+        if not sensor.is_connected:
+            if not sensor.connect():
+                return {'status': 'error', 'message': 'Failed to connect to fingerprint sensor'}
+
+        # Verify fingerprint using ESP32
+        result = sensor.verify_finger()
+        if not result.get('success'):
+            return {'status': 'error', 'message': result.get('message', 'No match found')}
+
+        # Look up the student by their enrolled fingerprint (in-memory index)
+        student = fingerprint_index.lookup(result.get('finger_id'), device_id)
+        if not student:
+            return {'status': 'error', 'message': 'Fingerprint found but not enrolled in system'}
+
+        # Record attendance for the matched student
+        attendance, duplicate = manager.record_scan(student_id=student.id, course_id=course_id, status='present')
+        if not attendance:
+            return {'status': 'error', 'message': 'Failed to record attendance in database'}
+
+        name = f"{student.first_name} {student.last_name}"
+        if duplicate:
+            return {'status': 'success', 'duplicate': True, 'message': f'Already recorded for {name}'}
+        return {'status': 'success', 'duplicate': False, 'message': f'Attendance recorded for {name}'}
+
+    except Exception as e:
+        logger.error(f"Error during fingerprint verification: {str(e)}")
+        return {'status': 'error', 'message': f'Verification error: {str(e)}'}
+
+
+class ScanJobManager:
+    """
+    Runs fingerprint scans on a thread pool instead of in request workers
+
+    A scan request only stores a ScanJob and returns its ID; a pool thread
+    waits for the finger and records attendance. Status requests long-poll:
+    jobs started by this process are awaited on an in-memory event, jobs
+    from other processes by re-reading the row. Scans on the same sensor
+    run one at a time, since the ESP32 reads one finger at a time.
+    """
+
+    def __init__(self, manager, workers=SCAN_WORKERS, max_pending=SCAN_MAX_PENDING):
+        """
+        Initialize the manager (the pool starts with the first scan)
+
+        Args:
+            manager (AttendanceManager): Manager used to record attendance
+            workers (int): Pool threads
+            max_pending (int): Unfinished scans accepted before new ones are refused
+        """
+        self.manager = manager
+        self.workers = workers
+        self.max_pending = max_pending
+        self.app = None
+        self.executor = None
+        self.events = {}
+        self.sensor_locks = {}
+        self.pruned_at = None
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        """Bind the manager to the Flask app whose context scans run in"""
+        self.app = app
+
+    def submit(self, sensor, course_id, device_id=None):
+        """
+        Start a scan in the background
+
+        Args:
+            sensor (FingerPrintSensor): Sensor to scan on
+            course_id (int): Database ID of the course
+            device_id (int, optional): Database ID of the sensor's device (None for the default sensor)
+
+        Returns:
+            str: ID of the scan job
+
+        Raises:
+            ScanQueueFull: If max_pending scans are already running in this process
+        """
+        with self.lock:
+            if len(self.events) >= self.max_pending:
+                raise ScanQueueFull('Too many scans in progress')
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scan')
+
+            job = ScanJob(id=uuid.uuid4().hex, course_id=course_id, status='pending')
+            db.session.add(job)
+            db.session.commit()
+
+            self.events[job.id] = threading.Event()
+            sensor_lock = self.sensor_locks.setdefault(sensor.base_url, threading.Lock())
+
+        self.executor.submit(self.run, job.id, sensor, sensor_lock, course_id, device_id)
+        return job.id
+
+    def run(self, job_id, sensor, sensor_lock, course_id, device_id=None):
+        """Run one scan and store its result"""
+        try:
+            with self.app.app_context():
+                try:
+                    if sensor_lock.acquire(timeout=SCAN_LOCK_WAIT):
+                        try:
+                            result = verify_and_record(sensor, course_id, self.manager, device_id)
+                        finally:
+                            sensor_lock.release()
+                    else:
+                        result = {'status': 'error', 'message': 'Fingerprint sensor is busy, please try again'}
+                    job = db.session.get(ScanJob, job_id)
+                    job.status = 'done'
+                    job.result = json.dumps(result)
+                    job.finished_at = datetime.utcnow()
+                    db.session.commit()
+                    self.prune()
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            logger.error(f"Scan job {job_id} crashed: {str(e)}")
+        finally:
+            with self.lock:
+                event = self.events.pop(job_id, None)
+            if event:
+                event.set()
+
+    def prune(self):
+        """Delete old scan jobs, at most once per SCAN_PRUNE_INTERVAL (runs on pool threads)"""
+        with self.lock:
+            now = time.monotonic()
+            if self.pruned_at is not None and now - self.pruned_at < SCAN_PRUNE_INTERVAL:
+                return
+            self.pruned_at = now
+        count = db.session.query(ScanJob).filter(
+            ScanJob.created_at < datetime.utcnow() - SCAN_JOB_RETENTION
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        if count:
+            logger.info(f"Deleted {count} old scan jobs")
+
+    def get_result(self, job_id, wait=0):
+        """
+        Get a scan's result, waiting up to `wait` seconds for it to finish
+
+        Args:
+            job_id (str): ID returned by submit()
+            wait (float): Seconds to wait for an unfinished scan (capped at SCAN_MAX_WAIT)
+
+        Returns:
+            dict: 'job_id' and 'state' ('pending' or 'done'), plus the scan's
+                  status and message once done; None if the job is unknown
+
+        A job still pending after SCAN_JOB_TIMEOUT is finished with an error,
+        so browsers stop waiting on a scan whose process died.
+        """
+        deadline = time.monotonic() + min(max(wait, 0), SCAN_MAX_WAIT)
+        event = self.events.get(job_id)
+        if event:
+            event.wait(max(deadline - time.monotonic(), 0))
+
+        while True:
+            job = db.session.get(ScanJob, job_id, populate_existing=True)
+            if job is None:
+                return None
+            if job.status == 'done':
+                return dict(json.loads(job.result), job_id=job_id, state='done')
+            if job_id not in self.events and job.created_at < datetime.utcnow() - SCAN_JOB_TIMEOUT:
+                self.fail_stale(job_id)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return {'job_id': job_id, 'state': 'pending'}
+            # Running in another process; check again shortly
+            db.session.rollback()
+            time.sleep(min(SCAN_POLL_INTERVAL, remaining))
+
+    def fail_stale(self, job_id):
+        """Finish a scan job abandoned by its process with an error result"""
+        logger.warning(f"Scan job {job_id} did not finish in time; marking it failed")
+        db.session.execute(
+            update(ScanJob)
+            .where(ScanJob.id == job_id, ScanJob.status == 'pending')
+            .values(status='done', finished_at=datetime.utcnow(), result=json.dumps({
+                'status': 'error', 'message': 'Scan timed out, please try again'
+            }))
+        )
+        db.session.commit()
+
+
+scan_jobs = ScanJobManager(AttendanceManager())
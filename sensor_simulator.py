@@ -0,0 +1,284 @@
+"""
+Local ESP32 fingerprint sensor simulator for load and latency testing
+
+Serves the HTTP endpoints of arduino_fingerprint_system/fingerprint_attendance.ino
+(plus /enrollment/start, which FingerPrintSensor uses to pick a finger ID)
+from a thread per connection, so many backend clients can drive it at once.
+Response latency, failure rates and the enrolled finger population are
+configurable; /verify reports a random enrolled finger, as if that student
+had put their finger on the sensor.
+
+Usage:
+    python sensor_simulator.py [--port 8080] [--fingers 100] [--latency 0.02] [--verify-latency 0.2]
+                               [--error-rate 0.01] [--drop-rate 0] [--no-match-rate 0.05]
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Templates the AS608/R307 sensor module can store
+SENSOR_CAPACITY = 127
+
+# Size of the template the firmware reports on a completed enrollment
+SIMULATED_TEMPLATE_SIZE = 512
+
+# Enrollment progress steps reported by /enrollment-status, as in the firmware
+ENROLLMENT_STEPS = (
+    ('waiting', 0, 'Place finger on sensor'),
+    ('in_progress', 25, 'First scan captured'),
+    ('in_progress', 50, 'Remove finger'),
+    ('waiting', 60, 'Place same finger again'),
+    ('in_progress', 75, 'Second scan captured'),
+    ('complete', 100, 'Enrollment complete'),
+)
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    """Keep-alive handler dispatching to the SensorSimulator behind the server"""
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, Nagle's algorithm
+    # and delayed ACKs add ~40 ms to every keep-alive response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        simulator = self.server.simulator
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+
+        status, data = simulator.handle(method, self.path, body)
+        if status is None:
+            # Simulated network failure: drop the connection without a response
+            self.close_connection = True
+            return
+
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class SensorSimulator:
+    """
+    Simulated ESP32 with a fingerprint sensor
+
+    Every request waits `latency` seconds (or the endpoint's entry in
+    `latencies`) with +/- `jitter` spread, then fails with a 500 at
+    `error_rate` or is dropped without a response at `drop_rate`.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, fingers=100, latency=0.0, latencies=None, jitter=0.0,
+                 error_rate=0.0, drop_rate=0.0, no_match_rate=0.0, capacity=SENSOR_CAPACITY, seed=None):
+        """
+        Initialize the simulator (call start() to serve)
+
+        Args:
+            host (str): Interface to listen on
+            port (int): Port to listen on (0 picks a free port)
+            fingers: Number of enrolled fingers (IDs 1..fingers), or an iterable of finger IDs
+            latency (float): Seconds each request takes
+            latencies (dict, optional): Seconds per endpoint path overriding latency (e.g. {'/verify': 0.3})
+            jitter (float): Fraction of the latency added or removed at random
+            error_rate (float): Fraction of requests answered with a 500 error
+            drop_rate (float): Fraction of requests whose connection is closed without a response
+            no_match_rate (float): Fraction of /verify calls reporting no match
+            capacity (int): Templates the sensor can store
+            seed (int, optional): Random seed for reproducible runs
+        """
+        self.latency = latency
+        self.latencies = dict(latencies or {})
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.no_match_rate = no_match_rate
+        self.capacity = capacity
+        if isinstance(fingers, int):
+            fingers = range(1, min(fingers, capacity) + 1)
+        self.fingers = set(fingers)
+        self.enrollment_step = None
+        self.requests = {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer((host, port), SimulatorHandler)
+        self.server.daemon_threads = True
+        self.server.simulator = self
+        self.thread = None
+
+    @property
+    def address(self):
+        """(host, port) the simulator listens on"""
+        return self.server.server_address[:2]
+
+    def start(self):
+        """Serve requests on a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever, name='sensor-simulator', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle(self, method, path, body):
+        """
+        Answer one request
+
+        Args:
+            method (str): HTTP method
+            path (str): Request path
+            body (bytes): Request body
+
+        Returns:
+            tuple: (HTTP status, JSON-serializable body), or (None, None) to drop the connection
+        """
+        path = path.split('?', 1)[0]
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            delay = self.latencies.get(path, self.latency)
+            delay *= 1 + self.random.uniform(-self.jitter, self.jitter)
+            roll = self.random.random()
+        if delay > 0:
+            time.sleep(delay)
+
+        if roll < self.drop_rate:
+            return None, None
+        if roll < self.drop_rate + self.error_rate:
+            return 500, {'success': False, 'status': 'sensor error', 'message': 'Simulated sensor error'}
+
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {'success': False, 'message': 'Invalid JSON'}
+
+        route = {
+            ('GET', '/status'): self.status,
+            ('POST', '/init'): self.init,
+            ('POST', '/enroll'): self.enroll,
+            ('POST', '/verify'): self.verify,
+            ('POST', '/delete'): self.delete,
+            ('GET', '/template-count'): self.template_count,
+            ('POST', '/start-enrollment'): self.start_enrollment,
+            ('GET', '/enrollment-status'): self.enrollment_status,
+            ('GET', '/enrollment/start'): self.next_finger_id,
+        }.get((method, path))
+        if route is None:
+            return 404, {'success': False, 'message': 'Not found'}
+        with self.lock:
+            return route(data)
+
+    def status(self, data):
+        return 200, {'status': 'connected'}
+
+    def init(self, data):
+        # FingerPrintSensor.start_enrollment() sends its command through /init
+        if data.get('command') == 'start_enrollment':
+            return self.start_enrollment(data)
+        return 200, {'success': True}
+
+    def enroll(self, data):
+        finger_id = data.get('finger_id')
+        if not isinstance(finger_id, int) or not 1 <= finger_id <= self.capacity:
+            return 500, {'success': False, 'message': 'Enrollment failed: -5'}
+        self.fingers.add(finger_id)
+        return 200, {'success': True, 'message': 'Enrollment successful'}
+
+    def verify(self, data):
+        if not self.fingers or self.random.random() < self.no_match_rate:
+            return 404, {'success': False, 'message': 'No match found'}
+        finger_id = self.random.choice(tuple(self.fingers))
+        return 200, {'success': True, 'finger_id': finger_id, 'confidence': self.random.randint(50, 250)}
+
+    def delete(self, data):
+        if data.get('finger_id') not in self.fingers:
+            return 500, {'success': False, 'message': 'Failed to delete'}
+        self.fingers.discard(data['finger_id'])
+        return 200, {'success': True}
+
+    def template_count(self, data):
+        return 200, {'count': len(self.fingers)}
+
+    def start_enrollment(self, data):
+        if self.enrollment_step is not None:
+            return 400, {'success': False, 'message': 'Enrollment already in progress'}
+        self.enrollment_step = 0
+        return 200, {'success': True, 'message': 'Enrollment started'}
+
+    def enrollment_status(self, data):
+        """Advance the enrollment by one step per status request, as if the finger followed the prompts"""
+        if self.enrollment_step is None:
+            return 200, {'status': 'error', 'progress': 0, 'message': 'No enrollment in progress'}
+        status, progress, message = ENROLLMENT_STEPS[self.enrollment_step]
+        response = {'status': status, 'progress': progress, 'message': message}
+        if status == 'complete':
+            self.enrollment_step = None
+            response['template_data'] = {
+                'size': SIMULATED_TEMPLATE_SIZE,
+                'data': base64.b64encode(os.urandom(SIMULATED_TEMPLATE_SIZE)).decode(),
+            }
+        else:
+            self.enrollment_step += 1
+        return 200, response
+
+    def next_finger_id(self, data):
+        free = next((finger_id for finger_id in range(1, self.capacity + 1) if finger_id not in self.fingers), None)
+        if free is None:
+            return 200, {'status': 'error', 'message': 'Sensor memory is full'}
+        return 200, {'status': 'success', 'nextId': free}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--fingers', type=int, default=100, help='Number of enrolled fingers')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds per request')
+    parser.add_argument('--verify-latency', type=float, help='Seconds per /verify (finger capture)')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Fraction of latency added or removed at random')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Fraction of connections dropped')
+    parser.add_argument('--no-match-rate', type=float, default=0.0, help='Fraction of /verify calls without a match')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    simulator = SensorSimulator(
+        args.host, args.port, fingers=args.fingers, latency=args.latency,
+        latencies={'/verify': args.verify_latency} if args.verify_latency is not None else None,
+        jitter=args.jitter, error_rate=args.error_rate, drop_rate=args.drop_rate,
+        no_match_rate=args.no_match_rate, seed=args.seed,
+    )
+    host, port = simulator.address
+    print(f"Simulating ESP32 with {len(simulator.fingers)} fingers at http://{host}:{port} (Ctrl+C to stop)")
+    try:
+        simulator.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -30,52 +30,77 @@ function initializeEnrollment() {
         let enrollmentComplete = false;
         let enrollmentFailed = false;
         
-        // Poll enrollment status
-        const statusInterval = setInterval(function() {
-            if (enrollmentComplete || enrollmentFailed) {
-                clearInterval(statusInterval);
-                return;
-            }
+        function updateEnrollment(data) {
+            // Update progress bar
+            progressBar.style.width = data.progress + '%';
+            progressBar.setAttribute('aria-valuenow', data.progress);
+            
+            // Update status message
+            enrollmentStatus.textContent = data.message;
             
-            fetch('/enroll/status')
-                .then(response => response.json())
-                .then(data => {
-                    // Update progress bar
-                    progressBar.style.width = data.progress + '%';
-                    progressBar.setAttribute('aria-valuenow', data.progress);
-                    
-                    // Update status message
-                    enrollmentStatus.textContent = data.message;
-                    
-                    if (data.status === 'waiting') {
-                        fingerprintAnimation.classList.remove('scanning');
-                    } else if (data.status === 'in_progress') {
-                        fingerprintAnimation.classList.add('scanning');
-                    } else if (data.status === 'complete') {
-                        enrollmentComplete = true;
-                        fingerprintAnimation.classList.remove('scanning');
-                        
-                        // Show success icon
-                        if (successIcon) {
-                            successIcon.classList.remove('d-none');
-                        }
-                        
-                        // Enable and show the "Done" button
-                        cancelEnrollBtn.textContent = 'Done';
-                        cancelEnrollBtn.classList.remove('btn-secondary');
-                        cancelEnrollBtn.classList.add('btn-success');
-                        
-                        // Show success message
-                        showToast('Enrollment completed successfully!', 'success');
-                    } else if (data.status === 'error') {
-                        enrollmentFailed = true;
-                        showToast('Enrollment failed: ' + data.message, 'error');
-                    }
-                })
-                .catch(error => {
-                    console.error('Error checking enrollment status:', error);
-                });
-        }, 1000);
+            if (data.status === 'waiting') {
+                fingerprintAnimation.classList.remove('scanning');
+            } else if (data.status === 'in_progress') {
+                fingerprintAnimation.classList.add('scanning');
+            } else if (data.status === 'complete') {
+                enrollmentComplete = true;
+                fingerprintAnimation.classList.remove('scanning');
+                
+                // Show success icon
+                if (successIcon) {
+                    successIcon.classList.remove('d-none');
+                }
+                
+                // Enable and show the "Done" button
+                cancelEnrollBtn.textContent = 'Done';
+                cancelEnrollBtn.classList.remove('btn-secondary');
+                cancelEnrollBtn.classList.add('btn-success');
+                
+                // Show success message
+                showToast('Enrollment completed successfully!', 'success');
+            } else if (data.status === 'error') {
+                enrollmentFailed = true;
+                showToast('Enrollment failed: ' + data.message, 'error');
+            }
+        }
+        
+        function pollEnrollment() {
+            const statusInterval = setInterval(function() {
+                if (enrollmentComplete || enrollmentFailed) {
+                    clearInterval(statusInterval);
+                    return;
+                }
+                
+                fetch('/enroll/status')
+                    .then(response => response.json())
+                    .then(updateEnrollment)
+                    .catch(error => {
+                        console.error('Error checking enrollment status:', error);
+                    });
+            }, 1000);
+        }
+        
+        if (window.EventSource) {
+            // The server pushes each progress change as it happens
+            const events = new EventSource('/enroll/events');
+            events.onmessage = function(event) {
+                updateEnrollment(JSON.parse(event.data));
+                if (enrollmentComplete || enrollmentFailed) {
+                    events.close();
+                }
+            };
+            events.onerror = function(error) {
+                // EventSource reconnects on its own unless the server turned streaming down (204)
+                if (events.readyState === EventSource.CLOSED && !enrollmentComplete && !enrollmentFailed) {
+                    pollEnrollment();
+                    return;
+                }
+                console.error('Enrollment event stream error:', error);
+            };
+        } else {
+            // Poll enrollment status on browsers without server-sent events
+            pollEnrollment();
+        }
     }
     
     // Setup start enrollment button
@@ -117,12 +142,17 @@ function initializeScanning() {
             // Send scan request
             const formData = new FormData();
             formData.append('course_id', courseSelect.value);
+            const deviceSelect = document.getElementById('deviceSelect');
+            if (deviceSelect && deviceSelect.value) {
+                formData.append('device_id', deviceSelect.value);
+            }
             
             fetch('/scan/verify', {
                 method: 'POST',
                 body: formData
             })
             .then(response => response.json())
+            .then(data => data.status_url ? waitForScan(data.status_url) : data)
             .then(data => {
                 fingerprintAnimation.classList.remove('scanning');
                 startScanBtn.disabled = false;
@@ -155,6 +185,41 @@ function initializeScanning() {
     }
 }
 
+// Longest the browser waits for a scan result (the server fails scans after 60 seconds)
+const SCAN_DEADLINE_MS = 90000;
+
+// Failed status requests in a row before giving up on a scan
+const SCAN_MAX_RETRIES = 3;
+
+/**
+ * Long-poll a background scan until its result is available
+ * (short waits, so a pending scan does not tie up a server worker for long)
+ * @param {string} statusUrl - Status URL returned when the scan was started
+ * @param {number} deadline - Time (ms since epoch) after which to stop waiting
+ * @param {number} failures - Failed status requests in a row so far
+ */
+function waitForScan(statusUrl, deadline = Date.now() + SCAN_DEADLINE_MS, failures = 0) {
+    if (Date.now() > deadline) {
+        return Promise.resolve({ status: 'error', message: 'Scan timed out, please try again' });
+    }
+    return fetch(`${statusUrl}?wait=2`)
+        .then(response => {
+            if (!response.ok && response.status !== 404) {
+                throw new Error(`Scan status request failed (${response.status})`);
+            }
+            return response.json();
+        })
+        .then(data => data.state === 'pending' ? waitForScan(statusUrl, deadline) : data,
+              error => {
+                  if (failures + 1 >= SCAN_MAX_RETRIES) {
+                      throw error;
+                  }
+                  // Back off briefly before asking again
+                  return new Promise(resolve => setTimeout(resolve, 1000))
+                      .then(() => waitForScan(statusUrl, deadline, failures + 1));
+              });
+}
+
 /**
  * Sync attendance data with the server
  */
@@ -163,19 +228,15 @@ function syncAttendanceData() {
     document.getElementById('syncBtn').classList.add('disabled');
     document.getElementById('syncSpinner').classList.remove('d-none');
     
-    fetch('/sync')
-        .then(response => {
+    // The sync runs in the background; queue it and poll its status
+    fetch('/sync', { headers: { 'Accept': 'application/json' } })
+        .then(response => response.json().then(data => {
             if (!response.ok) {
-                throw new Error('Network response was not ok');
+                throw new Error(data.message || 'Network response was not ok');
             }
-            return response.text();
-        })
-        .then(html => {
-            // Update the page with the new content
-            // This is a simple approach - in a more complex app, you might
-            // want to use fetch with JSON and update specific elements
-            document.location.reload();
-        })
+            return data;
+        }))
+        .then(data => pollSyncJob(data.status_url))
         .catch(error => {
             console.error('Error syncing attendance data:', error);
             showToast('Error syncing attendance data', 'error');
@@ -186,6 +247,31 @@ function syncAttendanceData() {
         });
 }
 
+/**
+ * Poll a background sync job until it finishes
+ * @param {string} statusUrl - Status URL returned when the job was queued
+ */
+function pollSyncJob(statusUrl) {
+    return fetch(statusUrl)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        })
+        .then(job => {
+            if (job.status === 'queued' || job.status === 'running') {
+                return new Promise(resolve => setTimeout(resolve, 1000))
+                    .then(() => pollSyncJob(statusUrl));
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Sync failed');
+            }
+            showToast(`Successfully synced ${job.synced_count} attendance records`, 'success');
+            document.location.reload();
+        });
+}
+
 /**
  * Display a toast notification
  * @param {string} message - Message to display
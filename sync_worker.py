@@ -0,0 +1,203 @@
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from models import SyncJob
+from extensions import db
+from attendance_manager import AttendanceManager, SyncError
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of sync jobs waiting for the worker
+SYNC_QUEUE_SIZE = 16
+
+# Attempts per batch before a job fails, and the exponential backoff between them
+SYNC_MAX_ATTEMPTS = 5
+SYNC_BACKOFF_BASE = 1.0
+SYNC_BACKOFF_MAX = 60.0
+
+
+class SyncQueueFull(Exception):
+    """Raised when a sync job cannot be queued because the queue is full"""
+
+
+class SyncWorker:
+    """
+    Background thread that pushes unsynced attendance to the central server
+
+    Web requests only create a SyncJob row and put its ID on a bounded
+    queue; the worker thread runs the sync in batches, retrying failed
+    batches with exponential backoff and full jitter. Job status lives in
+    the database so any web worker process can report it.
+    """
+
+    def __init__(self, manager, queue_size=SYNC_QUEUE_SIZE, max_attempts=SYNC_MAX_ATTEMPTS,
+                 backoff_base=SYNC_BACKOFF_BASE, backoff_max=SYNC_BACKOFF_MAX):
+        """
+        Initialize the worker (the thread starts with the first job)
+
+        Args:
+            manager (AttendanceManager): Manager that reads and sends attendance batches
+            queue_size (int): Maximum number of queued jobs
+            max_attempts (int): Attempts per batch before the job fails
+            backoff_base (float): Seconds before the first retry, doubled on every retry
+            backoff_max (float): Upper bound of the backoff between retries
+        """
+        self.manager = manager
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.app = None
+        self.thread = None
+        self.pending_job_id = None
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        """Bind the worker to the Flask app whose context jobs run in"""
+        self.app = app
+
+    def start(self):
+        """Start the worker thread if it is not running (after a fork it is restarted lazily)"""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='attendance-sync', daemon=True)
+                self.thread.start()
+
+    def enqueue(self):
+        """
+        Queue a sync of all unsynced attendance
+
+        A job that is still waiting in this process is reused, since it will
+        pick up every record anyway.
+
+        Returns:
+            str: ID of the queued job
+
+        Raises:
+            SyncQueueFull: If the queue has no room for another job
+        """
+        with self.lock:
+            if self.pending_job_id:
+                return self.pending_job_id
+
+            job = SyncJob(id=uuid.uuid4().hex, status='queued')
+            db.session.add(job)
+            db.session.commit()
+
+            try:
+                self.queue.put_nowait(job.id)
+            except queue.Full:
+                job.status = 'failed'
+                job.error = 'Sync queue is full'
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+                raise SyncQueueFull('Sync queue is full')
+
+            self.pending_job_id = job.id
+
+        self.start()
+        return job.id
+
+    def get_job(self, job_id):
+        """
+        Look up a sync job
+
+        Args:
+            job_id (str): ID returned by enqueue()
+
+        Returns:
+            SyncJob: The job, or None if unknown
+        """
+        return db.session.get(SyncJob, job_id)
+
+    def run(self):
+        """Process queued jobs forever"""
+        while True:
+            job_id = self.queue.get()
+            try:
+                with self.app.app_context():
+                    try:
+                        self.process(job_id)
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                logger.error(f"Sync job {job_id} crashed: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    def process(self, job_id):
+        """
+        Run one sync job to completion
+
+        Args:
+            job_id (str): ID of the job to run
+        """
+        with self.lock:
+            if self.pending_job_id == job_id:
+                self.pending_job_id = None
+
+        job = db.session.get(SyncJob, job_id)
+        if job is None:
+            return
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+
+        def push(batch):
+            self.push_with_backoff(job, batch)
+
+        def on_batch(count):
+            job.synced_count += count
+            db.session.commit()
+
+        result = self.manager.sync_attendance_data(push=push, on_batch=on_batch)
+
+        job.status = 'succeeded' if result['status'] == 'success' else 'failed'
+        job.error = None if result['status'] == 'success' else result['message']
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        logger.info(f"Sync job {job_id} {job.status}: {job.synced_count} records")
+
+    def push_with_backoff(self, job, batch):
+        """
+        Send a batch, retrying failures with exponential backoff
+
+        Args:
+            job (SyncJob): Job whose attempt counter is updated
+            batch (list): Records to send
+
+        Raises:
+            SyncError: If every attempt failed
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            job.attempts += 1
+            try:
+                self.manager.push_attendance_batch(batch)
+                return
+            except SyncError as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+                logger.warning(f"Sync attempt {attempt} failed ({str(e)}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+
+def serialize_job(job):
+    """Convert a SyncJob into a JSON-serializable dictionary"""
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'synced_count': job.synced_count,
+        'attempts': job.attempts,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+sync_worker = SyncWorker(AttendanceManager())
@@ -0,0 +1,591 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import Fingerprint
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Size in bytes of a sensor template (FPM10A/R307 character file)
+TEMPLATE_SIZE = 512
+
+# Minimum similarity (fraction of matching bits) accepted as a match
+MATCH_THRESHOLD = 0.8
+
+# Rows scored per step, bounding the temporary arrays created while matching
+MATCH_CHUNK_SIZE = 8192
+
+# Bit-sampling LSH parameters: number of hash tables and bits sampled per table
+LSH_TABLES = 32
+LSH_BITS = 12
+LSH_SEED = 20240601
+
+# Below this many templates an exhaustive scan is cheaper than probing buckets
+LSH_MIN_POPULATION = 5000
+
+# Fingerprint IDs loaded per query when syncing templates from the database
+SYNC_CHUNK_SIZE = 1000
+
+# Minimum seconds between rewrites of the persisted index after committed enrollments
+SAVE_INTERVAL = 60
+
+# Number of set bits for every byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint16)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def row_version(updated_at):
+    """
+    Get the version of a Fingerprint row from its updated_at column
+
+    Args:
+        updated_at (datetime): Last write time of the row, or None for rows
+            written before the column existed
+
+    Returns:
+        int: Microseconds since the epoch (0 when unknown)
+    """
+    if updated_at is None:
+        return 0
+    delta = updated_at - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class TemplateMatcher:
+    """
+    Server-side 1:N matcher over every enrolled fingerprint template
+
+    All templates are packed into one contiguous uint8 matrix so a probe
+    template is scored with vectorized XOR and popcount operations instead
+    of a per-row Python loop. Similarity is the fraction of identical bits
+    between probe and stored template.
+
+    For large populations candidates are pruned with bit-sampling LSH: each
+    of LSH_TABLES tables hashes a template by LSH_BITS fixed bit positions,
+    and only templates sharing a bucket with the probe in some table are
+    scored. The matrix and hash keys are updated incrementally as
+    fingerprints are enrolled or deleted, and persisted to disk so a
+    restart only has to load the templates that changed meanwhile. Each
+    row keeps the student ID, finger ID and updated_at version it was
+    loaded with; a sync compares these with the table and reloads rows
+    that differ, so edits that keep the fingerprint ID are picked up too.
+    """
+
+    def __init__(self, template_size=TEMPLATE_SIZE, threshold=MATCH_THRESHOLD, max_age=300,
+                 tables=LSH_TABLES, bits=LSH_BITS, seed=LSH_SEED, index_path=None):
+        """
+        Initialize an empty matcher
+
+        Args:
+            template_size (int): Expected template length in bytes
+            threshold (float): Minimum similarity (0-1) accepted as a match
+            max_age (int): Seconds before re-syncing with the database to pick up other workers' enrollments
+            tables (int): Number of LSH hash tables
+            bits (int): Template bits sampled per LSH table (at most 63)
+            seed (int): Seed for choosing the sampled bit positions
+            index_path (str, optional): File the index is persisted to
+        """
+        self.template_size = template_size
+        self.threshold = threshold
+        self.max_age = max_age
+        self.tables = tables
+        self.bits = bits
+        self.seed = seed
+        self.index_path = index_path
+
+        rng = np.random.default_rng(seed)
+        self.positions = np.stack([
+            rng.choice(template_size * 8, size=bits, replace=False) for _ in range(tables)
+        ])
+        self.weights = np.left_shift(np.uint64(1), np.arange(bits, dtype=np.uint64))
+
+        self.clear()
+        self.loaded_at = None
+        self.saved_at = None
+        self.unsaved = False
+        self.generation = 0
+        self.loaded_generation = -1
+        self.lock = threading.RLock()
+
+    def clear(self):
+        """Drop every stored template"""
+        self.size = 0
+        self.matrix = np.zeros((0, self.template_size), dtype=np.uint8)
+        self.fingerprint_ids = np.zeros(0, dtype=np.int64)
+        self.student_ids = np.zeros(0, dtype=np.int64)
+        self.finger_ids = np.zeros(0, dtype=np.int64)
+        self.versions = np.zeros(0, dtype=np.int64)
+        self.active = np.zeros(0, dtype=bool)
+        self.keys = np.zeros((0, self.tables), dtype=np.uint64)
+        self.buckets = [{} for _ in range(self.tables)]
+        self.rows = {}
+
+    @property
+    def count(self):
+        """Number of active templates"""
+        return len(self.rows)
+
+    def hash_templates(self, templates):
+        """
+        Compute the LSH bucket key of templates in every table
+
+        Args:
+            templates (ndarray): uint8 array of shape (n, template_size)
+
+        Returns:
+            ndarray: uint64 keys of shape (n, tables)
+        """
+        bits = np.unpackbits(templates, axis=1)[:, self.positions].astype(np.uint64)
+        return (bits * self.weights).sum(axis=2, dtype=np.uint64)
+
+    def ensure_capacity(self, extra):
+        """Grow the row arrays geometrically so appends are amortized O(1)"""
+        needed = self.size + extra
+        if needed <= len(self.matrix):
+            return
+        capacity = max(needed, 2 * len(self.matrix), 64)
+
+        def grow(array, shape):
+            grown = np.zeros(shape, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            return grown
+
+        self.matrix = grow(self.matrix, (capacity, self.template_size))
+        self.fingerprint_ids = grow(self.fingerprint_ids, capacity)
+        self.student_ids = grow(self.student_ids, capacity)
+        self.finger_ids = grow(self.finger_ids, capacity)
+        self.versions = grow(self.versions, capacity)
+        self.active = grow(self.active, capacity)
+        self.keys = grow(self.keys, (capacity, self.tables))
+
+    def add_many(self, entries):
+        """
+        Add or replace templates
+
+        Args:
+            entries (list): (fingerprint_id, student_id, finger_id, template, version) tuples,
+                version being row_version() of the row's updated_at
+
+        Returns:
+            int: Number of templates added
+        """
+        with self.lock:
+            valid = []
+            for fingerprint_id, student_id, finger_id, template, version in entries:
+                if fingerprint_id in self.rows:
+                    self.remove(fingerprint_id)
+                if not template or len(template) != self.template_size:
+                    logger.warning(f"Skipping fingerprint {fingerprint_id}: template is not {self.template_size} bytes")
+                    continue
+                valid.append((fingerprint_id, student_id, finger_id, template, version))
+
+            if not valid:
+                return 0
+
+            templates = np.frombuffer(b''.join(entry[3] for entry in valid), dtype=np.uint8)
+            templates = templates.reshape(-1, self.template_size)
+            keys = self.hash_templates(templates)
+
+            self.ensure_capacity(len(valid))
+            start = self.size
+            end = start + len(valid)
+            self.matrix[start:end] = templates
+            self.fingerprint_ids[start:end] = [entry[0] for entry in valid]
+            self.student_ids[start:end] = [entry[1] for entry in valid]
+            self.finger_ids[start:end] = [entry[2] for entry in valid]
+            self.versions[start:end] = [entry[4] for entry in valid]
+            self.active[start:end] = True
+            self.keys[start:end] = keys
+            self.size = end
+
+            for offset, entry in enumerate(valid):
+                row = start + offset
+                self.rows[entry[0]] = row
+                for table, key in enumerate(keys[offset].tolist()):
+                    self.buckets[table].setdefault(key, []).append(row)
+
+            return len(valid)
+
+    def add(self, fingerprint_id, student_id, finger_id, template, version=0):
+        """Add or replace a single template"""
+        return self.add_many([(fingerprint_id, student_id, finger_id, template, version)])
+
+    def remove(self, fingerprint_id):
+        """
+        Remove a template from the matcher
+
+        Args:
+            fingerprint_id (int): Database ID of the Fingerprint row
+
+        Returns:
+            bool: True if the template was present
+        """
+        with self.lock:
+            row = self.rows.pop(fingerprint_id, None)
+            if row is None:
+                return False
+
+            self.active[row] = False
+            for table, key in enumerate(self.keys[row].tolist()):
+                bucket = self.buckets[table].get(key)
+                if bucket:
+                    bucket.remove(row)
+                    if not bucket:
+                        del self.buckets[table][key]
+
+            # Compact once a quarter of the rows are tombstones
+            if self.size >= 64 and self.count < self.size * 3 // 4:
+                self.compact()
+            return True
+
+    def compact(self):
+        """Rewrite the row arrays without deleted templates"""
+        with self.lock:
+            keep = np.flatnonzero(self.active[:self.size])
+            entries = [
+                (int(self.fingerprint_ids[row]), int(self.student_ids[row]),
+                 int(self.finger_ids[row]), self.matrix[row].tobytes(), int(self.versions[row]))
+                for row in keep
+            ]
+            self.clear()
+            self.add_many(entries)
+
+    def candidates(self, template):
+        """
+        Find rows sharing an LSH bucket with a probe template
+
+        Args:
+            template (bytes): Probe template
+
+        Returns:
+            ndarray: Candidate row indices
+        """
+        probe = np.frombuffer(template, dtype=np.uint8).reshape(1, -1)
+        keys = self.hash_templates(probe)[0].tolist()
+        rows = set()
+        for table, key in enumerate(keys):
+            rows.update(self.buckets[table].get(key, ()))
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    def score(self, template, candidates=None):
+        """
+        Compute the similarity of a probe template against stored templates
+
+        Args:
+            template (bytes): Probe template
+            candidates (ndarray, optional): Row indices to score; all rows if omitted
+
+        Returns:
+            ndarray: Similarity (0-1) for each scored row (-1 for deleted rows)
+        """
+        probe = np.frombuffer(template, dtype=np.uint8)
+        total_bits = self.template_size * 8
+        if candidates is None:
+            candidates = np.arange(self.size)
+
+        scores = np.empty(len(candidates), dtype=np.float64)
+        for start in range(0, len(candidates), MATCH_CHUNK_SIZE):
+            chunk_rows = candidates[start:start + MATCH_CHUNK_SIZE]
+            chunk = self.matrix[chunk_rows]
+            distances = POPCOUNT[np.bitwise_xor(chunk, probe)].sum(axis=1)
+            scores[start:start + len(chunk_rows)] = 1.0 - distances / total_bits
+        scores[~self.active[candidates]] = -1.0
+        return scores
+
+    def search(self, template, exhaustive=None):
+        """
+        Find the best stored template for a probe without syncing first
+
+        Args:
+            template (bytes): Probe template
+            exhaustive (bool, optional): Force (True) or skip (False) the full scan;
+                by default LSH is used once the population reaches LSH_MIN_POPULATION
+
+        Returns:
+            dict: Best match, or None if nothing reaches the threshold
+        """
+        if len(template) != self.template_size:
+            raise ValueError(f"Template must be {self.template_size} bytes")
+
+        with self.lock:
+            if exhaustive is None:
+                exhaustive = self.count < LSH_MIN_POPULATION
+            rows = np.arange(self.size) if exhaustive else self.candidates(template)
+            if not len(rows):
+                return None
+
+            scores = self.score(template, rows)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+
+            row = rows[best]
+            return {
+                'fingerprint_id': int(self.fingerprint_ids[row]),
+                'student_id': int(self.student_ids[row]),
+                'finger_id': int(self.finger_ids[row]),
+                'score': float(scores[best])
+            }
+
+    def match(self, template, exhaustive=None):
+        """
+        Find the enrolled template most similar to a probe template
+
+        Args:
+            template (bytes): Probe template from the sensor
+            exhaustive (bool, optional): See search()
+
+        Returns:
+            dict: fingerprint_id, student_id, finger_id and score of the best
+                  match, or None if nothing reaches the threshold
+        """
+        if len(template) != self.template_size:
+            raise ValueError(f"Template must be {self.template_size} bytes")
+
+        self.warm()
+        return self.search(template, exhaustive)
+
+    def reset(self):
+        """Forget every template so the next use reloads from scratch"""
+        with self.lock:
+            self.clear()
+            self.loaded_at = None
+            self.invalidate()
+
+    def invalidate(self):
+        """Request a database sync on next use"""
+        self.generation += 1
+
+    def needs_sync(self):
+        """Check whether the matcher must be synced with the database before use"""
+        if self.loaded_generation != self.generation or self.loaded_at is None:
+            return True
+        return time.monotonic() - self.loaded_at > self.max_age
+
+    def sync(self):
+        """
+        Bring the matcher in line with the Fingerprint table
+
+        Compares the fingerprint ID, student ID, finger ID and version of
+        every row with the loaded templates; template blobs are read only for
+        rows this process has not seen or that changed since, so a persisted
+        index is validated and brought up to date at startup without reading
+        the whole table.
+
+        Returns:
+            bool: True if any template was added, replaced or removed
+        """
+        generation = self.generation
+        db_rows = {row[0]: (row[1], row[2], row_version(row[3]))
+                   for row in db.session.query(Fingerprint.id, Fingerprint.student_id,
+                                               Fingerprint.finger_id, Fingerprint.updated_at)}
+
+        with self.lock:
+            removed = [fingerprint_id for fingerprint_id in self.rows if fingerprint_id not in db_rows]
+            for fingerprint_id in removed:
+                self.remove(fingerprint_id)
+
+            stale = []
+            for fingerprint_id, state in db_rows.items():
+                row = self.rows.get(fingerprint_id)
+                if row is None or state != (int(self.student_ids[row]), int(self.finger_ids[row]),
+                                            int(self.versions[row])):
+                    stale.append(fingerprint_id)
+        stale.sort()
+
+        added = 0
+        for start in range(0, len(stale), SYNC_CHUNK_SIZE):
+            rows = (db.session.query(Fingerprint.id, Fingerprint.student_id, Fingerprint.finger_id,
+                                     Fingerprint.template_data, Fingerprint.updated_at)
+                    .filter(Fingerprint.id.in_(stale[start:start + SYNC_CHUNK_SIZE]))
+                    .all())
+            added += self.add_many([(row[0], row[1], row[2], row[3], row_version(row[4])) for row in rows])
+
+        self.loaded_generation = generation
+        self.loaded_at = time.monotonic()
+
+        if removed or stale:
+            logger.info(f"Template matcher synced: {added} loaded, {len(removed)} removed, {self.count} total")
+            self.unsaved = True
+        self.save_if_due()
+        return bool(removed or stale)
+
+    def warm(self):
+        """Load the persisted index on first use and sync it with the database"""
+        if self.needs_sync():
+            with self.lock:
+                if self.loaded_at is None and not self.size:
+                    self.load()
+                if self.needs_sync():
+                    self.sync()
+        elif self.unsaved:
+            self.save_if_due()
+
+    def apply_changes(self, added, removed):
+        """
+        Apply committed fingerprint changes without querying the database
+
+        The persisted index is rewritten at most every SAVE_INTERVAL
+        seconds; changes not yet saved when the process exits are found by
+        the sync at the next startup.
+
+        Args:
+            added (list): (fingerprint_id, student_id, finger_id, template, version) tuples;
+                template is None when the deferred blob was not loaded and the stored one is kept
+            removed (list): Fingerprint IDs that were deleted
+        """
+        if self.loaded_at is None:
+            # Nothing loaded yet; the first warm() reads everything
+            return
+        with self.lock:
+            for fingerprint_id in removed:
+                self.remove(fingerprint_id)
+
+            entries = []
+            for fingerprint_id, student_id, finger_id, template, version in added:
+                if template is None:
+                    row = self.rows.get(fingerprint_id)
+                    if row is None:
+                        # Unknown row without its blob; let the next sync load it
+                        self.invalidate()
+                        continue
+                    template = self.matrix[row].tobytes()
+                entries.append((fingerprint_id, student_id, finger_id, template, version))
+            self.add_many(entries)
+            self.unsaved = True
+        self.save_if_due()
+
+    def save_if_due(self):
+        """Persist unsaved changes unless the index was saved less than SAVE_INTERVAL seconds ago"""
+        if not self.unsaved:
+            return
+        if self.saved_at is not None and time.monotonic() - self.saved_at < SAVE_INTERVAL:
+            return
+        self.save()
+
+    def save(self):
+        """Persist the index to index_path (atomically replaces the file)"""
+        if not self.index_path:
+            self.unsaved = False
+            return
+        with self.lock:
+            rows = np.flatnonzero(self.active[:self.size])
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f,
+                             params=np.array([self.template_size, self.tables, self.bits, self.seed]),
+                             matrix=self.matrix[rows],
+                             fingerprint_ids=self.fingerprint_ids[rows],
+                             student_ids=self.student_ids[rows],
+                             finger_ids=self.finger_ids[rows],
+                             versions=self.versions[rows],
+                             keys=self.keys[rows])
+                os.replace(tmp_path, self.index_path)
+                self.unsaved = False
+                self.saved_at = time.monotonic()
+            except OSError as e:
+                logger.error(f"Error saving template index: {str(e)}")
+
+    def load(self):
+        """
+        Load a persisted index from index_path
+
+        The loaded rows are only trusted once sync() has checked them
+        against the database, which warm() does right after loading.
+
+        Returns:
+            bool: True if an index was loaded
+        """
+        if not self.index_path or not os.path.exists(self.index_path):
+            return False
+        try:
+            with np.load(self.index_path) as data:
+                params = [self.template_size, self.tables, self.bits, self.seed]
+                if data['params'].tolist() != params:
+                    logger.warning("Template index on disk was built with different parameters; ignoring it")
+                    return False
+                matrix = data['matrix']
+                fingerprint_ids = data['fingerprint_ids']
+                student_ids = data['student_ids']
+                finger_ids = data['finger_ids']
+                versions = data['versions']
+                keys = data['keys']
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Error loading template index: {str(e)}")
+            return False
+
+        with self.lock:
+            self.clear()
+            self.ensure_capacity(len(matrix))
+            self.size = len(matrix)
+            self.matrix[:self.size] = matrix
+            self.fingerprint_ids[:self.size] = fingerprint_ids
+            self.student_ids[:self.size] = student_ids
+            self.finger_ids[:self.size] = finger_ids
+            self.versions[:self.size] = versions
+            self.active[:self.size] = True
+            self.keys[:self.size] = keys
+            for row, fingerprint_id in enumerate(fingerprint_ids.tolist()):
+                self.rows[fingerprint_id] = row
+            for table in range(self.tables):
+                buckets = self.buckets[table]
+                for row, key in enumerate(keys[:, table].tolist()):
+                    buckets.setdefault(key, []).append(row)
+
+        logger.info(f"Loaded template index with {self.count} templates from {self.index_path}")
+        return True
+
+
+template_matcher = TemplateMatcher()
+
+
+@event.listens_for(Session, 'after_flush')
+def track_template_changes(session, flush_context):
+    """Note fingerprint rows written in this flush"""
+    changes = session.info.setdefault('template_matcher_changes', {'added': {}, 'removed': set()})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Fingerprint):
+            # Don't lazy-load the deferred blob just because other columns changed
+            template = None if 'template_data' in inspect(obj).unloaded else obj.template_data
+            changes['added'][obj.id] = (obj.id, obj.student_id, obj.finger_id, template,
+                                        row_version(obj.updated_at))
+            changes['removed'].discard(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Fingerprint):
+            changes['added'].pop(obj.id, None)
+            changes['removed'].add(obj.id)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def track_bulk_template_changes(orm_execute_state):
+    """Flag bulk fingerprint updates/deletes issued outside the unit of work"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and issubclass(mapper.class_, Fingerprint):
+            orm_execute_state.session.info['template_matcher_dirty'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def update_templates_after_commit(session):
+    """Apply committed fingerprint changes to the matcher"""
+    changes = session.info.pop('template_matcher_changes', None)
+    if changes and (changes['added'] or changes['removed']):
+        template_matcher.apply_changes(list(changes['added'].values()), list(changes['removed']))
+    if session.info.pop('template_matcher_dirty', False):
+        # Bulk statements don't say which rows changed; re-sync IDs on next use
+        template_matcher.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def clear_template_changes(session):
+    """Forget pending template changes that were rolled back"""
+    session.info.pop('template_matcher_changes', None)
+    session.info.pop('template_matcher_dirty', None)
@@ -0,0 +1,196 @@
+import csv
+import io
+import json
+import os
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Course, Attendance, Fingerprint
+from attendance_dedupe import attendance_dedupe
+
+
+class TestAttendanceAPI(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.student = Student(student_id="TEST001", first_name="Test", last_name="Student")
+        self.other_student = Student(student_id="TEST002", first_name="Other", last_name="Student")
+        self.course = Course(course_code="TEST101", title="Test Course")
+        self.other_course = Course(course_code="TEST201", title="Other Course")
+        self.student.courses.append(self.course)
+        self.other_student.courses.append(self.course)
+        db.session.add_all([self.student, self.other_student, self.course, self.other_course])
+        db.session.commit()
+
+        db.session.add(Fingerprint(student_id=self.other_student.id, finger_id=7, template_data=b'\x00' * 16))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        attendance_dedupe.clear()
+        self.app_context.pop()
+
+    def add_attendance(self, count):
+        # Each record gets its own student so per-row lookups cannot hit the identity map
+        start = datetime(2024, 1, 1, 9, 0)
+        offset = Student.query.count()
+        for i in range(count):
+            student = Student(student_id=f"BULK{offset + i:04d}", first_name="Bulk", last_name=str(i))
+            student.courses.append(self.course)
+            db.session.add(student)
+            db.session.add(Attendance(student=student, course_id=self.course.id,
+                                      timestamp=start + timedelta(minutes=offset + i)))
+        db.session.commit()
+        db.session.expunge_all()
+
+    def count_queries(self, func):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        self.assertEqual(response.status_code, 200)
+        return len(statements)
+
+    def test_get_attendance_query_count_is_constant(self):
+        self.add_attendance(2)
+        few = self.count_queries(lambda: self.client.get('/api/attendance'))
+        self.add_attendance(25)
+        many = self.count_queries(lambda: self.client.get('/api/attendance'))
+
+        self.assertEqual(few, many)
+        data = self.client.get('/api/attendance').get_json()
+        self.assertEqual(data['count'], 27)
+        self.assertEqual(data['records'][0]['student']['student_id'], 'BULK0028')
+        self.assertEqual(data['records'][0]['course']['code'], 'TEST101')
+
+    def test_get_attendance_keyset_pagination(self):
+        self.add_attendance(5)
+        # Rows sharing a timestamp must still be split across pages by id
+        db.session.query(Attendance).update({'timestamp': datetime(2024, 1, 1, 9, 0)})
+        db.session.commit()
+
+        seen = []
+        cursor = None
+        while True:
+            url = '/api/attendance?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            data = self.client.get(url).get_json()
+            self.assertLessEqual(data['count'], 2)
+            seen.extend(record['id'] for record in data['records'])
+            cursor = data['pagination']['next_cursor']
+            if not data['pagination']['has_more']:
+                self.assertIsNone(cursor)
+                break
+
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(set(seen)), 5)
+
+        response = self.client.get('/api/attendance?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_streams_filtered_records(self):
+        db.session.add(Attendance(student_id=self.student.id, course_id=self.other_course.id))
+        db.session.commit()
+        course_id = self.course.id
+        self.add_attendance(3)
+
+        response = self.client.get(f'/api/attendance/export?course_id={course_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])['course']['code'], 'TEST101')
+
+        response = self.client.get('/api/attendance/export?format=csv&student_id=TEST001')
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(rows[0][0], 'id')
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][8], 'TEST201')
+
+        response = self.client.get('/api/attendance/export?format=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_attendance_pages_query_count_is_constant(self):
+        app.config['LOGIN_DISABLED'] = True
+        try:
+            for url in ('/attendance', f'/courses/attendance/{self.course.id}'):
+                db.session.query(Attendance).delete()
+                db.session.commit()
+                self.add_attendance(2)
+                few = self.count_queries(lambda: self.client.get(url))
+                self.add_attendance(25)
+                many = self.count_queries(lambda: self.client.get(url))
+                self.assertEqual(few, many, url)
+        finally:
+            app.config['LOGIN_DISABLED'] = False
+
+    def test_statistics_use_single_status_aggregate(self):
+        for status in ('present', 'present', 'late', 'absent'):
+            db.session.add(Attendance(student_id=self.student.id, course_id=self.course.id, status=status))
+        db.session.commit()
+
+        app.config['LOGIN_DISABLED'] = True
+        try:
+            queries = self.count_queries(lambda: self.client.get('/api/statistics'))
+            data = self.client.get('/api/statistics').get_json()
+        finally:
+            app.config['LOGIN_DISABLED'] = False
+
+        self.assertEqual(queries, 2)
+        self.assertEqual(data['counts'], {'students': 2, 'courses': 2, 'attendance_records': 4})
+        self.assertEqual(data['attendance_status'], {'present': 2, 'late': 1, 'absent': 1})
+        self.assertEqual(data['attendance_percentage']['present'], 50.0)
+
+    def test_batch_records_valid_entries_and_reports_failures(self):
+        response = self.client.post('/api/attendance/batch', json={'records': [
+            {'student_id': self.student.id, 'course_id': self.course.id, 'status': 'late'},
+            {'student_id': 'TEST001', 'course_id': self.course.id, 'timestamp': 1700000000},
+            {'fingerprint_id': 7, 'course_id': self.course.id},
+            {'student_id': self.student.id, 'course_id': self.other_course.id},
+            {'student_id': 'MISSING', 'course_id': self.course.id},
+            {'student_id': self.student.id, 'course_id': 9999},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['recorded'], 3)
+        self.assertEqual(data['failed'], 3)
+        self.assertEqual([r['success'] for r in data['results']],
+                         [True, True, True, False, False, False])
+        self.assertEqual(data['results'][3]['error'], 'Student is not enrolled in this course')
+        self.assertEqual(data['results'][4]['error'], 'Student not found')
+        self.assertEqual(data['results'][5]['error'], 'Course not found')
+
+        self.assertEqual(Attendance.query.count(), 3)
+        replayed = db.session.get(Attendance, data['results'][1]['attendance_id'])
+        self.assertEqual(replayed.timestamp.year, 2023)
+        scanned = db.session.get(Attendance, data['results'][2]['attendance_id'])
+        self.assertEqual(scanned.student_id, self.other_student.id)
+
+    def test_batch_rejects_oversized_payload(self):
+        records = [{'student_id': self.student.id, 'course_id': self.course.id}] * 501
+        response = self.client.post('/api/attendance/batch', json=records)
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(Attendance.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
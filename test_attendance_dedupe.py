@@ -0,0 +1,143 @@
+import os
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy import event
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Course, Attendance, AttendanceDailyCount
+from attendance_manager import AttendanceManager
+from attendance_dedupe import attendance_dedupe, AttendanceDedupe
+
+
+class TestAttendanceDedupe(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.student = Student(student_id="TEST001", first_name="Test", last_name="Student")
+        self.course = Course(course_code="TEST101", title="Test Course")
+        self.student.courses.append(self.course)
+        db.session.add_all([self.student, self.course])
+        db.session.commit()
+        self.scan = {'student_id': self.student.id, 'course_id': self.course.id, 'timestamp': '2024-03-04T09:01:00'}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        attendance_dedupe.clear()
+        self.app_context.pop()
+
+    def test_repeat_scan_is_answered_without_a_write(self):
+        first = self.client.post('/api/attendance', json=self.scan).get_json()
+        self.assertFalse(first['duplicate'])
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            # Same window (09:00-09:05), slightly later tap
+            repeat = self.client.post('/api/attendance', json=dict(self.scan, timestamp='2024-03-04T09:03:30'))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        data = repeat.get_json()
+        self.assertEqual(repeat.status_code, 200)
+        self.assertTrue(data['duplicate'])
+        self.assertEqual(data['attendance_id'], first['attendance_id'])
+        self.assertFalse([statement for statement in statements if not statement.startswith('SELECT')])
+        self.assertEqual(Attendance.query.count(), 1)
+
+        # A full window later is a new scan
+        data = self.client.post('/api/attendance', json=dict(self.scan, timestamp='2024-03-04T09:06:00')).get_json()
+        self.assertFalse(data['duplicate'])
+        self.assertEqual(Attendance.query.count(), 2)
+
+    def test_database_rejects_repeat_unseen_by_this_process(self):
+        first = self.client.post('/api/attendance', json=self.scan).get_json()
+        # As if the repeat reached another worker process
+        attendance_dedupe.clear()
+
+        data = self.client.post('/api/attendance', json=self.scan).get_json()
+        self.assertTrue(data['duplicate'])
+        self.assertEqual(data['attendance_id'], first['attendance_id'])
+        self.assertEqual(Attendance.query.count(), 1)
+        self.assertEqual(sum(row.count for row in AttendanceDailyCount.query), 1)
+
+        # Manager scans share the window with device scans
+        attendance = AttendanceManager().record_attendance(self.student.id, self.course.id)
+        self.assertEqual(AttendanceManager().record_attendance(self.student.id, self.course.id).id, attendance.id)
+
+    def test_batch_skips_recorded_and_repeated_scans(self):
+        first = self.client.post('/api/attendance', json=self.scan).get_json()
+        attendance_dedupe.clear()
+
+        response = self.client.post('/api/attendance/batch', json=[
+            self.scan,
+            dict(self.scan, timestamp='2024-03-04T10:00:00'),
+            dict(self.scan, timestamp='2024-03-04T10:02:00'),
+        ])
+        data = response.get_json()
+        self.assertEqual((data['recorded'], data['duplicates'], data['failed']), (1, 2, 0))
+        results = data['results']
+        self.assertEqual([result['duplicate'] for result in results], [True, False, True])
+        self.assertEqual(results[0]['attendance_id'], first['attendance_id'])
+        self.assertEqual(results[2]['attendance_id'], results[1]['attendance_id'])
+        self.assertEqual(Attendance.query.count(), 2)
+
+    def test_scans_across_a_window_boundary_count_once(self):
+        first = self.client.post('/api/attendance', json=dict(self.scan, timestamp='2024-03-04T09:04:59')).get_json()
+        self.assertFalse(first['duplicate'])
+
+        # Next window (09:05-09:10), but two seconds after the recorded scan
+        data = self.client.post('/api/attendance', json=dict(self.scan, timestamp='2024-03-04T09:05:01')).get_json()
+        self.assertTrue(data['duplicate'])
+        self.assertEqual(data['attendance_id'], first['attendance_id'])
+
+        # Another process checks the previous window in the database
+        attendance_dedupe.clear()
+        data = self.client.post('/api/attendance', json=dict(self.scan, timestamp='2024-03-04T09:09:58')).get_json()
+        self.assertTrue(data['duplicate'])
+
+        # A full window after the recorded scan is a new scan
+        data = self.client.post('/api/attendance', json=dict(self.scan, timestamp='2024-03-04T09:09:59')).get_json()
+        self.assertFalse(data['duplicate'])
+        self.assertEqual(Attendance.query.count(), 2)
+
+        response = self.client.post('/api/attendance/batch', json=[
+            dict(self.scan, timestamp='2024-03-04T11:59:59'),
+            dict(self.scan, timestamp='2024-03-04T12:00:01'),
+        ])
+        results = response.get_json()['results']
+        self.assertEqual([result['duplicate'] for result in results], [False, True])
+        self.assertEqual(results[1]['attendance_id'], results[0]['attendance_id'])
+        self.assertEqual(Attendance.query.count(), 3)
+
+    def test_cache_is_bounded_and_expires(self):
+        cache = AttendanceDedupe(window=60, max_entries=2)
+        scanned_at = datetime(2024, 3, 4, 9, 0)
+        with patch('attendance_dedupe.time.monotonic', return_value=1000.0):
+            for attendance_id in range(3):
+                cache.add((1, 1, attendance_id), attendance_id, scanned_at)
+            self.assertEqual(list(cache.entries), [(1, 1, 1), (1, 1, 2)])
+            self.assertEqual(cache.get((1, 1, 2))[0], 2)
+        with patch('attendance_dedupe.time.monotonic', return_value=1060.0):
+            self.assertIsNone(cache.get((1, 1, 2)))
+            self.assertEqual(len(cache.entries), 0)
+
+        self.assertIsNone(AttendanceDedupe(window=0).key(1, 1, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
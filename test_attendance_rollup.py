@@ -0,0 +1,112 @@
+import os
+import unittest
+from datetime import datetime, date
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Course, Attendance, AttendanceDailyCount
+from attendance_manager import AttendanceManager
+from attendance_dedupe import attendance_dedupe
+from attendance_rollup import delete_attendance, rebuild_rollup, get_status_counts, get_course_counts
+
+
+class TestAttendanceRollup(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.student = Student(student_id="TEST001", first_name="Test", last_name="Student")
+        self.course = Course(course_code="TEST101", title="Test Course")
+        self.other_course = Course(course_code="TEST201", title="Other Course")
+        self.student.courses.extend([self.course, self.other_course])
+        db.session.add_all([self.student, self.course, self.other_course])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        attendance_dedupe.clear()
+        self.app_context.pop()
+
+    def rollup_rows(self):
+        return {(row.day, row.course_id, row.status): row.count
+                for row in AttendanceDailyCount.query.all() if row.count}
+
+    def test_rollup_tracks_inserts_updates_and_deletes(self):
+        day = datetime(2024, 3, 4, 10, 0)
+        for status in ('present', 'present', 'late'):
+            db.session.add(Attendance(student_id=self.student.id, course_id=self.course.id,
+                                      timestamp=day, status=status))
+        db.session.add(Attendance(student_id=self.student.id, course_id=self.other_course.id,
+                                  timestamp=day, status='absent'))
+        db.session.commit()
+
+        self.assertEqual(self.rollup_rows(), {
+            (date(2024, 3, 4), self.course.id, 'present'): 2,
+            (date(2024, 3, 4), self.course.id, 'late'): 1,
+            (date(2024, 3, 4), self.other_course.id, 'absent'): 1,
+        })
+
+        late = Attendance.query.filter_by(status='late').one()
+        late.status = 'present'
+        db.session.commit()
+        self.assertEqual(get_status_counts(course_id=self.course.id), {'present': 3, 'late': 0})
+
+        delete_attendance(Attendance.course_id == self.other_course.id)
+        db.session.commit()
+        self.assertEqual(get_course_counts()[self.other_course.id], (0, 0))
+        self.assertEqual(get_course_counts()[self.course.id], (3, 3))
+
+    def test_manager_and_batch_writes_update_rollup(self):
+        AttendanceManager().record_attendance(self.student.id, self.course.id, status='late')
+        self.client.post('/api/attendance/batch', json=[
+            {'student_id': self.student.id, 'course_id': self.course.id, 'timestamp': '2024-03-04T09:00:00'},
+            {'student_id': self.student.id, 'course_id': self.course.id, 'timestamp': '2024-03-05T09:00:00'},
+        ])
+
+        stats = AttendanceManager().get_attendance_statistics()
+        self.assertEqual(stats['total_records'], 3)
+        self.assertEqual(stats['status_counts'], {'present': 2, 'late': 1, 'absent': 0})
+
+        # Partial-day ranges fall back to the attendance table
+        stats = AttendanceManager().get_attendance_statistics(start_date=datetime(2024, 3, 4, 8, 30),
+                                                              end_date=datetime(2024, 3, 4, 9, 30))
+        self.assertEqual(stats['total_records'], 1)
+
+    def test_rebuild_matches_incremental_rollup(self):
+        for hour in (8, 9, 23):
+            db.session.add(Attendance(student_id=self.student.id, course_id=self.course.id,
+                                      timestamp=datetime(2024, 3, 4, hour, 0)))
+        db.session.commit()
+        incremental = self.rollup_rows()
+
+        db.session.query(AttendanceDailyCount).delete()
+        db.session.commit()
+        rebuild_rollup()
+
+        self.assertEqual(self.rollup_rows(), incremental)
+        self.assertEqual(incremental, {(date(2024, 3, 4), self.course.id, 'present'): 3})
+
+    def test_dashboard_renders_from_rollup(self):
+        db.session.add(Attendance(student_id=self.student.id, course_id=self.course.id))
+        db.session.commit()
+
+        app.config['LOGIN_DISABLED'] = True
+        try:
+            response = self.client.get('/dashboard')
+        finally:
+            app.config['LOGIN_DISABLED'] = False
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'TEST101', response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
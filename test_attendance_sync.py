@@ -0,0 +1,227 @@
+import os
+import unittest
+from datetime import datetime
+from unittest import mock
+from sqlalchemy import event, insert, update
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Course, Attendance, AttendanceOutbox, SyncCursor
+from attendance_manager import AttendanceManager, SyncError
+from sync_worker import SyncWorker, sync_worker
+from attendance_dedupe import attendance_dedupe
+
+
+class TestAttendanceSync(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.student = Student(student_id="TEST001", first_name="Test", last_name="Student")
+        self.course = Course(course_code="TEST101", title="Test Course")
+        db.session.add_all([self.student, self.course])
+        db.session.commit()
+        self.manager = AttendanceManager()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        attendance_dedupe.clear()
+        self.app_context.pop()
+
+    def add_unsynced(self, count):
+        db.session.add_all([
+            Attendance(student_id=self.student.id, course_id=self.course.id,
+                       timestamp=datetime(2024, 3, 4, 9, 0), status='present', synced=False)
+            for _ in range(count)
+        ])
+        db.session.commit()
+        return [row.id for row in db.session.query(Attendance.id).order_by(Attendance.id)]
+
+    def count_statements(self, func, *args):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *rest):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = func(*args)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return result, statements
+
+    def test_mark_as_synced_updates_in_chunks(self):
+        ids = self.add_unsynced(2500)
+
+        count, statements = self.count_statements(self.manager.mark_as_synced, ids + [999999])
+
+        self.assertEqual(count, 2500)
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(all(statement.startswith('UPDATE') for statement in statements))
+        self.assertEqual(Attendance.query.filter(Attendance.synced == db.false()).count(), 0)
+
+    def test_sync_route_queues_background_job(self):
+        self.add_unsynced(1200)
+        manager = AttendanceManager(sync_latency=0, sync_failure_rate=0)
+
+        app.config['LOGIN_DISABLED'] = True
+        try:
+            with mock.patch.object(sync_worker, 'manager', manager), \
+                 mock.patch.object(manager, 'push_attendance_batch', wraps=manager.push_attendance_batch) as push:
+                response = self.client.get('/sync', headers={'Accept': 'application/json'})
+                self.assertEqual(response.status_code, 202)
+                job_id = response.get_json()['job_id']
+                sync_worker.queue.join()
+
+            status = self.client.get(f'/sync/{job_id}').get_json()
+            missing = self.client.get('/sync/unknown')
+        finally:
+            app.config['LOGIN_DISABLED'] = False
+
+        self.assertEqual(status['status'], 'succeeded')
+        self.assertEqual(status['synced_count'], 1200)
+        self.assertEqual([len(call.args[0]) for call in push.call_args_list], [500, 500, 200])
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(Attendance.query.filter(Attendance.synced == db.false()).count(), 0)
+
+    def test_failed_batches_are_retried_with_backoff(self):
+        self.add_unsynced(10)
+        manager = AttendanceManager(sync_latency=0, sync_failure_rate=0)
+        worker = SyncWorker(manager, max_attempts=3, backoff_base=0)
+        worker.init_app(app)
+
+        with mock.patch.object(manager, 'push_attendance_batch',
+                               side_effect=[SyncError('down'), SyncError('down'), None]):
+            job_id = worker.enqueue()
+            worker.queue.join()
+        job = worker.get_job(job_id)
+        self.assertEqual((job.status, job.attempts, job.synced_count), ('succeeded', 3, 10))
+
+        self.add_unsynced(5)
+        with mock.patch.object(manager, 'push_attendance_batch', side_effect=SyncError('down')):
+            job_id = worker.enqueue()
+            worker.queue.join()
+        job = worker.get_job(job_id)
+        self.assertEqual((job.status, job.attempts, job.error), ('failed', 3, 'down'))
+        self.assertEqual(Attendance.query.filter(Attendance.synced == db.false()).count(), 5)
+
+    def test_writes_append_to_outbox_in_same_transaction(self):
+        self.student.courses.append(self.course)
+        db.session.commit()
+
+        # Distinct scan times, so the dedupe window does not merge the writes
+        self.manager.record_attendance(self.student.id, self.course.id)
+        self.client.post('/api/attendance', json={'student_id': self.student.id, 'course_id': self.course.id,
+                                                  'timestamp': '2024-03-04T09:00:00'})
+        self.client.post('/api/attendance/batch', json=[{'student_id': self.student.id, 'course_id': self.course.id,
+                                                         'timestamp': '2024-03-05T09:00:00'}])
+        self.assertEqual(AttendanceOutbox.query.count(), 3)
+
+        db.session.add(Attendance(student_id=self.student.id, course_id=self.course.id))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(AttendanceOutbox.query.count(), 3)
+
+        # Local bookkeeping is not a change to send
+        attendance = Attendance.query.first()
+        attendance.synced = not attendance.synced
+        db.session.commit()
+        self.assertEqual(AttendanceOutbox.query.count(), 3)
+
+        attendance.status = 'late'
+        db.session.commit()
+        self.assertEqual(AttendanceOutbox.query.count(), 4)
+
+    def test_sync_sends_only_changes_after_cursor(self):
+        manager = AttendanceManager(sync_latency=0, sync_failure_rate=0)
+        # Rows written before the outbox existed are picked up on the first run
+        db.session.execute(insert(Attendance), [
+            {'student_id': self.student.id, 'course_id': self.course.id,
+             'timestamp': datetime(2024, 3, 4, 9, 0), 'synced': False}
+            for _ in range(3)
+        ])
+        db.session.commit()
+        self.assertEqual(AttendanceOutbox.query.count(), 0)
+        sent = []
+        push = sent.append
+
+        self.assertEqual(manager.sync_attendance_data(push=push)['count'], 3)
+        position = db.session.get(SyncCursor, 'attendance').position
+        self.assertEqual(AttendanceOutbox.query.count(), 0)
+
+        self.assertEqual(manager.sync_attendance_data(push=push)['count'], 0)
+        self.assertEqual(len(sent), 1)
+
+        attendance = Attendance(student_id=self.student.id, course_id=self.course.id, status='late')
+        db.session.add(attendance)
+        db.session.commit()
+        result, statements = self.count_statements(manager.sync_attendance_data, 10, push)
+
+        self.assertEqual(result['count'], 1)
+        self.assertEqual(sent[-1], [{
+            'id': attendance.id, 'student_id': 'TEST001', 'course_id': self.course.id,
+            'timestamp': attendance.timestamp.isoformat(), 'status': 'late'
+        }])
+        self.assertGreater(db.session.get(SyncCursor, 'attendance').position, position)
+        self.assertFalse(any('synced = 0' in statement for statement in statements))
+
+    def test_entry_committed_below_cursor_is_still_sent(self):
+        manager = AttendanceManager(sync_latency=0, sync_failure_rate=0)
+        ids = self.add_unsynced(3)
+        self.assertEqual(manager.sync_attendance_data(push=lambda batch: None)['count'], 3)
+        position = db.session.get(SyncCursor, 'attendance').position
+
+        # A transaction that took an outbox ID before the sync commits only now
+        db.session.execute(insert(AttendanceOutbox).values(id=position - 1, attendance_id=ids[0],
+                                                           created_at=datetime(2024, 3, 4, 9, 0)))
+        db.session.commit()
+        sent = []
+
+        self.assertEqual(manager.sync_attendance_data(push=sent.append)['count'], 1)
+        self.assertEqual([record['id'] for record in sent[0]], [ids[0]])
+        self.assertEqual(AttendanceOutbox.query.count(), 0)
+        self.assertEqual(db.session.get(SyncCursor, 'attendance').position, position)
+
+    def test_failure_after_push_stops_the_sync(self):
+        manager = AttendanceManager(sync_latency=0, sync_failure_rate=0)
+        self.add_unsynced(4)
+        push = mock.Mock()
+
+        with mock.patch.object(manager, 'update_synced_flags', side_effect=RuntimeError('disk full')):
+            result = manager.sync_attendance_data(batch_size=2, push=push)
+
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(push.call_count, 1)
+        self.assertEqual(AttendanceOutbox.query.count(), 4)
+
+    def test_batch_acknowledged_by_another_worker_is_not_acknowledged_again(self):
+        manager = AttendanceManager(sync_latency=0, sync_failure_rate=0)
+        self.add_unsynced(2)
+
+        def push(batch):
+            # Another worker acknowledges the first entry while this batch is in flight
+            outbox_id = db.session.query(db.func.min(AttendanceOutbox.id)).scalar()
+            db.session.query(AttendanceOutbox).filter_by(id=outbox_id).delete()
+            db.session.execute(update(SyncCursor).values(position=outbox_id))
+            db.session.commit()
+
+        result = manager.sync_attendance_data(push=push)
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(result['count'], 0)
+        # Left as the other worker put it, with nothing acknowledged by this one
+        self.assertEqual(AttendanceOutbox.query.count(), 1)
+        self.assertEqual(Attendance.query.filter_by(synced=False).count(), 2)
+
+        self.assertEqual(manager.sync_attendance_data(push=lambda batch: None)['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
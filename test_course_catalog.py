@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from sqlalchemy import event
+from app import app, db
+from models import Student, Course
+from course_catalog import course_catalog, CourseCatalog
+
+
+class TestCourseCatalog(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        course_catalog.invalidate()
+
+        self.courses = [Course(course_code=f"TEST{i}", title=f"Test Course {i}") for i in range(5)]
+        self.student = Student(student_id="TEST001", first_name="Test", last_name="Student")
+        self.student.courses.extend(self.courses[:2])
+        db.session.add_all(self.courses + [self.student])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        course_catalog.invalidate()
+        self.app_context.pop()
+
+    def test_catalog_is_built_once_and_revalidated_with_etag(self):
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            responses = [self.client.get('/api/courses') for _ in range(10)]
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        # One grouped query for all courses and counts, however many requests
+        self.assertEqual(len(statements), 1)
+        data = responses[0].get_json()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual([course['student_count'] for course in data['courses']], [1, 1, 0, 0, 0])
+        etag = responses[0].headers['ETag']
+        self.assertEqual(etag, f'"{data["version"]}"')
+        self.assertTrue(all(response.headers['ETag'] == etag for response in responses))
+
+        response = self.client.get('/api/courses', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    def test_enrollment_change_publishes_new_version(self):
+        etag = self.client.get('/api/courses').headers['ETag']
+
+        self.student.courses.append(self.courses[4])
+        db.session.commit()
+
+        response = self.client.get('/api/courses', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.get_json()['courses'][4]['student_count'], 1)
+
+    def test_concurrent_requests_share_one_build(self):
+        catalog = CourseCatalog()
+        builds = []
+
+        def slow_reload():
+            builds.append(1)
+            time.sleep(0.1)
+            catalog.snapshot = ('v1', b'{}', b'', 0)
+            catalog.loaded_at = time.monotonic()
+            catalog.loaded_generation = catalog.generation
+
+        with patch.object(catalog, 'reload', side_effect=slow_reload):
+            threads = [threading.Thread(target=catalog.get_snapshot) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(builds), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
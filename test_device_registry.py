@@ -0,0 +1,127 @@
+import os
+import unittest
+from unittest.mock import patch
+from sqlalchemy.exc import IntegrityError
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Course, Fingerprint, SensorDevice
+from device_registry import device_registry
+from fingerprint_index import fingerprint_index
+from attendance_dedupe import attendance_dedupe
+from fingerprint_sensor_module import FingerPrintSensor
+
+
+class TestDeviceRegistry(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.student = Student(student_id="TEST001", first_name="Test", last_name="Student")
+        self.course = Course(course_code="TEST101", title="Test Course")
+        self.other_course = Course(course_code="TEST201", title="Other Course")
+        self.other_student = Student(student_id="TEST002", first_name="Other", last_name="Student")
+        self.student.courses.extend([self.course, self.other_course])
+        self.other_student.courses.extend([self.course, self.other_course])
+        db.session.add_all([self.student, self.other_student, self.course, self.other_course])
+        db.session.commit()
+        self.room_a = SensorDevice(name='room-a', ip_address='10.0.0.1', room='A101', course_id=self.course.id)
+        db.session.add_all([self.room_a, SensorDevice(name='room-b', ip_address='10.0.0.2', room='B202')])
+        db.session.commit()
+        # Each sensor numbers its own slots: slot 3 is a different student on each
+        db.session.add_all([
+            Fingerprint(student_id=self.student.id, finger_id=3, device_id=self.room_a.id, template_data=b'\x00' * 16),
+            Fingerprint(student_id=self.other_student.id, finger_id=3, template_data=b'\x00' * 16),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        attendance_dedupe.clear()
+        device_registry.invalidate()
+        fingerprint_index.invalidate()
+        self.app_context.pop()
+
+    def test_requests_are_routed_by_device_course_and_room(self):
+        room_b = SensorDevice.query.filter_by(name='room-b').one()
+
+        self.assertEqual(device_registry.get_sensor(course_id=self.course.id).base_url, 'http://10.0.0.1:80')
+        self.assertEqual(device_registry.get_sensor(room='B202').base_url, 'http://10.0.0.2:80')
+        self.assertEqual(device_registry.get_sensor(device_id=str(room_b.id), course_id=self.course.id).base_url,
+                         'http://10.0.0.2:80')
+        self.assertEqual(device_registry.get_sensor(course_id=self.other_course.id).base_url,
+                         'http://{}:{}'.format(*device_registry.default_address))
+
+        # Each device keeps its own pooled client across lookups
+        self.assertIs(device_registry.get_sensor(room='A101'), device_registry.get_sensor(course_id=self.course.id))
+
+        room_b.is_active = False
+        db.session.commit()
+        self.assertIsNone(device_registry.resolve(room='B202'))
+
+    def test_scan_verify_dispatches_to_course_sensor(self):
+        calls = []
+
+        def verify_finger(sensor):
+            calls.append(sensor.base_url)
+            return {'success': True, 'finger_id': 3}
+
+        app.config['LOGIN_DISABLED'] = True
+        try:
+            with patch.object(FingerPrintSensor, 'connect', return_value=True), \
+                 patch.object(FingerPrintSensor, 'verify_finger', autospec=True, side_effect=verify_finger):
+                for course, name in ((self.course, 'Test Student'), (self.other_course, 'Other Student')):
+                    job = self.client.post('/scan/verify', data={'course_id': course.id}).get_json()
+                    data = self.client.get(job['status_url'], query_string={'wait': 5}).get_json()
+                    self.assertEqual((data['state'], data['status']), ('done', 'success'))
+                    self.assertEqual(data['message'], f'Attendance recorded for {name}')
+        finally:
+            app.config['LOGIN_DISABLED'] = False
+
+        self.assertEqual(calls, ['http://10.0.0.1:80', 'http://{}:{}'.format(*device_registry.default_address)])
+
+    def test_device_api_resolves_slots_of_the_calling_sensor(self):
+        scan = {'fingerprint_id': 3, 'course_id': self.course.id, 'timestamp': 1700000000}
+
+        # Identified by the address the request comes from
+        data = self.client.post('/api/scan', json=scan, environ_base={'REMOTE_ADDR': '10.0.0.1'}).get_json()
+        self.assertEqual(data['student']['student_id'], 'TEST001')
+        data = self.client.post('/api/scan', json=dict(scan, timestamp=1700001000)).get_json()
+        self.assertEqual(data['student']['student_id'], 'TEST002')
+
+        # Or named explicitly
+        data = self.client.post('/api/verify-fingerprint', json={'fingerprint_id': 3, 'device_id': self.room_a.id})
+        self.assertEqual(data.get_json()['student']['student_id'], 'TEST001')
+
+        # Slot 3 of room-b holds nobody, whoever holds slot 3 elsewhere
+        response = self.client.post('/api/scan', json=scan, environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.post('/api/attendance/batch', json={
+            'device_id': self.room_a.id, 'records': [dict(scan, timestamp=1700002000)]
+        })
+        self.assertEqual(response.get_json()['results'][0]['success'], True)
+
+    def test_slot_is_unique_per_sensor(self):
+        db.session.add(Fingerprint(student_id=self.other_student.id, finger_id=3, device_id=self.room_a.id,
+                                   template_data=b'\x00' * 16))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        db.session.add(Fingerprint(student_id=self.student.id, finger_id=3, template_data=b'\x00' * 16))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
+if __name__ == '__main__':
+    unittest.main()
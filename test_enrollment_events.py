@@ -0,0 +1,128 @@
+import os
+import json
+import unittest
+from unittest.mock import patch
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Fingerprint
+from enrollment_watcher import enrollment_watchers
+from fingerprint_sensor_module import FingerPrintSensor
+from device_registry import device_registry
+
+
+class TestEnrollmentEvents(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['LOGIN_DISABLED'] = True
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.student = Student(student_id="TEST001", first_name="Test", last_name="Student")
+        db.session.add(self.student)
+        db.session.commit()
+
+        # The sensor reports progress, then completes with the template
+        self.statuses = [
+            {'status': 'in_progress', 'progress': 30, 'message': 'Place finger again'},
+            {'status': 'in_progress', 'progress': 60, 'message': 'Remove finger'},
+            {'status': 'complete', 'progress': 100, 'message': 'Enrollment complete',
+             'template_data': b'\x01' * 16},
+        ]
+        self.status_calls = 0
+
+        def get_enrollment_status(sensor):
+            status = self.statuses[min(self.status_calls, len(self.statuses) - 1)]
+            self.status_calls += 1
+            return status
+
+        self.patcher = patch.object(FingerPrintSensor, 'get_enrollment_status', autospec=True,
+                                    side_effect=get_enrollment_status)
+        self.patcher.start()
+        enrollment_watchers.interval = 0.05
+
+    def tearDown(self):
+        for watcher in enrollment_watchers.watchers.values():
+            watcher.cancel()
+            watcher.thread.join(5)
+        enrollment_watchers.watchers.clear()
+        self.patcher.stop()
+        app.config['LOGIN_DISABLED'] = False
+        app.config['ENROLLMENT_EVENTS'] = False
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def collect(self, updates):
+        received = []
+        while not received or received[-1]['status'] not in ('complete', 'error'):
+            received.append(updates.get(timeout=5))
+        return received
+
+    def test_subscribers_share_one_sensor_poller(self):
+        sensor = FingerPrintSensor('127.0.0.1', 1)
+        watcher = enrollment_watchers.watch(sensor, self.student.id, 7)
+        tabs = [watcher.subscribe() for _ in range(5)]
+        # Another tab asking for the same enrollment joins the same watcher
+        self.assertIs(enrollment_watchers.watch(sensor, self.student.id, 7), watcher)
+
+        for updates in tabs:
+            received = self.collect(updates)
+            self.assertEqual(received[-1]['status'], 'complete')
+            self.assertTrue(all('template_data' not in status for status in received))
+        watcher.thread.join(5)
+
+        # One status request per interval, however many tabs listen
+        self.assertEqual(self.status_calls, len(self.statuses))
+        db.session.expire_all()
+        fingerprints = Fingerprint.query.filter_by(student_id=self.student.id).all()
+        self.assertEqual(len(fingerprints), 1)
+        self.assertEqual(fingerprints[0].finger_id, 7)
+
+    def test_events_route_streams_progress(self):
+        with self.client.session_transaction() as sess:
+            sess['enrollment_student_id'] = self.student.id
+            sess['enrollment_finger_id'] = 9
+
+        # Without a threaded worker class the browser is sent to /enroll/status
+        self.assertEqual(self.client.get('/enroll/events').status_code, 204)
+        self.assertEqual(enrollment_watchers.watchers, {})
+
+        app.config['ENROLLMENT_EVENTS'] = True
+        response = self.client.get('/enroll/events')
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        events = [json.loads(line[len('data: '):]) for line in response.get_data(as_text=True).splitlines()
+                  if line.startswith('data: ')]
+        self.assertEqual(events[-1]['status'], 'complete')
+
+        # The polling endpoint serves the watcher's final status and ends the enrollment
+        status = self.client.get('/enroll/status').get_json()
+        self.assertEqual(status['status'], 'complete')
+        self.assertNotIn('template_data', status)
+        with self.client.session_transaction() as sess:
+            self.assertNotIn('enrollment_student_id', sess)
+
+    def test_status_without_sensor_reports_error(self):
+        with self.client.session_transaction() as sess:
+            sess['enrollment_student_id'] = self.student.id
+            sess['enrollment_finger_id'] = 5
+
+        with patch.object(device_registry, 'get_sensor', return_value=None):
+            response = self.client.get('/enroll/status')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()['message'], 'No fingerprint sensor configured')
+
+            app.config['ENROLLMENT_EVENTS'] = True
+            events = self.client.get('/enroll/events').get_data(as_text=True)
+            self.assertIn('No enrollment in progress', events)
+        self.assertEqual(enrollment_watchers.watchers, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import unittest
+from sqlalchemy import event, func
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Course, Fingerprint, ChangeLog
+from fingerprint_index import fingerprint_index
+
+
+class TestFingerprintIndex(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.student = Student(student_id="TEST001", first_name="Test", last_name="Student")
+        self.course = Course(course_code="TEST101", title="Test Course")
+        self.other_course = Course(course_code="TEST201", title="Other Course")
+        self.student.courses.append(self.course)
+        db.session.add_all([self.student, self.course, self.other_course])
+        db.session.commit()
+        db.session.add(Fingerprint(student_id=self.student.id, finger_id=3, template_data=b'\x00' * 16))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        fingerprint_index.invalidate()
+        self.app_context.pop()
+
+    def verify(self, finger_id):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            data = self.client.post('/api/verify-fingerprint', json={'fingerprint_id': finger_id}).get_json()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return data, len(statements)
+
+    def test_verify_uses_warm_index_with_version_check_only(self):
+        fingerprint_index.warm()
+
+        data, queries = self.verify(3)
+        self.assertEqual(queries, 1)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['student']['student_id'], 'TEST001')
+        self.assertEqual([c['code'] for c in data['student']['enrolled_courses']], ['TEST101'])
+
+        data, queries = self.verify(99)
+        self.assertEqual(queries, 1)
+        self.assertFalse(data['success'])
+
+    def test_index_is_invalidated_by_committed_changes(self):
+        fingerprint_index.warm()
+
+        self.student.courses.append(self.other_course)
+        db.session.commit()
+        data, _ = self.verify(3)
+        self.assertEqual([c['code'] for c in data['student']['enrolled_courses']], ['TEST101', 'TEST201'])
+
+        Fingerprint.query.filter_by(finger_id=3).delete()
+        db.session.commit()
+        data, _ = self.verify(3)
+        self.assertFalse(data['success'])
+
+    def write_as_another_worker(self, table, **values):
+        """Write a roster row and its change log entry the way another worker process's commit would"""
+        # A separate connection, so this process's commit hooks never see it
+        with db.engine.begin() as connection:
+            version = connection.execute(db.select(func.max(ChangeLog.version))).scalar() + 1
+            connection.execute(table.insert().values(**values))
+            connection.execute(ChangeLog.__table__.insert().values(
+                entity='student', entity_key=str(self.student.id), version=version))
+
+    def test_fingerprint_enrolled_by_another_worker_is_found(self):
+        fingerprint_index.warm()
+
+        self.write_as_another_worker(Fingerprint.__table__, student_id=self.student.id, finger_id=8,
+                                     template_data=b'\x00' * 16)
+        self.assertIsNone(fingerprint_index.students_by_finger.get((None, 8)))
+
+        data, _ = self.verify(8)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['student']['student_id'], 'TEST001')
+
+        _, queries = self.verify(8)
+        self.assertEqual(queries, 1)
+
+    def test_hit_reflects_enrollment_changed_by_another_worker(self):
+        fingerprint_index.warm()
+
+        self.write_as_another_worker(Student.courses.property.secondary, student_id=self.student.id,
+                                     course_id=self.other_course.id)
+
+        data, _ = self.verify(3)
+        self.assertEqual([c['code'] for c in data['student']['enrolled_courses']], ['TEST101', 'TEST201'])
+
+    def test_rolled_back_changes_keep_index(self):
+        fingerprint_index.warm()
+
+        self.student.first_name = "Changed"
+        db.session.flush()
+        db.session.rollback()
+
+        _, queries = self.verify(3)
+        self.assertEqual(queries, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
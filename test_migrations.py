@@ -0,0 +1,91 @@
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from sqlalchemy import text
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Attendance
+from migrations import missing_columns, missing_indexes, upgrade_database
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Database shipped with the project, created before any column or index migration
+BASELINE_DATABASE = os.path.join(PROJECT_DIR, 'instance', 'attendance.db')
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_upgrade_adds_indexes_to_existing_table(self):
+        self.assertEqual(missing_indexes(db.engine), [])
+
+        # Simulate a database created before the indexes were added
+        for index in Attendance.__table__.indexes:
+            index.drop(db.engine)
+        self.assertEqual(len(missing_indexes(db.engine)), len(Attendance.__table__.indexes))
+
+        created = upgrade_database()
+        self.assertIn('ix_attendance_unsynced', created)
+        self.assertEqual(missing_indexes(db.engine), [])
+        self.assertEqual(upgrade_database(), [])
+
+    def test_upgrade_adds_columns_to_existing_table(self):
+        # Simulate a database created before the dedupe column was added
+        dedupe_index = next(index for index in Attendance.__table__.indexes if index.name == 'uq_attendance_dedupe')
+        dedupe_index.drop(db.engine)
+        with db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE attendance DROP COLUMN dedupe_slot'))
+        self.assertEqual([column.name for column in missing_columns(db.engine)], ['dedupe_slot'])
+
+        created = upgrade_database()
+        self.assertEqual(created, ['attendance.dedupe_slot', 'uq_attendance_dedupe'])
+        self.assertEqual(missing_columns(db.engine), [])
+
+    def test_app_starts_against_baseline_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'attendance.db')
+            shutil.copy(BASELINE_DATABASE, path)
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", TEMPLATE_INDEX_PATH='')
+
+            # The app is created at import, so boot it in a fresh interpreter
+            for command in (['-c', 'import app'], ['-m', 'flask', '--app', 'app.py', 'upgrade-db']):
+                result = subprocess.run([sys.executable] + command, env=env, capture_output=True, text=True,
+                                        cwd=PROJECT_DIR, timeout=120)
+                self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+            connection = sqlite3.connect(path)
+            try:
+                columns = {row[1] for row in connection.execute('PRAGMA table_info(fingerprint)')}
+                indexes = {row[1] for row in connection.execute('PRAGMA index_list(attendance)')}
+            finally:
+                connection.close()
+            self.assertIn('updated_at', columns)
+            self.assertIn('uq_attendance_dedupe', indexes)
+
+    def test_unsynced_query_uses_partial_index(self):
+        statement = Attendance.query.filter(Attendance.synced == db.false()).statement
+        compiled = statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+        with db.engine.connect() as connection:
+            plan = ' '.join(row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {compiled}')))
+        self.assertIn('ix_attendance_unsynced', plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
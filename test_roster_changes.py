@@ -0,0 +1,140 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from sqlalchemy import create_engine, insert
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Course, Fingerprint, ChangeLog, SyncCursor
+from fingerprint_index import fingerprint_index
+from template_matcher import template_matcher
+import roster_changes
+
+
+class TestRosterChanges(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.add_roster()
+
+    def add_roster(self):
+        self.courses = [Course(course_code=f"TEST{i}", title=f"Test Course {i}") for i in range(3)]
+        self.students = [Student(student_id=f"TEST{i:03d}", first_name="Test", last_name=f"Student {i}")
+                         for i in range(3)]
+        self.students[0].courses.extend(self.courses[:2])
+        db.session.add_all(self.courses + self.students)
+        db.session.commit()
+        db.session.add(Fingerprint(student_id=self.students[0].id, finger_id=1, template_data=b'\x00' * 16))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        fingerprint_index.invalidate()
+        template_matcher.reset()
+        self.app_context.pop()
+
+    def get_changes(self, since, **params):
+        response = self.client.get('/api/changes', query_string=dict(params, since=since))
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_since_zero_returns_whole_roster(self):
+        # Forget the log, as on a database that predates it; the first request seeds it
+        ChangeLog.query.delete()
+        db.session.commit()
+
+        data = self.get_changes(0)
+        self.assertEqual(len(data['students']['changed']), 3)
+        self.assertEqual(len(data['courses']['changed']), 3)
+        self.assertEqual(data['fingerprints']['changed'][0]['finger_id'], 1)
+        self.assertEqual(len(data['enrollments']['added']), 2)
+        self.assertIsNotNone(db.session.get(SyncCursor, roster_changes.SEED_CURSOR))
+
+        self.assertEqual(self.get_changes(data['version'])['version'], data['version'])
+
+    def test_feed_returns_only_changes_after_version(self):
+        version = self.get_changes(0)['version']
+
+        student, other = self.students[0], self.students[1]
+        student.first_name = 'Renamed'
+        self.courses[2].students.append(other)
+        self.courses[0].students.remove(student)
+        db.session.commit()
+        Fingerprint.query.filter_by(student_id=student.id).delete()
+        db.session.commit()
+
+        data = self.get_changes(version)
+        self.assertEqual([s['name'] for s in data['students']['changed']], ['Renamed Student 0'])
+        self.assertEqual(data['courses']['changed'], [])
+        self.assertEqual(data['enrollments']['added'], [{'student_id': other.id, 'course_id': self.courses[2].id}])
+        self.assertEqual(data['enrollments']['removed'], [{'student_id': student.id, 'course_id': self.courses[0].id}])
+        self.assertEqual(len(data['fingerprints']['deleted']), 1)
+        self.assertGreater(data['version'], version)
+
+        # Nothing new since the returned version
+        data = self.get_changes(data['version'])
+        self.assertEqual(data['students'], {'changed': [], 'deleted': []})
+
+    def test_paging_and_compaction(self):
+        version = self.get_changes(0)['version']
+        for i in range(5):
+            self.students[2].last_name = f"Edit {i}"
+            db.session.commit()
+        db.session.delete(self.students[1])
+        db.session.commit()
+
+        first = self.get_changes(version, limit=3)
+        self.assertTrue(first['has_more'])
+        rest = self.get_changes(first['version'])
+        self.assertFalse(rest['has_more'])
+        self.assertEqual(rest['students']['changed'][0]['name'], 'Test Edit 4')
+        self.assertEqual(rest['students']['deleted'], [self.students[1].id])
+
+        # Compaction keeps one entry per row without changing what clients see
+        roster_changes.compact_change_log()
+        self.assertEqual(ChangeLog.query.filter_by(entity='student').count(), 3)
+        compacted = self.get_changes(version)
+        self.assertEqual(compacted['students'], rest['students'])
+        self.assertEqual(compacted['version'], rest['version'])
+
+    def test_transaction_open_across_feed_read_is_not_skipped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # A file database, so the open transaction is isolated from the feed read
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'roster.db')}")
+            with patch.dict(db._app_engines[app], {None: engine}):
+                db.session.remove()
+                db.create_all()
+                self.add_roster()
+                version = self.get_changes(0)['version']
+
+                self.students[2].last_name = 'Committed'
+                db.session.commit()
+                # Logs a change below the committed one's ID, as a concurrent PostgreSQL writer that
+                # took its ID first may, and holds the transaction open across the next feed read
+                writer = db.session.session_factory()
+                writer.execute(insert(ChangeLog).values(id=0, entity='student', entity_key=str(self.students[1].id)))
+                writer.info['change_log_pending'] = True
+                db.session.remove()
+
+                first = self.get_changes(version)
+                self.assertEqual([s['name'] for s in first['students']['changed']], ['Test Committed'])
+
+                writer.commit()
+                writer.close()
+                second = self.get_changes(first['version'])
+                self.assertEqual([s['name'] for s in second['students']['changed']], ['Test Student 1'])
+                self.assertGreater(second['version'], first['version'])
+                db.session.remove()
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import unittest
+from datetime import datetime
+from sqlalchemy import event
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Course, Attendance, Fingerprint
+from fingerprint_index import fingerprint_index
+from attendance_dedupe import attendance_dedupe
+from wire_format import BINARY_MIMETYPE, encode_scan_request, decode_scan_response, decode_error
+
+
+class TestScanAPI(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.student = Student(student_id="TEST001", first_name="Test", last_name="Student")
+        self.course = Course(course_code="TEST101", title="Test Course")
+        self.other_course = Course(course_code="TEST201", title="Other Course")
+        self.student.courses.append(self.course)
+        db.session.add_all([self.student, self.course, self.other_course])
+        db.session.commit()
+        db.session.add(Fingerprint(student_id=self.student.id, finger_id=3, template_data=b'\x00' * 16))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        attendance_dedupe.clear()
+        fingerprint_index.invalidate()
+        self.app_context.pop()
+
+    def test_scan_records_attendance_in_one_request(self):
+        fingerprint_index.warm()
+        course_id = self.course.id
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.post('/api/scan', json={
+                'fingerprint_id': 3, 'course_id': course_id, 'timestamp': 1700000000, 'status': 'late'
+            })
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['student']['name'], 'Test Student')
+        # The index's change log version check, one read for course and enrollment and
+        # the dedupe check of recent scans; the rest are the attendance writes
+        reads = [statement for statement in statements if statement.startswith('SELECT')]
+        self.assertEqual(len(reads), 3)
+        self.assertIn('change_log', reads[0])
+        self.assertIn('student_course', reads[1])
+        self.assertIn('dedupe_slot', reads[2])
+
+        attendance = db.session.get(Attendance, data['attendance_id'])
+        self.assertEqual(attendance.student_id, self.student.id)
+        self.assertEqual(attendance.timestamp, datetime.utcfromtimestamp(1700000000))
+        self.assertEqual(attendance.status, 'late')
+
+    def test_scan_rejections_write_nothing(self):
+        response = self.client.post('/api/scan', json={'fingerprint_id': 99, 'course_id': self.course.id})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.post('/api/scan', json={'fingerprint_id': 3, 'course_id': self.other_course.id})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.get_json()['student_name'], 'Test Student')
+
+        response = self.client.post('/api/scan', json={'fingerprint_id': 3, 'course_id': 999})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.post('/api/scan', json={'fingerprint_id': 3})
+        self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(Attendance.query.count(), 0)
+
+    def test_binary_scan(self):
+        headers = {'Content-Type': BINARY_MIMETYPE, 'Accept': BINARY_MIMETYPE}
+        response = self.client.post('/api/scan', data=encode_scan_request(3, self.course.id), headers=headers)
+
+        self.assertEqual(response.mimetype, BINARY_MIMETYPE)
+        data = decode_scan_response(response.data)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['student'], {'id': self.student.id, 'student_id': 'TEST001', 'name': 'Test Student'})
+        self.assertFalse(data['duplicate'])
+        self.assertEqual(Attendance.query.count(), 1)
+
+        response = self.client.post('/api/scan', data=encode_scan_request(3, self.course.id), headers=headers)
+        self.assertTrue(decode_scan_response(response.data)['duplicate'])
+        self.assertEqual(Attendance.query.count(), 1)
+
+        response = self.client.post('/api/scan', data=encode_scan_request(3, self.other_course.id), headers=headers)
+        self.assertEqual(decode_error(response.data)['status'], 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Course, Fingerprint, Attendance, ScanJob
+from fingerprint_index import fingerprint_index
+from attendance_dedupe import attendance_dedupe
+from fingerprint_sensor_module import FingerPrintSensor
+from scan_jobs import scan_jobs, SCAN_JOB_RETENTION, SCAN_JOB_TIMEOUT
+
+
+class TestScanJobs(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['LOGIN_DISABLED'] = True
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.student = Student(student_id="TEST001", first_name="Test", last_name="Student")
+        self.course = Course(course_code="TEST101", title="Test Course")
+        self.student.courses.append(self.course)
+        db.session.add_all([self.student, self.course])
+        db.session.commit()
+        db.session.add(Fingerprint(student_id=self.student.id, finger_id=3, template_data=b'\x00' * 16))
+        db.session.commit()
+
+        # The sensor "waits for a finger" until the test releases it
+        self.finger_placed = threading.Event()
+
+        def verify_finger(sensor):
+            self.finger_placed.wait(5)
+            return {'success': True, 'finger_id': 3}
+
+        self.patches = [
+            patch.object(FingerPrintSensor, 'connect', return_value=True),
+            patch.object(FingerPrintSensor, 'verify_finger', autospec=True, side_effect=verify_finger),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        self.finger_placed.set()
+        for patcher in self.patches:
+            patcher.stop()
+        app.config['LOGIN_DISABLED'] = False
+        db.session.remove()
+        db.drop_all()
+        attendance_dedupe.clear()
+        fingerprint_index.invalidate()
+        self.app_context.pop()
+
+    def test_scan_returns_job_without_waiting_for_sensor(self):
+        start = time.monotonic()
+        response = self.client.post('/scan/verify', data={'course_id': self.course.id})
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(response.status_code, 202)
+        status_url = response.get_json()['status_url']
+
+        self.assertEqual(self.client.get(status_url).get_json()['state'], 'pending')
+
+        self.finger_placed.set()
+        data = self.client.get(status_url, query_string={'wait': 5}).get_json()
+        self.assertEqual(data['state'], 'done')
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['message'], 'Attendance recorded for Test Student')
+        self.assertEqual(Attendance.query.count(), 1)
+
+        # A second tap within the dedupe window is reported, not recorded again
+        status_url = self.client.post('/scan/verify', data={'course_id': self.course.id}).get_json()['status_url']
+        data = self.client.get(status_url, query_string={'wait': 2}).get_json()
+        self.assertEqual((data['status'], data['duplicate']), ('success', True))
+        self.assertEqual(data['message'], 'Already recorded for Test Student')
+        self.assertEqual(Attendance.query.count(), 1)
+
+    def test_old_jobs_are_pruned_off_the_request_path(self):
+        scan_jobs.pruned_at = None
+        old = datetime.utcnow() - SCAN_JOB_RETENTION - timedelta(minutes=1)
+        db.session.add(ScanJob(id='old', course_id=self.course.id, status='done', created_at=old))
+        db.session.commit()
+
+        status_url = self.client.post('/scan/verify', data={'course_id': self.course.id}).get_json()['status_url']
+        self.assertIsNotNone(db.session.get(ScanJob, 'old'))
+
+        self.finger_placed.set()
+        self.assertEqual(self.client.get(status_url, query_string={'wait': 2}).get_json()['state'], 'done')
+        db.session.expire_all()
+        self.assertIsNone(db.session.get(ScanJob, 'old'))
+
+        # Later scans within the prune interval leave old jobs alone
+        db.session.add(ScanJob(id='old', course_id=self.course.id, status='done', created_at=old))
+        db.session.commit()
+        status_url = self.client.post('/scan/verify', data={'course_id': self.course.id}).get_json()['status_url']
+        self.client.get(status_url, query_string={'wait': 2})
+        db.session.expire_all()
+        self.assertIsNotNone(db.session.get(ScanJob, 'old'))
+
+    def test_abandoned_pending_job_is_failed(self):
+        # Left pending by a process that died mid-scan
+        old = datetime.utcnow() - SCAN_JOB_TIMEOUT - timedelta(seconds=1)
+        db.session.add(ScanJob(id='lost', course_id=self.course.id, status='pending', created_at=old))
+        db.session.add(ScanJob(id='recent', course_id=self.course.id, status='pending'))
+        db.session.commit()
+
+        data = self.client.get('/scan/jobs/lost').get_json()
+        self.assertEqual((data['state'], data['status']), ('done', 'error'))
+        self.assertEqual(self.client.get('/scan/jobs/recent').get_json()['state'], 'pending')
+
+    def test_unknown_job_and_invalid_course(self):
+        self.assertEqual(self.client.get('/scan/jobs/missing').status_code, 404)
+        data = self.client.post('/scan/verify', data={'course_id': 'abc'}).get_json()
+        self.assertEqual(data['status'], 'error')
+
+
+if __name__ == '__main__':
+    unittest.main()
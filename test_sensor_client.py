@@ -0,0 +1,137 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fingerprint_sensor_module import FingerPrintSensor
+
+
+class FakeSensorHandler(BaseHTTPRequestHandler):
+    """Minimal keep-alive ESP32 stand-in that records client ports"""
+    protocol_version = 'HTTP/1.1'
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.client_ports.add(self.client_address[1])
+        if self.server.down:
+            return self.send_json(503, {'error': 'down'})
+        if self.path == '/template-count':
+            self.server.failures_left -= 1
+            if self.server.failures_left >= 0:
+                return self.send_json(503, {'error': 'busy'})
+            return self.send_json(200, {'count': 7})
+        self.send_json(200, {'status': 'ok'})
+
+    def do_POST(self):
+        self.server.client_ports.add(self.client_address[1])
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.server.down:
+            return self.send_json(503, {'error': 'down'})
+        if self.server.no_finger:
+            # The ESP32 waits for a finger that never comes
+            time.sleep(0.3)
+        self.send_json(200, {'success': True, 'finger_id': 3})
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSensorClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSensorHandler)
+        self.server.client_ports = set()
+        self.server.failures_left = 0
+        self.server.down = False
+        self.server.no_finger = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.sensor = FingerPrintSensor('127.0.0.1', self.server.server_address[1], backoff_factor=0)
+
+    def tearDown(self):
+        self.sensor.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_calls_reuse_one_connection(self):
+        self.assertTrue(self.sensor.connect())
+        for _ in range(20):
+            self.assertEqual(self.sensor.verify_finger()['finger_id'], 3)
+        self.assertEqual(len(self.server.client_ports), 1)
+
+        stats = self.sensor.get_latency_stats()
+        self.assertEqual(stats['verify']['count'], 20)
+        self.assertEqual(stats['status']['count'], 1)
+        self.assertLessEqual(stats['verify']['p50_ms'], stats['verify']['max_ms'])
+
+    def test_get_requests_are_retried(self):
+        self.server.failures_left = 2
+        self.assertEqual(self.sensor.get_template_count(), 7)
+
+        self.sensor.close()
+        self.server.failures_left = 5
+        self.assertEqual(FingerPrintSensor('127.0.0.1', self.server.server_address[1], retries=1,
+                                           backoff_factor=0).get_template_count(), -1)
+
+    def test_unreachable_sensor_fails_within_timeout(self):
+        sensor = FingerPrintSensor('127.0.0.1', 9, retries=0)
+        self.assertFalse(sensor.connect())
+        self.assertEqual(sensor.get_latency_stats()['status']['errors'], 1)
+
+    def test_connect_uses_recent_calls_as_heartbeat(self):
+        self.assertEqual(self.sensor.verify_finger()['finger_id'], 3)
+        self.assertTrue(self.sensor.connect())
+        self.assertNotIn('status', self.sensor.get_latency_stats())
+        self.assertTrue(self.sensor.connect(max_age=0))
+        self.assertEqual(self.sensor.get_latency_stats()['status']['count'], 1)
+
+    def test_circuit_opens_fails_fast_and_recovers(self):
+        sensor = FingerPrintSensor('127.0.0.1', self.server.server_address[1], retries=0,
+                                   failure_threshold=2, probe_interval=0.05)
+        self.server.down = True
+        sensor.verify_finger()
+        sensor.verify_finger()
+        self.assertFalse(sensor.is_available())
+        self.assertEqual(sensor.get_health()['state'], 'open')
+
+        # Calls are refused without reaching the sensor
+        result = sensor.verify_finger()
+        self.assertFalse(result['success'])
+        self.assertFalse(sensor.connect())
+        self.assertEqual(sensor.get_latency_stats()['verify']['count'], 2)
+
+        # The background probe closes the circuit once the sensor answers again
+        self.server.down = False
+        deadline = time.monotonic() + 5
+        while not sensor.is_available() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(sensor.is_available())
+        self.assertEqual(sensor.verify_finger()['finger_id'], 3)
+        sensor.close()
+
+    def test_waiting_for_a_finger_does_not_open_circuit(self):
+        sensor = FingerPrintSensor('127.0.0.1', self.server.server_address[1], retries=0,
+                                   timeouts={'verify': 0.1}, failure_threshold=2)
+        self.server.no_finger = True
+        for _ in range(3):
+            self.assertFalse(sensor.verify_finger()['success'])
+        self.assertTrue(sensor.is_available())
+        self.assertEqual(sensor.get_latency_stats()['verify']['errors'], 3)
+
+        # The sensor failing still counts
+        self.server.no_finger = False
+        self.server.down = True
+        sensor.verify_finger()
+        sensor.verify_finger()
+        self.assertFalse(sensor.is_available())
+        sensor.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
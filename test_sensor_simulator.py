@@ -0,0 +1,50 @@
+import unittest
+
+from fingerprint_sensor_module import FingerPrintSensor
+from sensor_simulator import SensorSimulator
+
+
+class TestSensorSimulator(unittest.TestCase):
+    def start(self, **kwargs):
+        simulator = SensorSimulator(seed=1, **kwargs).start()
+        self.addCleanup(simulator.stop)
+        sensor = FingerPrintSensor(*simulator.address, retries=0)
+        self.addCleanup(sensor.close)
+        return simulator, sensor
+
+    def test_sensor_client_against_simulator(self):
+        simulator, sensor = self.start(fingers=[5, 6, 7])
+        self.assertTrue(sensor.connect())
+        self.assertEqual(sensor.get_template_count(), 3)
+        for _ in range(10):
+            result = sensor.verify_finger()
+            self.assertTrue(result['success'])
+            self.assertIn(result['finger_id'], (5, 6, 7))
+
+        self.assertEqual(sensor.get_next_fingerprint_id(), {'success': True, 'nextId': 1})
+        self.assertTrue(sensor.start_enrollment())
+        statuses = [sensor.get_enrollment_status() for _ in range(6)]
+        self.assertEqual([status['progress'] for status in statuses], [0, 25, 50, 60, 75, 100])
+        self.assertEqual(statuses[-1]['status'], 'complete')
+        self.assertIn('template_data', statuses[-1])
+        self.assertEqual(simulator.requests['/verify'], 10)
+
+    def test_failures_open_the_sensor_circuit(self):
+        simulator, sensor = self.start(error_rate=1.0)
+        for _ in range(3):
+            self.assertFalse(sensor.verify_finger()['success'])
+        self.assertFalse(sensor.is_available())
+        self.assertFalse(sensor.connect())
+        self.assertEqual(simulator.requests['/verify'], 3)
+        self.assertNotIn('/status', simulator.requests)
+
+    def test_dropped_connections_and_no_match(self):
+        simulator, sensor = self.start(drop_rate=1.0)
+        self.assertFalse(sensor.connect(max_age=0))
+
+        simulator, sensor = self.start(no_match_rate=1.0)
+        self.assertEqual(sensor.verify_finger()['message'], 'No match found')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import base64
+import os
+import random
+import tempfile
+import unittest
+from unittest.mock import patch
+from sqlalchemy import event
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Course, Fingerprint
+from fingerprint_index import fingerprint_index
+from template_matcher import template_matcher, TemplateMatcher, TEMPLATE_SIZE, SAVE_INTERVAL
+
+
+def add_noise(template, flips, rng):
+    """Flip `flips` random bits of a template"""
+    data = bytearray(template)
+    for bit in rng.sample(range(len(data) * 8), flips):
+        data[bit // 8] ^= 1 << (bit % 8)
+    return bytes(data)
+
+
+class TestTemplateMatcher(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.rng = random.Random(42)
+        self.course = Course(course_code="TEST101", title="Test Course")
+        db.session.add(self.course)
+        self.templates = []
+        for i in range(200):
+            student = Student(student_id=f"S{i:05d}", first_name="Student", last_name=str(i))
+            student.courses.append(self.course)
+            template = self.rng.randbytes(TEMPLATE_SIZE)
+            self.templates.append(template)
+            db.session.add(student)
+            db.session.add(Fingerprint(student=student, finger_id=i, template_data=template))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        fingerprint_index.invalidate()
+        template_matcher.reset()
+        self.app_context.pop()
+
+    def test_vectorized_scores_match_bitwise_reference(self):
+        template_matcher.warm()
+        probe = self.rng.randbytes(TEMPLATE_SIZE)
+
+        scores = template_matcher.score(probe)
+        for row in (0, 57, 199):
+            stored = self.templates[row]
+            same_bits = sum(8 - bin(a ^ b).count('1') for a, b in zip(probe, stored))
+            self.assertAlmostEqual(scores[row], same_bits / (TEMPLATE_SIZE * 8))
+
+    def test_match_finds_noisy_probe_and_rejects_unknown(self):
+        probe = add_noise(self.templates[123], 200, self.rng)
+
+        match = template_matcher.match(probe)
+        self.assertEqual(match['finger_id'], 123)
+        self.assertGreater(match['score'], 0.9)
+
+        self.assertIsNone(template_matcher.match(self.rng.randbytes(TEMPLATE_SIZE)))
+        with self.assertRaises(ValueError):
+            template_matcher.match(b'\x00' * 10)
+
+    def test_verify_endpoint_accepts_raw_template(self):
+        probe = add_noise(self.templates[7], 100, self.rng)
+
+        response = self.client.post('/api/verify-fingerprint', json={
+            'template': base64.b64encode(probe).decode('ascii')
+        })
+        data = response.get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['student']['student_id'], 'S00007')
+        self.assertEqual(data['student']['enrolled_courses'][0]['code'], 'TEST101')
+
+        response = self.client.post('/api/verify-fingerprint', json={'template': 'not base64!'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_enrollment_is_matched_after_commit(self):
+        template_matcher.warm()
+        student = Student(student_id="NEW001", first_name="New", last_name="Student")
+        template = self.rng.randbytes(TEMPLATE_SIZE)
+        db.session.add(student)
+        db.session.add(Fingerprint(student=student, finger_id=500, template_data=template))
+        db.session.commit()
+
+        self.assertEqual(template_matcher.match(template)['finger_id'], 500)
+
+    def test_lsh_candidates_find_noisy_probes(self):
+        template_matcher.warm()
+        for row in range(0, 200, 20):
+            probe = add_noise(self.templates[row], 200, self.rng)
+            self.assertEqual(template_matcher.match(probe, exhaustive=False)['finger_id'], row)
+            self.assertLess(len(template_matcher.candidates(probe)), 50)
+
+    def test_deleted_fingerprint_is_no_longer_matched(self):
+        template_matcher.warm()
+        db.session.delete(Fingerprint.query.filter_by(finger_id=11).one())
+        db.session.commit()
+
+        self.assertIsNone(template_matcher.match(self.templates[11]))
+        self.assertIsNone(template_matcher.match(self.templates[11], exhaustive=False))
+        self.assertEqual(template_matcher.count, 199)
+
+    def test_persisted_index_loads_without_reading_templates(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.npz')
+            first = TemplateMatcher(index_path=path)
+            first.warm()
+            self.assertTrue(os.path.exists(path))
+
+            second = TemplateMatcher(index_path=path)
+            self.assertTrue(second.load())
+            self.assertEqual(second.count, 200)
+            self.assertFalse(second.sync())
+
+            probe = add_noise(self.templates[42], 150, self.rng)
+            self.assertEqual(second.search(probe, exhaustive=False)['finger_id'], 42)
+
+    def test_persisted_index_is_validated_against_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.npz')
+            TemplateMatcher(index_path=path).warm()
+
+            # Re-enrolled in place while the index was on disk: same ID, new template and finger
+            template = self.rng.randbytes(TEMPLATE_SIZE)
+            fingerprint_id = Fingerprint.query.filter_by(finger_id=9).one().id
+            with db.engine.begin() as connection:
+                connection.execute(Fingerprint.__table__.update()
+                                   .where(Fingerprint.__table__.c.id == fingerprint_id)
+                                   .values(template_data=template, finger_id=909))
+
+            matcher = TemplateMatcher(index_path=path)
+            self.assertTrue(matcher.load())
+            self.assertTrue(matcher.sync())
+            self.assertEqual(matcher.count, 200)
+            self.assertEqual(matcher.search(template)['finger_id'], 909)
+            self.assertIsNone(matcher.search(self.templates[9]))
+            self.assertFalse(matcher.sync())
+
+    def test_committed_changes_save_index_at_most_once_per_interval(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            matcher = TemplateMatcher(index_path=os.path.join(tmp, 'index.npz'))
+            matcher.warm()
+            saved_at = matcher.saved_at
+
+            with patch.object(matcher, 'save', wraps=matcher.save) as save:
+                for finger_id in range(1000, 1005):
+                    matcher.apply_changes([(finger_id, 1, finger_id, self.rng.randbytes(TEMPLATE_SIZE), 0)], [])
+                self.assertEqual(save.call_count, 0)
+                self.assertTrue(matcher.unsaved)
+
+                with patch('template_matcher.time.monotonic', return_value=saved_at + SAVE_INTERVAL + 1):
+                    matcher.warm()
+                self.assertEqual(save.call_count, 1)
+                self.assertFalse(matcher.unsaved)
+
+    def test_template_blob_is_deferred(self):
+        template_matcher.warm()
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            fingerprint = Fingerprint.query.filter_by(finger_id=5).one()
+            fingerprint.finger_id = 905
+            db.session.commit()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        self.assertFalse(any('template_data' in statement for statement in statements))
+        self.assertEqual(template_matcher.match(self.templates[5])['finger_id'], 905)
+        self.assertEqual(fingerprint.template_data, self.templates[5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import os
+import unittest
+from datetime import datetime
+
+# Use an in-memory database for tests (load_dotenv does not override this)
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['TEMPLATE_INDEX_PATH'] = ''
+
+from app import app, db
+from models import Student, Course, Fingerprint, Attendance
+from fingerprint_index import fingerprint_index
+from course_catalog import course_catalog
+from attendance_dedupe import attendance_dedupe
+from wire_format import (
+    BINARY_MIMETYPE, encode_verify_request, decode_verify_request, decode_verify_response,
+    encode_attendance_request, decode_attendance_request, decode_attendance_response,
+    encode_scan_request, decode_scan_request,
+    encode_attendance_batch_request, decode_attendance_batch_request, decode_attendance_batch_response,
+    decode_course_list, decode_error, WireFormatError
+)
+
+BINARY_HEADERS = {'Content-Type': BINARY_MIMETYPE, 'Accept': BINARY_MIMETYPE}
+
+
+class TestWireFormat(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        course_catalog.invalidate()
+
+        self.student = Student(student_id="TEST001", first_name="Test", last_name="Student")
+        self.course = Course(course_code="TEST101", title="Test Course", description="Not sent in binary")
+        self.student.courses.append(self.course)
+        db.session.add_all([self.student, self.course])
+        db.session.commit()
+        db.session.add(Fingerprint(student_id=self.student.id, finger_id=3, template_data=b'\x00' * 16))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        attendance_dedupe.clear()
+        fingerprint_index.invalidate()
+        course_catalog.invalidate()
+        self.app_context.pop()
+
+    def test_request_messages_round_trip(self):
+        self.assertEqual(decode_verify_request(encode_verify_request(fingerprint_id=3)), {'fingerprint_id': 3})
+        self.assertEqual(decode_verify_request(encode_verify_request(template=b'\x01\x02')), {'template': b'\x01\x02'})
+        self.assertEqual(decode_attendance_request(encode_attendance_request(7, 2, 1700000000, 'late')),
+                         {'student_id': 7, 'course_id': 2, 'timestamp': 1700000000, 'status': 'late'})
+
+        # The sensor's device ID may trail a request
+        self.assertEqual(decode_verify_request(encode_verify_request(fingerprint_id=3, device_id=2)),
+                         {'fingerprint_id': 3, 'device_id': 2})
+        self.assertEqual(decode_verify_request(encode_verify_request(template=b'\x01\x02', device_id=2)),
+                         {'template': b'\x01\x02', 'device_id': 2})
+        self.assertEqual(decode_scan_request(encode_scan_request(3, 2, device_id=5))['device_id'], 5)
+        with self.assertRaises(WireFormatError):
+            decode_scan_request(encode_scan_request(3, 2, device_id=5)[:-1])
+
+        batch = [{'fingerprint_id': 3, 'course_id': 2, 'timestamp': 1700000000, 'status': 'late'},
+                 {'fingerprint_id': 4, 'course_id': 2, 'timestamp': None, 'status': 'present'}]
+        self.assertEqual(decode_attendance_batch_request(encode_attendance_batch_request(batch)), {'records': batch})
+        self.assertEqual(decode_attendance_batch_request(encode_attendance_batch_request(batch, device_id=5)),
+                         {'records': batch, 'device_id': 5})
+        with self.assertRaises(WireFormatError):
+            decode_attendance_batch_request(encode_attendance_batch_request(batch)[:-1])
+
+        with self.assertRaises(WireFormatError):
+            decode_attendance_request(encode_attendance_request(7, 2)[:-1])
+        with self.assertRaises(WireFormatError):
+            decode_verify_request(encode_verify_request(template=b'\x01\x02')[:-1])
+
+    def test_binary_verify_matches_json(self):
+        json_response = self.client.post('/api/verify-fingerprint', json={'fingerprint_id': 3})
+        json_data = json_response.get_json()
+        response = self.client.post('/api/verify-fingerprint', data=encode_verify_request(fingerprint_id=3),
+                                    headers=BINARY_HEADERS)
+
+        self.assertEqual(response.mimetype, BINARY_MIMETYPE)
+        self.assertIn('Accept', response.headers['Vary'])
+        self.assertLess(len(response.data), len(json_response.data))
+        data = decode_verify_response(response.data)
+        self.assertEqual(data['student'], json_data['student'])
+        self.assertIsNone(data['score'])
+
+        response = self.client.post('/api/verify-fingerprint', data=encode_verify_request(fingerprint_id=99),
+                                    headers=BINARY_HEADERS)
+        self.assertFalse(decode_verify_response(response.data)['success'])
+
+    def test_binary_attendance(self):
+        response = self.client.post('/api/attendance',
+                                    data=encode_attendance_request(self.student.id, self.course.id, 1700000000),
+                                    headers=BINARY_HEADERS)
+        self.assertEqual(response.status_code, 200)
+        data = decode_attendance_response(response.data)
+        self.assertTrue(data['success'])
+        self.assertFalse(data['duplicate'])
+        attendance = db.session.get(Attendance, data['attendance_id'])
+        self.assertEqual(attendance.timestamp, datetime.utcfromtimestamp(1700000000))
+
+        # A repeat of the scan is flagged, with the first record's ID
+        response = self.client.post('/api/attendance',
+                                    data=encode_attendance_request(self.student.id, self.course.id, 1700000000),
+                                    headers=BINARY_HEADERS)
+        repeat = decode_attendance_response(response.data)
+        self.assertTrue(repeat['duplicate'])
+        self.assertEqual(repeat['attendance_id'], data['attendance_id'])
+
+        # A truncated message is rejected with a binary error
+        response = self.client.post('/api/attendance', data=encode_attendance_request(self.student.id, 99)[:5],
+                                    headers=BINARY_HEADERS)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(decode_error(response.data)['status'], 400)
+
+        # Binary requests may still ask for a JSON response
+        response = self.client.post('/api/attendance', data=encode_attendance_request(self.student.id, 99),
+                                    headers={'Content-Type': BINARY_MIMETYPE})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json()['error'], 'Course not found')
+
+    def test_binary_attendance_batch(self):
+        records = [{'fingerprint_id': 3, 'course_id': self.course.id, 'timestamp': 1700000000},
+                   {'fingerprint_id': 3, 'course_id': self.course.id, 'timestamp': 1700000060},
+                   {'fingerprint_id': 99, 'course_id': self.course.id, 'timestamp': 1700000000}]
+        response = self.client.post('/api/attendance/batch', data=encode_attendance_batch_request(records),
+                                    headers=BINARY_HEADERS)
+        self.assertEqual(response.mimetype, BINARY_MIMETYPE)
+        data = decode_attendance_batch_response(response.data)
+        self.assertEqual((data['recorded'], data['duplicates'], data['failed']), (1, 1, 1))
+        self.assertEqual([(result['success'], result['duplicate']) for result in data['results']],
+                         [(True, False), (True, True), (False, False)])
+        self.assertEqual(data['results'][1]['attendance_id'], data['results'][0]['attendance_id'])
+        attendance = db.session.get(Attendance, data['results'][0]['attendance_id'])
+        self.assertEqual(attendance.timestamp, datetime.utcfromtimestamp(1700000000))
+
+        response = self.client.post('/api/attendance/batch', data=encode_attendance_batch_request([]),
+                                    headers=BINARY_HEADERS)
+        self.assertEqual(decode_error(response.data), {'status': 400, 'error': 'No records provided'})
+
+    def test_binary_course_list_has_its_own_etag(self):
+        json_response = self.client.get('/api/courses')
+        response = self.client.get('/api/courses', headers={'Accept': BINARY_MIMETYPE})
+
+        self.assertEqual(response.mimetype, BINARY_MIMETYPE)
+        self.assertNotEqual(response.headers['ETag'], json_response.headers['ETag'])
+        data = decode_course_list(response.data)
+        self.assertEqual(data['version'], json_response.get_json()['version'])
+        self.assertEqual(data['courses'], [{'id': self.course.id, 'code': 'TEST101', 'title': 'Test Course',
+                                            'student_count': 1}])
+
+        response = self.client.get('/api/courses', headers={'Accept': BINARY_MIMETYPE,
+                                                            'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        schema = self.client.get('/api/wire-schema').get_json()
+        self.assertEqual(schema['mimetype'], BINARY_MIMETYPE)
+
+
+if __name__ == '__main__':
+    unittest.main()
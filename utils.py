@@ -1,3 +1,4 @@
+import base64
 import json
 import logging
 from datetime import datetime
@@ -89,3 +90,55 @@ def generate_pagination_info(page, per_page, total_items):
         'has_next': page < total_pages,
         'has_prev': page > 1
     }
+
+def get_cursor_params(request, default_limit=100, max_limit=500):
+    """
+    Get keyset pagination parameters from request
+    
+    Args:
+        request: Flask request object
+        default_limit (int): Default number of items per page
+        max_limit (int): Maximum number of items per page
+        
+    Returns:
+        tuple: (cursor, limit) where cursor is the raw cursor string or None
+    """
+    cursor = request.args.get('cursor') or None
+    
+    try:
+        limit = int(request.args.get('limit', default_limit))
+    except (ValueError, TypeError):
+        limit = default_limit
+    
+    return cursor, max(1, min(max_limit, limit))
+
+def encode_cursor(timestamp, record_id):
+    """
+    Encode a (timestamp, id) position into an opaque pagination cursor
+    
+    Args:
+        timestamp (datetime): Timestamp of the last item on the page
+        record_id (int): Database ID of the last item on the page
+        
+    Returns:
+        str: URL-safe cursor string
+    """
+    raw = f"{timestamp.isoformat()}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    Decode a pagination cursor created by encode_cursor()
+    
+    Args:
+        cursor (str): Cursor string from the request
+        
+    Returns:
+        tuple: (timestamp, record_id), or None if the cursor is invalid
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        timestamp_str, record_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp_str), int(record_id)
+    except (ValueError, TypeError, UnicodeError):
+        return None
@@ -0,0 +1,443 @@
+"""
+Compact binary encoding for the device-facing API
+
+Devices opt in per request: a body sent with Content-Type BINARY_MIMETYPE
+is decoded with the layouts below, and a response is encoded when the
+Accept header prefers BINARY_MIMETYPE over JSON. Everything else keeps
+speaking JSON.
+
+Every message is little-endian (native on the ESP32) and starts with a
+2-byte header: format version, then message type. Strings are a u8 byte
+length followed by UTF-8 bytes (longer strings are truncated to 255
+bytes). Fields marked optional may be left off the end of a request.
+SCHEMA describes each layout and is served at /api/wire-schema,
+so firmware can be checked against the server it talks to.
+"""
+
+import math
+import struct
+
+BINARY_MIMETYPE = 'application/vnd.fingerprint-attendance.v1'
+
+WIRE_VERSION = 1
+
+# Message types (responses have the high bit set)
+VERIFY_REQUEST = 0x01
+ATTENDANCE_REQUEST = 0x02
+SCAN_REQUEST = 0x03
+ATTENDANCE_BATCH_REQUEST = 0x04
+VERIFY_RESPONSE = 0x81
+ATTENDANCE_RESPONSE = 0x82
+COURSE_LIST = 0x83
+SCAN_RESPONSE = 0x84
+ATTENDANCE_BATCH_RESPONSE = 0x85
+ERROR_RESPONSE = 0xFF
+
+# Attendance status codes
+STATUS_CODES = {'present': 0, 'late': 1, 'absent': 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+# Sent in place of a fingerprint ID when a verify request carries a template
+NO_FINGERPRINT = 0xFFFFFFFF
+
+HEADER = struct.Struct('<BB')
+VERIFY_REQUEST_FIELDS = struct.Struct('<IH')
+VERIFY_RESPONSE_FIELDS = struct.Struct('<?IIfB')
+COURSE_FIELDS = struct.Struct('<I')
+ATTENDANCE_REQUEST_FIELDS = struct.Struct('<IIqB')
+ATTENDANCE_RESPONSE_FIELDS = struct.Struct('<?I?')
+SCAN_REQUEST_FIELDS = struct.Struct('<IIqB')
+SCAN_RESPONSE_FIELDS = struct.Struct('<?II?')
+COURSE_LIST_FIELDS = struct.Struct('<8sH')
+COURSE_ENTRY_FIELDS = struct.Struct('<II')
+BATCH_REQUEST_FIELDS = struct.Struct('<H')
+BATCH_RECORD_FIELDS = struct.Struct('<IIqB')
+BATCH_RESPONSE_FIELDS = struct.Struct('<HHHH')
+BATCH_RESULT_FIELDS = struct.Struct('<??I')
+ERROR_FIELDS = struct.Struct('<H')
+DEVICE_FIELDS = struct.Struct('<I')
+
+SCHEMA = {
+    'mimetype': BINARY_MIMETYPE,
+    'version': WIRE_VERSION,
+    'byte_order': 'little-endian',
+    'header': [['version', 'u8'], ['type', 'u8']],
+    'string': 'u8 byte length + UTF-8 bytes (max 255)',
+    'messages': {
+        'verify_request': {
+            'type': VERIFY_REQUEST,
+            'endpoint': 'POST /api/verify-fingerprint',
+            'fields': [['fingerprint_id', 'u32 (0xFFFFFFFF when sending a template)'],
+                       ['template_length', 'u16'], ['template', 'bytes[template_length]'],
+                       ['device_id', 'u32, optional (sensor whose slot fingerprint_id is; '
+                                     'default: the device at the caller\'s address)']],
+        },
+        'verify_response': {
+            'type': VERIFY_RESPONSE,
+            'endpoint': 'POST /api/verify-fingerprint',
+            'fields': [['success', 'bool'], ['student_db_id', 'u32'], ['fingerprint_id', 'u32'],
+                       ['score', 'f32 (NaN when matched on the sensor)'], ['course_count', 'u8'],
+                       ['message', 'string'], ['student_id', 'string'], ['name', 'string'],
+                       ['courses', 'course_count x (id u32, code string, title string)']],
+        },
+        'attendance_request': {
+            'type': ATTENDANCE_REQUEST,
+            'endpoint': 'POST /api/attendance',
+            'fields': [['student_db_id', 'u32'], ['course_id', 'u32'],
+                       ['timestamp', 'i64 Unix seconds (0 = now)'],
+                       ['status', 'u8 (0 present, 1 late, 2 absent)']],
+        },
+        'attendance_response': {
+            'type': ATTENDANCE_RESPONSE,
+            'endpoint': 'POST /api/attendance',
+            'fields': [['success', 'bool'], ['attendance_id', 'u32'],
+                       ['duplicate', 'bool (repeat scan within the dedupe window, nothing written)'],
+                       ['message', 'string']],
+        },
+        'scan_request': {
+            'type': SCAN_REQUEST,
+            'endpoint': 'POST /api/scan',
+            'fields': [['fingerprint_id', 'u32'], ['course_id', 'u32'],
+                       ['timestamp', 'i64 Unix seconds (0 = now)'],
+                       ['status', 'u8 (0 present, 1 late, 2 absent)'],
+                       ['device_id', 'u32, optional (sensor whose slot fingerprint_id is; '
+                                     'default: the device at the caller\'s address)']],
+        },
+        'scan_response': {
+            'type': SCAN_RESPONSE,
+            'endpoint': 'POST /api/scan',
+            'fields': [['success', 'bool'], ['attendance_id', 'u32'], ['student_db_id', 'u32'],
+                       ['duplicate', 'bool (repeat scan within the dedupe window, nothing written)'],
+                       ['message', 'string'], ['student_id', 'string'], ['name', 'string']],
+        },
+        'attendance_batch_request': {
+            'type': ATTENDANCE_BATCH_REQUEST,
+            'endpoint': 'POST /api/attendance/batch',
+            'fields': [['count', 'u16'],
+                       ['records', 'count x (fingerprint_id u32, course_id u32, '
+                                   'timestamp i64 Unix seconds (0 = now), status u8)'],
+                       ['device_id', 'u32, optional (sensor whose slots the fingerprint_ids are; '
+                                     'default: the device at the caller\'s address)']],
+        },
+        'attendance_batch_response': {
+            'type': ATTENDANCE_BATCH_RESPONSE,
+            'endpoint': 'POST /api/attendance/batch',
+            'fields': [['count', 'u16'], ['recorded', 'u16'], ['duplicates', 'u16'], ['failed', 'u16'],
+                       ['results', 'count x (success bool, duplicate bool, attendance_id u32), '
+                                   'in request order']],
+        },
+        'course_list': {
+            'type': COURSE_LIST,
+            'endpoint': 'GET /api/courses',
+            'fields': [['catalog_version', 'bytes[8]'], ['count', 'u16'],
+                       ['courses', 'count x (id u32, student_count u32, code string, title string)']],
+        },
+        'error': {
+            'type': ERROR_RESPONSE,
+            'endpoint': 'any, with a 4xx/5xx status',
+            'fields': [['status', 'u16 HTTP status'], ['message', 'string']],
+        },
+    },
+}
+
+
+class WireFormatError(ValueError):
+    """Raised when a binary message does not match its layout"""
+
+
+def pack_string(value):
+    data = (value or '').encode('utf-8')[:255]
+    return bytes((len(data),)) + data
+
+
+def unpack_string(data, offset):
+    """Read a string at offset; returns (string, next offset)"""
+    if offset >= len(data):
+        raise WireFormatError('Truncated string')
+    end = offset + 1 + data[offset]
+    if end > len(data):
+        raise WireFormatError('Truncated string')
+    return data[offset + 1:end].decode('utf-8', errors='replace'), end
+
+
+def unpack_header(data, expected_type):
+    """Check the header of a message; returns the offset of its first field"""
+    if len(data) < HEADER.size:
+        raise WireFormatError('Truncated header')
+    version, message_type = HEADER.unpack_from(data)
+    if version != WIRE_VERSION:
+        raise WireFormatError(f'Unsupported wire format version {version}')
+    if message_type != expected_type:
+        raise WireFormatError(f'Unexpected message type {message_type:#04x}')
+    return HEADER.size
+
+
+def unpack_fields(layout, data, offset):
+    if offset + layout.size > len(data):
+        raise WireFormatError('Truncated message')
+    return layout.unpack_from(data, offset), offset + layout.size
+
+
+def pack_device(device_id):
+    return DEVICE_FIELDS.pack(device_id) if device_id is not None else b''
+
+
+def unpack_device(data, offset, message):
+    """Read the optional trailing device ID into a decoded message"""
+    if offset == len(data):
+        return message
+    (device_id,), offset = unpack_fields(DEVICE_FIELDS, data, offset)
+    if offset != len(data):
+        raise WireFormatError('Unexpected data after message')
+    return dict(message, device_id=device_id)
+
+
+def encode_verify_request(fingerprint_id=None, template=b'', device_id=None):
+    return (HEADER.pack(WIRE_VERSION, VERIFY_REQUEST) +
+            VERIFY_REQUEST_FIELDS.pack(NO_FINGERPRINT if fingerprint_id is None else fingerprint_id,
+                                       len(template)) +
+            template +
+            pack_device(device_id))
+
+
+def decode_verify_request(data):
+    """
+    Decode a verify request into the fields of its JSON counterpart
+
+    Returns:
+        dict: 'fingerprint_id' or 'template' (raw bytes), and 'device_id' if sent
+    """
+    offset = unpack_header(data, VERIFY_REQUEST)
+    (fingerprint_id, template_length), offset = unpack_fields(VERIFY_REQUEST_FIELDS, data, offset)
+    if len(data) - (offset + template_length) not in (0, DEVICE_FIELDS.size):
+        raise WireFormatError('Template length does not match message size')
+    if template_length:
+        return unpack_device(data, offset + template_length,
+                             {'template': bytes(data[offset:offset + template_length])})
+    if fingerprint_id == NO_FINGERPRINT:
+        raise WireFormatError('Missing fingerprint_id or template')
+    return unpack_device(data, offset, {'fingerprint_id': fingerprint_id})
+
+
+def encode_verify_response(data):
+    """Encode the JSON body of a verify response"""
+    student = data.get('student') or {}
+    courses = student.get('enrolled_courses', [])[:255]
+    score = data.get('score')
+    parts = [
+        HEADER.pack(WIRE_VERSION, VERIFY_RESPONSE),
+        VERIFY_RESPONSE_FIELDS.pack(bool(data.get('success')), student.get('id', 0),
+                                    student.get('fingerprint_id', 0),
+                                    math.nan if score is None else score, len(courses)),
+        pack_string(data.get('message')),
+        pack_string(student.get('student_id')),
+        pack_string(student.get('name')),
+    ]
+    for course in courses:
+        parts.append(COURSE_FIELDS.pack(course['id']))
+        parts.append(pack_string(course['code']))
+        parts.append(pack_string(course['title']))
+    return b''.join(parts)
+
+
+def decode_verify_response(data):
+    """Decode a verify response into the shape of its JSON counterpart"""
+    offset = unpack_header(data, VERIFY_RESPONSE)
+    (success, student_db_id, fingerprint_id, score, course_count), offset = unpack_fields(
+        VERIFY_RESPONSE_FIELDS, data, offset)
+    message, offset = unpack_string(data, offset)
+    student_id, offset = unpack_string(data, offset)
+    name, offset = unpack_string(data, offset)
+    courses = []
+    for _ in range(course_count):
+        (course_id,), offset = unpack_fields(COURSE_FIELDS, data, offset)
+        code, offset = unpack_string(data, offset)
+        title, offset = unpack_string(data, offset)
+        courses.append({'id': course_id, 'code': code, 'title': title})
+
+    result = {'success': success, 'message': message, 'score': None if math.isnan(score) else score}
+    if success:
+        result['student'] = {'id': student_db_id, 'student_id': student_id, 'name': name,
+                             'fingerprint_id': fingerprint_id, 'enrolled_courses': courses}
+    return result
+
+
+def encode_attendance_request(student_db_id, course_id, timestamp=None, status='present'):
+    return (HEADER.pack(WIRE_VERSION, ATTENDANCE_REQUEST) +
+            ATTENDANCE_REQUEST_FIELDS.pack(student_db_id, course_id, int(timestamp or 0),
+                                           STATUS_CODES.get(status, 0)))
+
+
+def decode_attendance_request(data):
+    """
+    Decode an attendance request into the fields of its JSON counterpart
+
+    Returns:
+        dict: 'student_id' (database ID), 'course_id', 'timestamp' (epoch seconds or None), 'status'
+    """
+    offset = unpack_header(data, ATTENDANCE_REQUEST)
+    (student_db_id, course_id, timestamp, status), offset = unpack_fields(ATTENDANCE_REQUEST_FIELDS, data, offset)
+    if status not in STATUS_NAMES:
+        raise WireFormatError(f'Unknown status code {status}')
+    return {'student_id': student_db_id, 'course_id': course_id,
+            'timestamp': timestamp or None, 'status': STATUS_NAMES[status]}
+
+
+def encode_attendance_response(data):
+    """Encode the JSON body of an attendance response"""
+    return (HEADER.pack(WIRE_VERSION, ATTENDANCE_RESPONSE) +
+            ATTENDANCE_RESPONSE_FIELDS.pack(bool(data.get('success')), data.get('attendance_id') or 0,
+                                            bool(data.get('duplicate'))) +
+            pack_string(data.get('message')))
+
+
+def decode_attendance_response(data):
+    offset = unpack_header(data, ATTENDANCE_RESPONSE)
+    (success, attendance_id, duplicate), offset = unpack_fields(ATTENDANCE_RESPONSE_FIELDS, data, offset)
+    message, offset = unpack_string(data, offset)
+    return {'success': success, 'attendance_id': attendance_id, 'duplicate': duplicate, 'message': message}
+
+
+def encode_scan_request(fingerprint_id, course_id, timestamp=None, status='present', device_id=None):
+    return (HEADER.pack(WIRE_VERSION, SCAN_REQUEST) +
+            SCAN_REQUEST_FIELDS.pack(fingerprint_id, course_id, int(timestamp or 0), STATUS_CODES.get(status, 0)) +
+            pack_device(device_id))
+
+
+def decode_scan_request(data):
+    """
+    Decode a scan request into the fields of its JSON counterpart
+
+    Returns:
+        dict: 'fingerprint_id', 'course_id', 'timestamp' (epoch seconds or None), 'status',
+              and 'device_id' if sent
+    """
+    offset = unpack_header(data, SCAN_REQUEST)
+    (fingerprint_id, course_id, timestamp, status), offset = unpack_fields(SCAN_REQUEST_FIELDS, data, offset)
+    if status not in STATUS_NAMES:
+        raise WireFormatError(f'Unknown status code {status}')
+    return unpack_device(data, offset, {'fingerprint_id': fingerprint_id, 'course_id': course_id,
+                                        'timestamp': timestamp or None, 'status': STATUS_NAMES[status]})
+
+
+def encode_scan_response(data):
+    """Encode the JSON body of a scan response"""
+    student = data.get('student') or {}
+    return (HEADER.pack(WIRE_VERSION, SCAN_RESPONSE) +
+            SCAN_RESPONSE_FIELDS.pack(bool(data.get('success')), data.get('attendance_id') or 0,
+                                      student.get('id', 0), bool(data.get('duplicate'))) +
+            pack_string(data.get('message')) +
+            pack_string(student.get('student_id')) +
+            pack_string(student.get('name')))
+
+
+def decode_scan_response(data):
+    offset = unpack_header(data, SCAN_RESPONSE)
+    (success, attendance_id, student_db_id, duplicate), offset = unpack_fields(SCAN_RESPONSE_FIELDS, data, offset)
+    message, offset = unpack_string(data, offset)
+    student_id, offset = unpack_string(data, offset)
+    name, offset = unpack_string(data, offset)
+    return {'success': success, 'attendance_id': attendance_id, 'duplicate': duplicate, 'message': message,
+            'student': {'id': student_db_id, 'student_id': student_id, 'name': name}}
+
+
+def encode_attendance_batch_request(records, device_id=None):
+    """
+    Encode a batch of buffered scans
+
+    Args:
+        records (list): Dictionaries with fingerprint_id, course_id and optional timestamp and status
+        device_id (int, optional): Sensor whose slots the fingerprint IDs are
+    """
+    parts = [HEADER.pack(WIRE_VERSION, ATTENDANCE_BATCH_REQUEST), BATCH_REQUEST_FIELDS.pack(len(records))]
+    for record in records:
+        parts.append(BATCH_RECORD_FIELDS.pack(record['fingerprint_id'], record['course_id'],
+                                              int(record.get('timestamp') or 0),
+                                              STATUS_CODES.get(record.get('status'), 0)))
+    parts.append(pack_device(device_id))
+    return b''.join(parts)
+
+
+def decode_attendance_batch_request(data):
+    """
+    Decode a batch request into the shape of its JSON counterpart
+
+    Returns:
+        dict: 'records' (fingerprint_id, course_id, timestamp (epoch seconds or None), status),
+              and 'device_id' if sent
+    """
+    offset = unpack_header(data, ATTENDANCE_BATCH_REQUEST)
+    (count,), offset = unpack_fields(BATCH_REQUEST_FIELDS, data, offset)
+    records = []
+    for _ in range(count):
+        (fingerprint_id, course_id, timestamp, status), offset = unpack_fields(BATCH_RECORD_FIELDS, data, offset)
+        if status not in STATUS_NAMES:
+            raise WireFormatError(f'Unknown status code {status}')
+        records.append({'fingerprint_id': fingerprint_id, 'course_id': course_id,
+                        'timestamp': timestamp or None, 'status': STATUS_NAMES[status]})
+    return unpack_device(data, offset, {'records': records})
+
+
+def encode_attendance_batch_response(data):
+    """Encode the JSON body of a batch response (per-record messages are left out)"""
+    results = data.get('results', [])
+    parts = [HEADER.pack(WIRE_VERSION, ATTENDANCE_BATCH_RESPONSE),
+             BATCH_RESPONSE_FIELDS.pack(len(results), data.get('recorded', 0), data.get('duplicates', 0),
+                                        data.get('failed', 0))]
+    for result in results:
+        parts.append(BATCH_RESULT_FIELDS.pack(bool(result.get('success')), bool(result.get('duplicate')),
+                                              result.get('attendance_id') or 0))
+    return b''.join(parts)
+
+
+def decode_attendance_batch_response(data):
+    offset = unpack_header(data, ATTENDANCE_BATCH_RESPONSE)
+    (count, recorded, duplicates, failed), offset = unpack_fields(BATCH_RESPONSE_FIELDS, data, offset)
+    results = []
+    for index in range(count):
+        (success, duplicate, attendance_id), offset = unpack_fields(BATCH_RESULT_FIELDS, data, offset)
+        results.append({'index': index, 'success': success, 'duplicate': duplicate,
+                        'attendance_id': attendance_id})
+    return {'success': True, 'count': count, 'recorded': recorded, 'duplicates': duplicates,
+            'failed': failed, 'results': results}
+
+
+def encode_course_list(version, courses):
+    """
+    Encode the course catalog
+
+    Args:
+        version (str): Catalog version (16 hex digits)
+        courses (list): Course dictionaries as served in JSON
+    """
+    parts = [HEADER.pack(WIRE_VERSION, COURSE_LIST),
+             COURSE_LIST_FIELDS.pack(bytes.fromhex(version), len(courses))]
+    for course in courses:
+        parts.append(COURSE_ENTRY_FIELDS.pack(course['id'], course['student_count']))
+        parts.append(pack_string(course['code']))
+        parts.append(pack_string(course['title']))
+    return b''.join(parts)
+
+
+def decode_course_list(data):
+    """Decode a course catalog into the shape of its JSON counterpart (without descriptions)"""
+    offset = unpack_header(data, COURSE_LIST)
+    (version, count), offset = unpack_fields(COURSE_LIST_FIELDS, data, offset)
+    courses = []
+    for _ in range(count):
+        (course_id, student_count), offset = unpack_fields(COURSE_ENTRY_FIELDS, data, offset)
+        code, offset = unpack_string(data, offset)
+        title, offset = unpack_string(data, offset)
+        courses.append({'id': course_id, 'code': code, 'title': title, 'student_count': student_count})
+    return {'success': True, 'version': version.hex(), 'count': count, 'courses': courses}
+
+
+def encode_error(status_code, message):
+    return HEADER.pack(WIRE_VERSION, ERROR_RESPONSE) + ERROR_FIELDS.pack(status_code) + pack_string(message)
+
+
+def decode_error(data):
+    offset = unpack_header(data, ERROR_RESPONSE)
+    (status_code,), offset = unpack_fields(ERROR_FIELDS, data, offset)
+    message, offset = unpack_string(data, offset)
+    return {'status': status_code, 'error': message}